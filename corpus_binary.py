@@ -0,0 +1,292 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+BiRCh Binary Corpus Module
+alexluu@brandeis.edu
+
+Input: FoLiA file (.folia.xml) / binary corpus file (.birch)
+Output: binary corpus file (.birch) / FoLiA file (.folia.xml)
+
+A .birch file holds the token table of one FoLiA file (see folia_tokens.py)
+as fixed-width little-endian columns, opened with mmap and read in place
+(memoryview casts, no parsing, no copies on the Python heap):
+
+    header      MAGIC, version, counts, then (offset, length) of every column
+    strings     one sorted string table (UTF-8 blob + offsets) for all texts,
+                lemmas, POS tags, descriptions, speakers, ids and comments,
+                so a string id is found by binary search
+    utterances  id, speaker, comments (string ids), begin, end (ms, -1 if none),
+                token offsets (tokens of utterance u: [offset[u], offset[u + 1]))
+    tokens      id, text, lemma, pos, description, comments (string ids),
+                features (records.feature_mask() of the description),
+                flags (FLAG_MANUAL)
+
+Comments of a word or an utterance are joined by '\\n' into one string;
+<feat> classes are not kept (elan2folia does not write them).
+
+Usage:
+python corpus_binary.py data/FoLiA/*.folia.xml   (writes the .birch files alongside)
+"""
+
+import mmap
+import os
+import struct
+import sys
+from array import array
+from folia_tokens import Utt, Word, iter_utterances, foliatime2millisec
+from records import feature_mask
+
+MAGIC = b'BIRCHBIN'
+VERSION = 1
+FLAG_MANUAL = 1
+
+# (name, array typecode), in file order
+COLUMNS = (
+    ('string_offsets', 'Q'), ('string_data', 'B'),
+    ('utt_id', 'i'), ('utt_speaker', 'i'), ('utt_comments', 'i'),
+    ('utt_begin', 'q'), ('utt_end', 'q'), ('utt_offsets', 'I'),
+    ('token_id', 'i'), ('token_text', 'i'), ('token_lemma', 'i'), ('token_pos', 'i'),
+    ('token_description', 'i'), ('token_comments', 'i'), ('token_features', 'q'), ('token_flags', 'B'),
+)
+# MAGIC, version, doc id (string id), number of strings, utterances and tokens
+HEADER = struct.Struct('<8sIiIII')
+SECTION = struct.Struct('<QQ')
+
+
+def millisec2foliatime(ms):
+    """ -> hh:mm:ss.mmm ('' for -1), as elan2folia.millisec2foliatime() """
+    if ms < 0:
+        return ''
+    ss, mmm = divmod(ms, 1000)
+    mm, ss = divmod(ss, 60)
+    hh, mm = divmod(mm, 60)
+    return '{:02d}:{:02d}:{:02d}.{:03d}'.format(hh, mm, ss, mmm)
+
+
+def write_binary(doc_id, utterances, f_o):
+    """
+    doc_id: FoLiA document id (str)
+    utterances: iterable of folia_tokens.Utt
+    f_o: output (binary corpus) file (full path, with extension) (str)
+    """
+    utterances = list(utterances)
+    strings = {doc_id}
+    for u in utterances:
+        strings.update((u.id, u.speaker, '\n'.join(u.comments)))
+        for w in u.words:
+            strings.update((w.id or '', w.text, w.lemma, w.pos, w.description, '\n'.join(w.comments)))
+    # sorted by UTF-8 bytes, the order binary search compares in
+    strings = sorted(strings, key=lambda s: s.encode('utf-8'))
+    sid = {s: i for i, s in enumerate(strings)}
+
+    columns = {name: array(code) for name, code in COLUMNS}
+    offset = 0
+    blob = bytearray()
+    for s in strings:
+        columns['string_offsets'].append(offset)
+        b = s.encode('utf-8')
+        blob += b
+        offset += len(b)
+    columns['string_offsets'].append(offset)
+    columns['string_data'] = array('B', blob)
+
+    columns['utt_offsets'].append(0)
+    for u in utterances:
+        columns['utt_id'].append(sid[u.id])
+        columns['utt_speaker'].append(sid[u.speaker])
+        columns['utt_comments'].append(sid['\n'.join(u.comments)])
+        begin, end = foliatime2millisec(u.begintime), foliatime2millisec(u.endtime)
+        columns['utt_begin'].append(-1 if begin is None else begin)
+        columns['utt_end'].append(-1 if end is None else end)
+        for w in u.words:
+            columns['token_id'].append(sid[w.id or ''])
+            columns['token_text'].append(sid[w.text])
+            columns['token_lemma'].append(sid[w.lemma])
+            columns['token_pos'].append(sid[w.pos])
+            columns['token_description'].append(sid[w.description])
+            columns['token_comments'].append(sid['\n'.join(w.comments)])
+            columns['token_features'].append(feature_mask(w.description))
+            columns['token_flags'].append(FLAG_MANUAL if w.manual else 0)
+        columns['utt_offsets'].append(len(columns['token_id']))
+
+    # columns are written in native order; swap them into little endian if needed
+    if sys.byteorder != 'little':
+        for c in columns.values():
+            c.byteswap()
+    # header, section table, then the columns, each aligned on 8 bytes
+    position = HEADER.size + SECTION.size * len(COLUMNS)
+    sections = []
+    for name, _ in COLUMNS:
+        position += -position % 8
+        n = len(columns[name]) * columns[name].itemsize
+        sections.append((position, n))
+        position += n
+    tmp = f_o + '.tmp'
+    with open(tmp, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, VERSION, sid[doc_id], len(strings), len(utterances),
+                            len(columns['token_id'])))
+        for section in sections:
+            f.write(SECTION.pack(*section))
+        for (name, _), (position, _) in zip(COLUMNS, sections):
+            f.write(b'\0' * (position - f.tell()))
+            columns[name].tofile(f)
+    os.replace(tmp, f_o)
+
+
+def folia2binary(f_i, f_o=None):
+    """
+    f_i: input (FoLiA) file (full path, with extension) (str)
+    f_o: output (binary corpus) file (default: f_i with extension .birch)
+    -> f_o
+    """
+    if not f_o:
+        f_o = f_i.replace('.folia.xml', '') + '.birch'
+    # document id as elan2folia writes it
+    write_binary(os.path.basename(f_i).partition('.')[0], iter_utterances(f_i), f_o)
+    return f_o
+
+
+class BinaryCorpus:
+    """
+    with BinaryCorpus('data/FoLiA/I_2016_07_18_0.birch') as c:
+        for p in c.find(lemma='мама'):
+            ...
+
+    The columns (e.g. c.token_lemma, c.utt_begin) are memoryviews over the mapped file.
+    """
+
+    def __init__(self, f_i):
+        self.path = f_i
+        with open(f_i, 'rb') as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, self._doc_id, self.n_strings, self.n_utterances, self.n_tokens = \
+            HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError('{} is not a version {} binary corpus file'.format(f_i, VERSION))
+        if sys.byteorder != 'little':
+            raise ValueError('Binary corpus files can only be mapped on little-endian machines')
+        view = memoryview(self._mm)
+        self._views = [view]
+        for i, (name, code) in enumerate(COLUMNS):
+            position, n = SECTION.unpack_from(self._mm, HEADER.size + i * SECTION.size)
+            column = view[position:position + n].cast(code)
+            self._views.append(column)
+            setattr(self, name, column)
+
+    def close(self):
+        for v in reversed(self._views):
+            v.release()
+        self._mm.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __len__(self):
+        return self.n_tokens
+
+    @property
+    def doc_id(self):
+        return self.string(self._doc_id)
+
+    def _bytes(self, i):
+        return self.string_data[self.string_offsets[i]:self.string_offsets[i + 1]]
+
+    def string(self, i):
+        """ -> string with id i """
+        return bytes(self._bytes(i)).decode('utf-8')
+
+    def string_id(self, s):
+        """ -> id of s in the string table, -1 if absent (binary search, nothing is decoded) """
+        b = s.encode('utf-8')
+        lo, hi = 0, self.n_strings
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._bytes(mid).tobytes() < b:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo if lo < self.n_strings and self._bytes(lo).tobytes() == b else -1
+
+    def utterance(self, u):
+        """ -> folia_tokens.Utt of the u-th utterance """
+        s = self.string
+        words = []
+        for p in range(self.utt_offsets[u], self.utt_offsets[u + 1]):
+            comments = s(self.token_comments[p])
+            words.append(Word(s(self.token_id[p]) or None, s(self.token_text[p]), s(self.token_lemma[p]),
+                              s(self.token_pos[p]), s(self.token_description[p]), (),
+                              tuple(comments.split('\n')) if comments else (),
+                              bool(self.token_flags[p] & FLAG_MANUAL)))
+        comments = s(self.utt_comments[u])
+        return Utt(s(self.utt_id[u]), s(self.utt_speaker[u]),
+                   millisec2foliatime(self.utt_begin[u]), millisec2foliatime(self.utt_end[u]),
+                   tuple(words), tuple(comments.split('\n')) if comments else ())
+
+    def __iter__(self):
+        return (self.utterance(u) for u in range(self.n_utterances))
+
+    def find(self, lemma=None, pos=None, text=None, features=()):
+        """
+        lemma, pos, text: exact values (str)
+        features: features that must all be present (list of str)
+        -> list of matching token positions
+        """
+        checks = []
+        for column, value in ((self.token_lemma, lemma), (self.token_pos, pos), (self.token_text, text)):
+            if value is not None:
+                i = self.string_id(value)
+                if i < 0:
+                    return []
+                checks.append((column, i))
+        mask = feature_mask(','.join(features)) if features else 0
+        hits = []
+        for p in range(self.n_tokens):
+            if all(column[p] == i for column, i in checks) and self.token_features[p] & mask == mask:
+                hits.append(p)
+        return hits
+
+    def token_utterance(self, p):
+        """ -> index of the utterance of token p """
+        from bisect import bisect_right
+
+        return bisect_right(self.utt_offsets, p) - 1
+
+
+def binary2folia(f_i, f_o=None):
+    """
+    f_i: input (binary corpus) file (full path, with extension) (str)
+    f_o: output (FoLiA) file (default: f_i with extension .folia.xml)
+    -> f_o
+
+    The document is written as elan2folia writes it (all annotations by the
+    Mystem+ processor, the speaker label as first word, utterance comments
+    as 'label: value' dependents).
+    """
+    from elan2folia import new_document, append_utterance
+    from folia_tokens import utterance_words, mystem_features
+    from records import Utterance, Token
+
+    if not f_o:
+        f_o = f_i.replace('.birch', '') + '.folia.xml'
+    with BinaryCorpus(f_i) as c:
+        doc_o, speech, processor = new_document(c.doc_id)
+        for u in c:
+            utt = Utterance(u.id, u.speaker, foliatime2millisec(u.begintime), foliatime2millisec(u.endtime),
+                            '', [Token(w.text, w.lemma, w.pos, mystem_features(w)) for w in utterance_words(u)],
+                            [tuple(comment.split(': ', 1)) for comment in u.comments if ': ' in comment])
+            append_utterance(speech, utt, processor)
+    doc_o.save(f_o)
+    return f_o
+
+
+def load_corpus(dir_i):
+    """ -> list of BinaryCorpus of all .birch files of dir_i """
+    return [BinaryCorpus(os.path.join(dir_i, f)) for f in sorted(os.listdir(dir_i)) if f.endswith('.birch')]
+
+
+if __name__ == "__main__":
+    for f in sys.argv[1:]:
+        print(folia2binary(f))
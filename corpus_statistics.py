@@ -0,0 +1,221 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+BiRCh Corpus Statistics Module
+alexluu@brandeis.edu
+
+Input: FoLiA files (.folia.xml), e.g. the output of elan2folia
+Output: developmental statistics per file and speaker, and over the corpus per
+        child, speaker and age: number of utterances, words and morphemes,
+        MLU in words and in morphemes, lemma types, type/token ratio,
+        POS and feature distributions
+
+Words are the tokens with a POS class (punctuation, tags and unanalyzed
+tokens are left out). Morphemes are approximated from the features: the stem,
+one (fused) ending if the word is inflected, and one suffix for each of the
+diminutive, comparative/superlative, participle and gerund features
+(every %mor feature of folia2chat would count case, number and gender apart).
+Child and age come from the metadata registry, or else from the file name
+(<child>_<age>_..., see metadata.py).
+
+Each file is read once into token columns and its measures are computed with
+NumPy group-bys over the speaker column; files are processed in parallel and
+their results are cached on disk by content hash.
+
+Usage:
+python corpus_statistics.py data/FoLiA/*.folia.xml > statistics.csv
+"""
+
+import hashlib
+import os
+import pickle
+import numpy as np
+from folia_tokens import iter_utterances, utterance_words
+from metadata import load_registry
+from records import FEATURES, FEATURE_BITS, feature_mask
+
+# bump when the measures change, so that cached results are recomputed
+STATS_VERSION = 1
+
+# features realized by the (fused) inflectional ending
+INFLECTION_MASK = feature_mask('им,род,род2,дат,вин,вин2,твор,пр,местн,зват,ед,мн,1-л,2-л,3-л,'
+                               'наст,непрош,прош,инф,пов,кр,полн')
+# features realized by a suffix of their own
+SUFFIX_BITS = [FEATURE_BITS[f] for f in ('ул', 'срав', 'прев', 'прич', 'деепр')]
+
+
+def read_columns(f_i):
+    """
+    f_i: input (FoLiA) file (full path, with extension) (str)
+    -> (speakers, n_utterances, speaker, lemmas, lemma, pos_classes, pos, features, morphemes)
+       speakers, lemmas, pos_classes: lists of strings indexed by the columns
+       n_utterances: number of utterances per speaker (np.array)
+       speaker, lemma, pos, features, morphemes: np.array, one value per word
+    """
+    speakers, lemmas, pos_classes = {}, {}, {}
+    utt_speaker = []
+    speaker, lemma, pos, features = [], [], [], []
+    for u in iter_utterances(f_i):
+        s = speakers.setdefault(u.speaker, len(speakers))
+        utt_speaker.append(s)
+        for w in utterance_words(u):
+            if not w.pos:
+                continue
+            speaker.append(s)
+            lemma.append(lemmas.setdefault(w.lemma.lower(), len(lemmas)))
+            pos.append(pos_classes.setdefault(w.pos, len(pos_classes)))
+            features.append(feature_mask(w.description))
+    features = np.array(features, dtype=np.int64)
+    morphemes = 1 + ((features & INFLECTION_MASK) != 0)
+    for bit in SUFFIX_BITS:
+        morphemes += (features & bit) != 0
+    return (list(speakers), np.bincount(np.array(utt_speaker, dtype=np.int64), minlength=len(speakers)),
+            np.array(speaker, dtype=np.int64),
+            list(lemmas), np.array(lemma, dtype=np.int64),
+            list(pos_classes), np.array(pos, dtype=np.int64),
+            features, morphemes)
+
+
+def file_statistics(f_i):
+    """
+    f_i: input (FoLiA) file (full path, with extension) (str)
+    -> dict {speaker: dict of counts} where the counts are
+       utterances, words, morphemes (int), types (set of lemmas),
+       pos (dict {POS class: count}), features (dict {feature: count})
+    """
+    speakers, n_utts, speaker, lemmas, lemma, pos_classes, pos, features, morphemes = read_columns(f_i)
+    n_speakers = len(speakers)
+    words = np.bincount(speaker, minlength=n_speakers)
+    n_morphemes = np.bincount(speaker, weights=morphemes, minlength=n_speakers)
+    # (speaker, lemma) and (speaker, POS) pairs as single keys
+    types = np.unique(speaker * max(len(lemmas), 1) + lemma)
+    pos_counts = np.bincount(speaker * max(len(pos_classes), 1) + pos,
+                             minlength=n_speakers * len(pos_classes)).reshape(n_speakers, len(pos_classes))
+    # one row of feature bits per word, summed per speaker
+    bits = (features[:, None] >> np.arange(len(FEATURES), dtype=np.int64)) & 1
+    feature_counts = np.zeros((n_speakers, len(FEATURES)), dtype=np.int64)
+    np.add.at(feature_counts, speaker, bits)
+
+    stats = {}
+    for s, name in enumerate(speakers):
+        stats[name] = {
+            'utterances': int(n_utts[s]),
+            'words': int(words[s]),
+            'morphemes': int(n_morphemes[s]),
+            'types': {lemmas[k % len(lemmas)] for k in types[types // max(len(lemmas), 1) == s]},
+            'pos': {p: int(n) for p, n in zip(pos_classes, pos_counts[s]) if n},
+            'features': {f: int(n) for f, n in zip(FEATURES, feature_counts[s]) if n},
+        }
+    return stats
+
+
+def cached_file_statistics(f_i, cache_dir=None):
+    """ file_statistics(), cached in cache_dir (optional) by content hash """
+    if not cache_dir:
+        return file_statistics(f_i)
+    with open(f_i, 'rb') as f:
+        digest = hashlib.sha1(f.read()).hexdigest()
+    f_cache = os.path.join(cache_dir, 'stats{}_{}.pkl'.format(STATS_VERSION, digest))
+    if os.path.exists(f_cache):
+        with open(f_cache, 'rb') as f:
+            return pickle.load(f)
+    stats = file_statistics(f_i)
+    os.makedirs(cache_dir, exist_ok=True)
+    with open(f_cache, 'wb') as f:
+        pickle.dump(stats, f, pickle.HIGHEST_PROTOCOL)
+    return stats
+
+
+def _cached_file_statistics(args):
+    return cached_file_statistics(*args)
+
+
+def measures(counts):  # counts: dict of counts (see file_statistics())
+    """ -> dict of the derived measures: MLU in words and morphemes, number of types, type/token ratio """
+    utterances, words = counts['utterances'], counts['words']
+    return {
+        'mlu_w': words / utterances if utterances else 0.0,
+        'mlu_m': counts['morphemes'] / utterances if utterances else 0.0,
+        'n_types': len(counts['types']),
+        'ttr': len(counts['types']) / words if words else 0.0,
+    }
+
+
+def merge(total, counts):
+    """ add counts into total (both dicts of counts) """
+    for key in ('utterances', 'words', 'morphemes'):
+        total[key] = total.get(key, 0) + counts[key]
+    total.setdefault('types', set()).update(counts['types'])
+    for key in ('pos', 'features'):
+        d = total.setdefault(key, {})
+        for k, n in counts[key].items():
+            d[k] = d.get(k, 0) + n
+    return total
+
+
+def corpus_statistics(fs_i, processes=None, cache_dir=None):
+    """
+    fs_i: list of input (FoLiA) files (full path, with extension) (str)
+    processes: number of worker processes (default: compute in this process)
+    cache_dir: directory of cached per-file results (optional)
+    -> (per_file, per_group)
+       per_file: dict {(file, speaker): counts}
+       per_group: dict {(child, speaker, age): counts}, summed over the files of the group
+    """
+    args = [(f, cache_dir) for f in fs_i]
+    if processes and processes > 1 and len(fs_i) > 1:
+        from multiprocessing import Pool
+
+        with Pool(processes) as pool:
+            results = pool.map(_cached_file_statistics, args)
+    else:
+        results = [_cached_file_statistics(a) for a in args]
+
+    registry = load_registry()
+    per_file, per_group = {}, {}
+    for f, stats in zip(fs_i, results):
+        name = os.path.basename(f)
+        child, age = registry.session(name).child, registry.age(name)
+        for speaker, counts in stats.items():
+            per_file[(name, speaker)] = counts
+            merge(per_group.setdefault((child, speaker, age), {}), counts)
+    return per_file, per_group
+
+
+def write_csv(table, key_names, f_o):
+    """
+    table: dict {key tuple: counts} (see corpus_statistics())
+    key_names: column names of the key tuple
+    f_o: output file object
+    """
+    import csv
+
+    pos_classes = sorted({p for counts in table.values() for p in counts['pos']})
+    features = [f for f in FEATURES if any(f in counts['features'] for counts in table.values())]
+    writer = csv.writer(f_o)
+    writer.writerow(list(key_names) + ['utterances', 'words', 'morphemes', 'mlu_w', 'mlu_m', 'types', 'ttr']
+                    + ['pos:' + p for p in pos_classes] + ['feat:' + f for f in features])
+    for key, counts in sorted(table.items()):
+        m = measures(counts)
+        writer.writerow(list(key) + [counts['utterances'], counts['words'], counts['morphemes'],
+                                     round(m['mlu_w'], 3), round(m['mlu_m'], 3), m['n_types'], round(m['ttr'], 3)]
+                        + [counts['pos'].get(p, 0) for p in pos_classes]
+                        + [counts['features'].get(f, 0) for f in features])
+
+
+if __name__ == "__main__":
+    import argparse
+    import sys
+
+    parser = argparse.ArgumentParser(description="Developmental statistics of FoLiA files.")
+    parser.add_argument("files", nargs="+")
+    parser.add_argument("--processes", type=int, default=os.cpu_count())
+    parser.add_argument("--cache", default=None, help="directory of cached per-file results")
+    parser.add_argument("--per-file", action="store_true", help="one row per file and speaker")
+    args = parser.parse_args()
+
+    per_file, per_group = corpus_statistics(args.files, args.processes, args.cache)
+    if args.per_file:
+        write_csv(per_file, ('file', 'speaker'), sys.stdout)
+    else:
+        write_csv(per_group, ('child', 'speaker', 'age'), sys.stdout)
@@ -0,0 +1,281 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+BiRCh EAF Reader Module
+alexluu@brandeis.edu
+
+Input: ELAN transcript file (.eaf) ||http://www.mpi.nl/tools/elan/EAF_Annotation_Format.pdf
+Output: annotations of the file (ids, tiers, times in milliseconds, values) in compact arrays
+
+A lightweight replacement for pympi.Eaf in the conversion path: the file is read
+in a single streaming pass and only what elan2folia needs is kept (no controlled
+vocabularies, no media descriptors, no per-annotation dicts).
+
+It agrees with pympi on the sample file and on fuzzed copies of it (tests/test_eaf.py).
+
+References:
+https://github.com/dopefishh/pympi/blob/master/pympi/Elan.py
+"""
+
+import xml.etree.ElementTree as ET
+from array import array
+from bisect import bisect_right
+
+# constraint stereotypes of the linguistic types of dependent tiers
+REFERENCE_TIERS = ('Symbolic_Association', 'Symbolic_Subdivision')  # attached through ANNOTATION_REF
+TIME_TIERS = ('Time_Subdivision', 'Included_In')  # attached by time containment in the parent tier
+
+
+class EafAnnotations:
+    """
+    Column store of the annotations of an EAF file, in file order.
+
+    ids[i]:    annotation ID (str)
+    tiers[i]:  index of the annotation's tier in tier_ids (int)
+    begins[i]: beginning time (in milliseconds) (int)
+    ends[i]:   ending time (in milliseconds) (int)
+    values[i]: annotation value (str, '' if empty)
+    refs[i]:   ID of the referred annotation (str) for reference annotations, None for alignable ones
+
+    Reference annotations get the times of the alignable annotation they
+    (transitively) refer to.
+
+    Tiers are described by parallel lists (tier_ids, tier_types, tier_parents,
+    tier_participants); linguistic_types maps each linguistic type ID to its
+    constraint stereotype (None for top-level types).
+    """
+    __slots__ = ('tier_ids', 'tier_types', 'tier_parents', 'tier_participants',
+                 'linguistic_types',
+                 'ids', 'tiers', 'begins', 'ends', 'values', 'refs')
+
+    def __init__(self):
+        self.tier_ids = []
+        self.tier_types = []
+        self.tier_parents = []
+        self.tier_participants = []
+        self.linguistic_types = {}
+        self.ids = []
+        self.tiers = array('i')
+        self.begins = array('q')
+        self.ends = array('q')
+        self.values = []
+        self.refs = []
+
+    def __len__(self):
+        return len(self.ids)
+
+    def alignable(self):
+        """ -> indices of the alignable annotations """
+        return [i for i in range(len(self.ids)) if self.refs[i] is None]
+
+    # Tier model
+
+    def tier_kind(self, t):  # t: tier index
+        """
+        -> 'independent' for top-level tiers, otherwise the constraint stereotype
+           of the tier's linguistic type (e.g. 'Symbolic_Association',
+           'Included_In') or 'dependent' if the type declares none
+        """
+        if self.tier_parents[t] is None:
+            return 'independent'
+        return self.linguistic_types.get(self.tier_types[t]) or 'dependent'
+
+    def children(self):
+        """ -> dict {tier index: list of indices of its child tiers} """
+        index = {t: [] for t in range(len(self.tier_ids))}
+        positions = {tier_id: t for t, tier_id in enumerate(self.tier_ids)}
+        for t, parent in enumerate(self.tier_parents):
+            if parent in positions:
+                index[positions[parent]].append(t)
+        return index
+
+    def select(self, utterance_tiers=None, dependent_tiers=None):
+        """
+        utterance_tiers: IDs of the tiers whose annotations are utterances
+                         (default: all independent tiers, see tier_kind())
+        dependent_tiers: IDs of the tiers whose annotations are attached to those utterances
+                         (default: all descendants of the utterance tiers)
+        -> (set of utterance tier indices, set of dependent tier indices)
+        """
+        positions = {tier_id: t for t, tier_id in enumerate(self.tier_ids)}
+        if utterance_tiers is None:
+            utts = {t for t in range(len(self.tier_ids)) if self.tier_kind(t) == 'independent'}
+        else:
+            utts = {positions[tier_id] for tier_id in utterance_tiers if tier_id in positions}
+        if dependent_tiers is None:
+            index = self.children()
+            deps = set()
+            stack = list(utts)
+            while stack:
+                for c in index[stack.pop()]:
+                    if c not in utts and c not in deps:
+                        deps.add(c)
+                        stack.append(c)
+        else:
+            deps = {positions[tier_id] for tier_id in dependent_tiers if tier_id in positions} - utts
+        return utts, deps
+
+    def dependents(self, utts, deps):
+        """
+        utts, deps: tier indices as returned by select()
+        -> dict {utterance annotation ID: list of (dependent tier ID, value)} in file order
+
+        The attachment follows the kind of the tier (tier_kind()): annotations of
+        reference tiers (REFERENCE_TIERS) through their ANNOTATION_REF chain,
+        annotations of time-aligned tiers (TIME_TIERS) through the parent-tier
+        annotation whose interval contains theirs. Tiers whose type declares no
+        constraint go by the kind of each annotation (reference or alignable).
+        """
+        positions = {tier_id: t for t, tier_id in enumerate(self.tier_ids)}
+        kinds = [self.tier_kind(t) for t in range(len(self.tier_ids))]
+        by_id = {aid: i for i, aid in enumerate(self.ids)}
+        # per tier, alignable annotations sorted by beginning time (for time containment)
+        starts = {}
+        for i in range(len(self.ids)):
+            if self.refs[i] is None:
+                starts.setdefault(self.tiers[i], []).append((self.begins[i], i))
+        for t in starts:
+            starts[t].sort()
+
+        def parent_of(i):
+            kind = kinds[self.tiers[i]]
+            if kind in REFERENCE_TIERS or (kind not in TIME_TIERS and self.refs[i] is not None):
+                return by_id.get(self.refs[i])
+            p = positions.get(self.tier_parents[self.tiers[i]])
+            if p is None or p not in starts:
+                return None
+            candidates = starts[p]
+            k = bisect_right(candidates, (self.begins[i], len(self.ids))) - 1
+            while k >= 0:
+                j = candidates[k][1]
+                if self.ends[j] >= self.ends[i]:
+                    return j
+                k -= 1
+            return None
+
+        attached = {}
+        for i in range(len(self.ids)):
+            if self.tiers[i] not in deps:
+                continue
+            j = parent_of(i)
+            seen = set()
+            while j is not None and self.tiers[j] not in utts and j not in seen:
+                seen.add(j)
+                j = parent_of(j)
+            if j is not None and self.tiers[j] in utts:
+                attached.setdefault(self.ids[j], []).append((self.tier_ids[self.tiers[i]], self.values[i]))
+        return attached
+
+
+def resolve_timeslots(slot_ids, slot_values):
+    """
+    slot_ids: time slot IDs in TIME_ORDER order (list of str)
+    slot_values: time values in milliseconds, None if unaligned (list of int|None)
+    -> dict {time slot ID: milliseconds}
+
+    Unaligned time slots lie between their aligned neighbours in TIME_ORDER,
+    so they get linearly interpolated values (or the nearest aligned value at
+    either end; 0 if nothing is aligned at all).
+    """
+    known = [i for i, v in enumerate(slot_values) if v is not None]
+    resolved = list(slot_values)
+    if not known:
+        return dict.fromkeys(slot_ids, 0)
+    for i in range(known[0]):
+        resolved[i] = slot_values[known[0]]
+    for i in range(known[-1] + 1, len(slot_values)):
+        resolved[i] = slot_values[known[-1]]
+    for a, b in zip(known, known[1:]):
+        if b - a > 1:
+            va, vb = slot_values[a], slot_values[b]
+            for i in range(a + 1, b):
+                resolved[i] = va + (vb - va) * (i - a) // (b - a)
+    return dict(zip(slot_ids, resolved))
+
+
+def read_eaf(f_i):
+    """
+    f_i: input (ELAN) file (full path, with extension) (str)
+    -> EafAnnotations
+    """
+    doc = EafAnnotations()
+    slot_ids = []
+    slot_values = []
+    # time slot references of alignable annotations (resolved at the end)
+    slot_refs = []
+    tier_index = -1
+    aid = ref = ts1 = ts2 = None
+    root = None
+
+    for event, elem in ET.iterparse(f_i, events=('start', 'end')):
+        tag = elem.tag
+        if event == 'start':
+            if root is None:
+                root = elem
+            elif tag == 'TIER':
+                doc.tier_ids.append(elem.get('TIER_ID'))
+                doc.tier_types.append(elem.get('LINGUISTIC_TYPE_REF'))
+                doc.tier_parents.append(elem.get('PARENT_REF'))
+                doc.tier_participants.append(elem.get('PARTICIPANT'))
+                tier_index = len(doc.tier_ids) - 1
+            elif tag == 'ALIGNABLE_ANNOTATION':
+                aid = elem.get('ANNOTATION_ID')
+                ts1 = elem.get('TIME_SLOT_REF1')
+                ts2 = elem.get('TIME_SLOT_REF2')
+                ref = None
+            elif tag == 'REF_ANNOTATION':
+                aid = elem.get('ANNOTATION_ID')
+                ref = elem.get('ANNOTATION_REF')
+                ts1 = ts2 = None
+            continue
+
+        if tag == 'TIME_SLOT':
+            slot_ids.append(elem.get('TIME_SLOT_ID'))
+            value = elem.get('TIME_VALUE')
+            slot_values.append(int(value) if value is not None else None)
+        elif tag == 'ANNOTATION_VALUE':
+            doc.ids.append(aid)
+            doc.tiers.append(tier_index)
+            doc.values.append(elem.text or '')
+            doc.refs.append(ref)
+            slot_refs.append((ts1, ts2))
+        elif tag == 'ANNOTATION':
+            # annotations are the bulk of the file: drop them once read
+            elem.clear()
+        elif tag in ('TIER', 'TIME_ORDER'):
+            # and the (emptied) tiers and the time slots with them, so that memory
+            # does not grow with the number of annotations
+            root.remove(elem)
+        elif tag == 'LINGUISTIC_TYPE':
+            doc.linguistic_types[elem.get('LINGUISTIC_TYPE_ID')] = elem.get('CONSTRAINTS')
+
+    timeslots = resolve_timeslots(slot_ids, slot_values)
+    times = {}
+    refs = {}
+    for i, (ts1, ts2) in enumerate(slot_refs):
+        if doc.refs[i] is None:
+            times[doc.ids[i]] = (timeslots.get(ts1, 0), timeslots.get(ts2, 0))
+        else:
+            refs[doc.ids[i]] = doc.refs[i]
+    for i in range(len(doc.ids)):
+        r = doc.ids[i]
+        # follow chains of reference annotations down to an alignable one
+        seen = set()
+        while r in refs and r not in seen:
+            seen.add(r)
+            r = refs[r]
+        b, e = times.get(r, (0, 0))
+        doc.begins.append(b)
+        doc.ends.append(e)
+    return doc
+
+
+if __name__ == "__main__":
+    import sys
+    import time
+
+    fs = sys.argv[1:] or ['data/I_2016_07_18_0.eaf']
+    for f in fs:
+        start = time.perf_counter()
+        doc = read_eaf(f)
+        print(f, len(doc), 'annotations', '{:.1f} ms'.format((time.perf_counter() - start) * 1000))
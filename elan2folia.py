@@ -16,14 +16,20 @@ https://github.com/proycon/folia/blob/master/foliatools/conllu2folia.py
 # import argparse
 import os
 # import sys
-from pympi import Eaf
+# from pympi import Eaf
+from eaf import read_eaf
 # from pynlpl.formats import folia
 import folia.main as folia
 import re
-from operator import itemgetter
-from pymystem3 import Mystem
+from functools import partial
+from operator import attrgetter
 from tokenization import *
 from morphology import *
+from records import Utterance, Token
+from folia_tokens import foliatime2millisec, RULES_SEPARATOR, UNANALYZED, READING_PREFIX, CONTEXT_READING_PREFIX
+from metadata import load_registry
+from pipeline import write_atomically
+from sinks import Sink, ChatSink, FOLIA_EXTENSION, make_sinks, sink_path
 
 
 # Helper function
@@ -41,26 +47,28 @@ def millisec2foliatime(ms):  # type(ms) == int
 
 
 # Reference: chronological_order.py (in "workspace/birch/nsf_report" folder)
-def get_aas(doc_elan):  # alignable annotation info
-    """ -> iterable of tuples of 
-                                 aa's ID (key of aa)
-                                 speaker (key of tier)
-                                 beginning time (in folia format)
-                                 ending time (in folia format)
-                                 transcript value    
-    """
-    for k in doc_elan.tiers:
-        aas = doc_elan.tiers[k][0]  # alignable annotations
-        for kk in aas:
-            time_b = millisec2foliatime(doc_elan.timeslots[aas[kk][0]])
-            time_e = millisec2foliatime(doc_elan.timeslots[aas[kk][1]])
-            yield (kk, k, time_b, time_e, aas[kk][2])
-
-
-def create_conversation(aas):  # aas: iterable of alinable annotation info
+def get_aas(doc_elan, utts=None, attached=None):  # alignable annotation info; doc_elan: eaf.EafAnnotations
+    """ -> iterable of records.Utterance
+                                 id: aa's ID (key of aa)
+                                 speaker: key of tier
+                                 begin, end: times (in milliseconds)
+                                 text: transcript value    
+    utts: indices of the tiers treated as speakers (default: all tiers)
+    attached: dict {aa's ID: dependent annotations} (see eaf.EafAnnotations.dependents())
+    """
+    for i in doc_elan.alignable():
+        if utts is not None and doc_elan.tiers[i] not in utts:
+            continue
+        aid = doc_elan.ids[i]
+        yield Utterance(aid, doc_elan.tier_ids[doc_elan.tiers[i]],
+                        doc_elan.begins[i], doc_elan.ends[i], doc_elan.values[i],
+                        dependents=attached.get(aid) if attached else None)
+
+
+def create_conversation(aas):  # aas: iterable of records.Utterance
     """ in chronological order """
     # https://stackoverflow.com/questions/4233476/sort-a-list-by-multiple-attributes
-    return sorted(aas, key=itemgetter(2, 3))
+    return sorted(aas, key=attrgetter('begin', 'end'))
 
 
 SET_LEMMA = "https://raw.githubusercontent.com/birch-group/elan2folia/master/set_definitions/birch_lemma.foliaset.xml"
@@ -70,23 +78,228 @@ SET_POS = "https://raw.githubusercontent.com/birch-group/elan2folia/master/set_d
 
 # SET_SU = "https://url/to/set_of_su"     # syntactic units
 
-def convert(f_i, f_o=None):
+def analyze_utterance(utt, readings=False, provenance=False):  # utt: records.Utterance
+    """ tokenize the utterance text and analyze the tokens morphologically -> utt """
+    utt.tokens = analyze_tokens([Token(t) for t in get_tokens(utt.text)], readings, provenance)
+    return utt
+
+
+def append_reading(an_pos, reading, processor, in_context=False):  # reading: (lex, wt, gr)
+    """ in_context: Mystem chose the reading in context (see folia_tokens.CONTEXT_READING_PREFIX) """
+    an_pos.append(folia.Comment,
+                  value='{}{} {} {}'.format(CONTEXT_READING_PREFIX if in_context else READING_PREFIX,
+                                            reading[1], reading[0], reading[2]),
+                  processor=processor)
+
+
+def append_utterance(speech, utt, processor):  # utt: analyzed records.Utterance
+    """ append utt to the FoLiA speech element -> folia.Utterance """
+    utterance = speech.append(folia.Utterance,
+                              id=utt.id, speaker=utt.speaker,
+                              begintime=millisec2foliatime(utt.begin),
+                              endtime=millisec2foliatime(utt.end),
+                              processor=processor)
+
+    # https://docs.python.org/3/library/string.html#formatspec
+    utterance.append(folia.Word, '{}:'.format(utt.speaker.upper()),
+                     processor=processor)
+    surfaces = [t.surface for t in utt.tokens]
+    for i, t in enumerate(utt.tokens):
+        token = utterance.append(folia.Word, t.surface, processor=processor)
+        if 'unanalyzed' in t.rules:
+            token.append(folia.Comment, value=UNANALYZED, processor=processor)
+        if t.lemma:
+            token.append(folia.LemmaAnnotation,
+                         cls=t.lemma,
+                         set=SET_LEMMA,
+                         processor=processor
+                         #  annotator='Mystem+'
+                         )
+        if t.pos:
+            an_pos = token.append(folia.PosAnnotation,
+                                  cls=t.pos,
+                                  set=SET_POS,
+                                  processor=processor
+                                  #   annotator='Mystem+'
+                                  )
+        if t.features:
+            # https://foliapy.readthedocs.io/en/latest/folia.html#features                
+            an_pos.append(folia.Description,
+                          value=re.sub(r'=', r',', t.features),
+                          processor=processor
+                          #   annotator='Mystem+'
+                          )
+        # provenance: the rules applied to the token, after the features
+        if t.features or (t.rules and t.pos):
+            an_pos.append(folia.Comment,
+                          value=' '.join(['Mystem+ features:', t.features])
+                                + (RULES_SEPARATOR + ','.join(t.rules) if t.rules else ''),
+                          processor=processor
+                          #   annotator='Mystem+'
+                          )
+        # ambiguity-preserving mode: the reading of the annotation, then the other
+        # readings as alternatives, each analyzed as if Mystem had chosen it
+        if t.readings and t.pos:
+            append_reading(an_pos, t.readings[t.chosen], processor, t.chosen == 0)
+            for k, r in enumerate(t.readings):
+                if k == t.chosen:
+                    continue
+                lemma, pos, features = analyze_reading(surfaces, i, r)
+                alternative = token.append(folia.Alternative, processor=processor)
+                if lemma:
+                    alternative.append(folia.LemmaAnnotation, cls=lemma, set=SET_LEMMA, processor=processor)
+                alt_pos = alternative.append(folia.PosAnnotation, cls=pos or 'X', set=SET_POS, processor=processor)
+                if features:
+                    alt_pos.append(folia.Description, value=re.sub(r'=', r',', features), processor=processor)
+                append_reading(alt_pos, r, processor, k == 0)
+
+    # dependent tiers
+    for label, value in utt.dependents:
+        utterance.append(folia.Comment,
+                         value=': '.join([label, value]),
+                         processor=processor)
+    return utterance
+
+
+# Chunked parallel analysis (for a single long recording)
+
+def init_worker(current_file='', file_deadline=None, failure_log=None, mystem_timeout=None):
     """
-    f_i: input (ELAN) files (full path, with extension) (str)
-    f_o: output (FoLiA) file (full path, with extension) (str)
-    ...
+    give each worker process its own Mystem instance (not the parent's pipe),
+    with the time budgets and the failure log of the file (see morphology.GuardedMystem)
     """
-    doc_i = Eaf(f_i)
+    import morphology
+    morphology.m = morphology.GuardedMystem(entire_input=False)
+    if mystem_timeout:
+        morphology.mystem_timeout = mystem_timeout
+    morphology.m_readings = None
+    morphology.current_file = current_file
+    morphology.file_deadline = file_deadline
+    morphology.failure_log = failure_log
 
-    if not f_o:
-        f_o = '.'.join([f_i.rpartition('.')[0], 'folia.xml'])
 
-    # https://foliapy.readthedocs.io/en/latest/folia.html#editing-folia
-    # https://foliapy.readthedocs.io/en/latest/folia.html#adding-structure
-    # https://foliapy.readthedocs.io/en/latest/folia.html#structure-annotation-types
-    # print(os.path.basename(f_o))
-    id_doc_o = os.path.basename(f_o).partition('.')[0]
-    print(id_doc_o)
+def analyze_chunk(utts, readings=False, provenance=False, rule_stats=False):  # utts: list of records.Utterance
+    """ -> utts, analyzed (run on a worker process); with rule_stats, (utts, rule statistics of the chunk) """
+    if not rule_stats:
+        return [analyze_utterance(utt, readings, provenance) for utt in utts]
+    import morphology
+    morphology.start_rule_stats()
+    utts = [analyze_utterance(utt, readings, provenance) for utt in utts]
+    return utts, morphology.stop_rule_stats()
+
+
+def has_readings(entry):  # entry: cached tuple of (surface, lemma, pos, features[, readings])
+    """ -> False if the entry was cached without readings although some of its tokens were analyzed """
+    return any(t[4:] and t[4] for t in entry) or not any(is_token_mystem(t[0]) for t in entry)
+
+
+def cached_token(entry, readings=False, provenance=False):  # entry: cached tuple (see analyze_conversation())
+    """
+    -> records.Token of entry, without its readings and its rules unless the conversion
+       keeps them (the cache may come from a conversion with other options)
+    """
+    token = Token(*entry)
+    if not readings:
+        token.readings = ()
+        token.chosen = 0
+    if not provenance:
+        token.rules = ()
+    return token
+
+
+def analyze_conversation(conversation, processes=None, chunk_size=None, cache=None, readings=False,
+                         provenance=False):
+    """
+    conversation: chronologically ordered list of records.Utterance
+    processes: number of worker processes (default/1: analyze in this process)
+    chunk_size: number of utterances per chunk (default: ~4 chunks per process)
+    cache: dict {(utterance ID, tuple of tokens): tuple of (surface, lemma, pos, features, readings, rules, chosen)}
+           kept between conversions of the same file (see also read_previous());
+           only utterances that are not in it are analyzed, and entries of utterances
+           no longer in the conversation are dropped from it
+    readings: keep all Mystem readings of every token (see morphology.analyze_readings())
+    provenance: keep the ids of the morphology rules applied to every token (records.Token.rules)
+    -> iterable of analyzed records.Utterance, in the same order
+    """
+    if cache is not None:
+        # the analysis of an utterance depends on its tokens only
+        keys = [(utt.id, tuple(get_tokens(utt.text))) for utt in conversation]
+        todo = [utt for utt, key in zip(conversation, keys)
+                if key not in cache or (readings and not has_readings(cache[key]))]
+        print('{} of {} utterances to analyze'.format(len(todo), len(conversation)))
+        # utterances Mystem failed on are not cached: they are analyzed again next time
+        unanalyzed = {}
+        for utt in analyze_conversation(todo, processes, chunk_size, readings=readings, provenance=provenance):
+            key = (utt.id, tuple(t.surface for t in utt.tokens))
+            if any('unanalyzed' in t.rules for t in utt.tokens):
+                unanalyzed[key] = utt.tokens
+                cache.pop(key, None)
+            else:
+                cache[key] = tuple((t.surface, t.lemma, t.pos, t.features, t.readings, t.rules, t.chosen)
+                                   for t in utt.tokens)
+        for key in set(cache).difference(keys):
+            del cache[key]
+        for utt, key in zip(conversation, keys):
+            utt.tokens = unanalyzed[key] if key in unanalyzed else [cached_token(t, readings, provenance) for t in cache[key]]
+            yield utt
+        return
+
+    if not processes or processes < 2 or len(conversation) < 2:
+        for utt in conversation:
+            yield analyze_utterance(utt, readings, provenance)
+        return
+
+    from multiprocessing import Pool
+    import morphology
+
+    if not chunk_size:
+        chunk_size = max(1, -(-len(conversation) // (processes * 4)))
+    chunks = [conversation[i:i + chunk_size] for i in range(0, len(conversation), chunk_size)]
+    with Pool(processes, initializer=init_worker,
+              initargs=(morphology.current_file, morphology.file_deadline, morphology.failure_log,
+                        morphology.mystem_timeout)) as pool:
+        # imap keeps the chunks in order while later ones are still being analyzed
+        # rule statistics of the workers are added to those of this process
+        rule_stats = morphology.rule_stats is not None
+        for chunk in pool.imap(partial(analyze_chunk, readings=readings, provenance=provenance,
+                                       rule_stats=rule_stats), chunks):
+            if rule_stats:
+                chunk, stats = chunk
+                morphology.merge_rule_stats(morphology.rule_stats, stats)
+            yield from chunk
+
+
+# Incremental conversion
+
+def read_previous(f_o, keep_manual=False):
+    """
+    f_o: previous output (FoLiA) file (full path, with extension) (str)
+    keep_manual: also reuse utterances with annotations corrected downstream (by hand or by
+                 another tool), preserving those corrections; by default such utterances are
+                 analyzed again
+    -> cache of the analyses in f_o (see analyze_conversation()); the utterances Mystem
+       failed on (folia_tokens.UNANALYZED) are always analyzed again
+    """
+    from folia_tokens import read_tokens, utterance_words, mystem_features, word_rules, is_unanalyzed
+
+    cache = {}
+    for u in read_tokens(f_o):
+        words = utterance_words(u)
+        if any(map(is_unanalyzed, words)):
+            continue
+        if not keep_manual and any(w.manual for w in words):
+            continue
+        tokens = tuple((w.text, w.lemma, w.pos, mystem_features(w), w.readings, word_rules(w), w.chosen)
+                       for w in words)
+        cache[(u.id, tuple(w.text for w in words))] = tokens
+    return cache
+
+
+def new_document(id_doc_o, readings=False):
+    """
+    readings: also declare the alternatives of the ambiguity-preserving mode
+    -> (folia.Document with the Mystem+ declarations, its folia.Speech, the Mystem+ processor)
+    """
     # doc_o = folia.Document(id=os.path.basename(f_o))
     doc_o = folia.Document(id=id_doc_o)
     # https://github.com/proycon/folia/blob/master/foliatools/conllu2folia.py
@@ -104,66 +317,336 @@ def convert(f_i, f_o=None):
     doc_o.declare(folia.Utterance, processor=processor_mystem)
     doc_o.declare(folia.Word, processor=processor_mystem)
     doc_o.declare(folia.Hiddenword)
+    if readings:
+        doc_o.declare(folia.Alternative, processor=processor_mystem)
 
     # folia.Speech cannot be declared as an annotation type
     speech = doc_o.append(folia.Speech)
-    for aa in create_conversation(get_aas(doc_i)):
+    return doc_o, speech, processor_mystem
+
+
+def append_metadata(doc_o, id_doc_o, speakers, registry=None):
+    """
+    speakers: speakers (tier IDs) of the document (list of str)
+    registry: metadata.Registry (default: metadata.load_registry())
+
+    Native FoLiA metadata of a registered session: child, date, languages, then
+    'code:<speaker>' and 'role:<speaker>' of its registered speakers; the speakers
+    missing from the registry are left to registry.unresolved (see metadata.report()).
+    """
+    if registry is None:
+        registry = load_registry()
+    session = registry.session(id_doc_o)
+    if session.session not in registry.sessions:
+        return
+    doc_o.metadata['child'] = session.child
+    if session.date:
+        doc_o.metadata['date'] = session.date.isoformat()
+    doc_o.metadata['languages'] = registry.languages(id_doc_o)
+    for speaker in speakers:
+        participant = registry.participant(id_doc_o, speaker)
+        if participant is not None:
+            doc_o.metadata['code:' + speaker] = registry.speaker_code(id_doc_o, speaker)
+            if participant.role:
+                doc_o.metadata['role:' + speaker] = participant.role
+
+
+class FoliaSink(Sink):
+    """
+    the FoLiA file of a conversion (see sinks.py)
+    readings: see convert(); None: as the conversion (set by build_outputs())
+    """
+    extension = FOLIA_EXTENSION
+
+    def __init__(self, path, readings=None):
+        super().__init__(path)
+        self.readings = readings
+
+    def begin(self, doc_id, speakers):
+        super().begin(doc_id, speakers)
+        self.doc_o, self.speech, self.processor = new_document(doc_id, self.readings)
+        append_metadata(self.doc_o, doc_id, speakers)
+
+    def add(self, utt):
+        append_utterance(self.speech, utt, self.processor)
+
+    def save(self, path):
+        self.doc_o.save(path)
+
+
+def convert(f_i, f_o=None, utterance_tiers=None, dependent_tiers=None, processes=None, cache=None,
+            incremental=False, keep_manual=False, index=None, binary=False, readings=False, provenance=False,
+            sinks=None, budget=None):
+    """
+    f_i: input (ELAN) files (full path, with extension) (str)
+    f_o: output (FoLiA) file (full path, with extension) (str)
+    utterance_tiers: IDs of the tiers that become utterances, the tier ID being the speaker
+                     (default: all independent tiers)
+    dependent_tiers: IDs of the tiers (translations, comments, gestures, ...) whose annotations
+                     are attached to the utterances as comments '<tier ID>: <value>';
+                     a dict {tier ID: label} replaces the tier ID by the label
+                     (default: all descendants of the utterance tiers)
+    processes: number of worker processes analyzing contiguous chunks of utterances
+               (default: analyze in this process)
+    cache: utterance-level analysis cache reused across conversions (see analyze_conversation())
+    incremental: reuse the analyses of unchanged utterances (same ID, same tokens) of the
+                 existing f_o, analyzing only changed or new utterances
+    keep_manual: in incremental mode, also reuse (and so preserve) annotations corrected
+                 downstream in f_o (see read_previous())
+    index: token_index.TokenIndex updated with f_o once it is written (optional)
+    binary: also write the binary corpus file (.birch) alongside f_o (see corpus_binary.py)
+    readings: ambiguity-preserving mode: keep all Mystem readings of every token, the
+              other readings as FoLiA alternatives (see redisambiguate())
+    provenance: add the ids of the morphology rules applied to every token to its
+                'Mystem+ features' comment (see morphology.RULES)
+    sinks: outputs written from the same analysis, e.g.
+           [FoliaSink(f_o), ChatSink('data/CHAT/X.cha'), ConlluSink('data/X.conllu')]
+           (see sinks.py) (default: FoliaSink(f_o), the FoLiA file only)
+    budget: time budget (in seconds) of the Mystem calls of the file; once spent, the rest of
+            the file is analyzed without Mystem, and logged (see morphology.GuardedMystem)
+    ...
+    """
+    doc_i = read_eaf(f_i)
+    if not f_o:
+        f_o = '.'.join([f_i.rpartition('.')[0], 'folia.xml'])
+    if sinks is None:
+        sinks = [FoliaSink(f_o)]
+    previous = read_previous(f_o, keep_manual) if incremental and os.path.exists(f_o) else None
+    build_outputs(doc_i, f_o, sinks, utterance_tiers, dependent_tiers, processes, cache, previous, readings,
+                  provenance, budget)
+    save_outputs(sinks, index, binary)
+
+
+def build_document(doc_i, f_o, utterance_tiers=None, dependent_tiers=None, processes=None, cache=None,
+                   previous=None, readings=False, provenance=False):
+    """
+    doc_i: annotations of the input (ELAN) file (eaf.EafAnnotations)
+    f_o: output (FoLiA) file (full path, with extension) (str)
+    previous: analyses of the previous f_o to reuse (see read_previous()) (optional)
+    other arguments: see convert()
+    -> folia.Document of f_o (not saved)
+    """
+    sink = FoliaSink(f_o)
+    build_outputs(doc_i, f_o, [sink], utterance_tiers, dependent_tiers, processes, cache, previous, readings,
+                  provenance)
+    return sink.doc_o
+
+
+def build_outputs(doc_i, f_o, sinks, utterance_tiers=None, dependent_tiers=None, processes=None, cache=None,
+                  previous=None, readings=False, provenance=False, budget=None):
+    """
+    Analyze doc_i once, each utterance going to every sink as soon as it is analyzed.
+    sinks: list of sinks.Sink (not saved)
+    other arguments: see build_document() and convert()
+    """
+    import morphology
+
+    for sink in sinks:
+        if isinstance(sink, FoliaSink):
+            if sink.readings is None:
+                sink.readings = readings
+            elif sink.readings != readings:
+                raise ValueError('{}: readings={} but the conversion has readings={}'.format(
+                    sink.path, sink.readings, readings))
+
+    utts, deps = doc_i.select(utterance_tiers, dependent_tiers)
+    attached = doc_i.dependents(utts, deps)
+    if isinstance(dependent_tiers, dict):
+        for aid in attached:
+            attached[aid] = [(dependent_tiers.get(tier, tier), value) for tier, value in attached[aid]]
+
+    if previous:
+        if cache is None:
+            cache = {}
+        for key, tokens in previous.items():
+            cache.setdefault(key, tokens)
+
+    # https://foliapy.readthedocs.io/en/latest/folia.html#editing-folia
+    # https://foliapy.readthedocs.io/en/latest/folia.html#adding-structure
+    # https://foliapy.readthedocs.io/en/latest/folia.html#structure-annotation-types
+    # print(os.path.basename(f_o))
+    id_doc_o = os.path.basename(f_o).partition('.')[0]
+    print(id_doc_o)
+    morphology.start_file(id_doc_o, budget)
+    speakers = sorted(doc_i.tier_ids[t] for t in utts)
+    for sink in sinks:
+        sink.begin(id_doc_o, speakers)
+    conversation = create_conversation(get_aas(doc_i, utts, attached))
+    for utt in analyze_conversation(conversation, processes, cache=cache, readings=readings, provenance=provenance):
         print('-',end='')
-        utterance = speech.append(folia.Utterance,
-                                  id=aa[0], speaker=aa[1],
-                                  begintime=aa[2], endtime=aa[3],
-                                  processor=processor_mystem)
-
-        # https://docs.python.org/3/library/string.html#formatspec
-        utterance.append(folia.Word, '{}:'.format(aa[1].upper()),
-                         processor=processor_mystem)
-        # aa[4]: utterance text
-        tokens = get_tokens(aa[4])
-        len_tokens = len(tokens)
-        for i in range(len_tokens):
-            t = tokens[i]
-            # consider the previous token in morphological analysis
-            # pre_t = None
-            # if i:
-            #     pre_t = tokens[i-1]
-            pre_t = [None, None]
-            if i > 1:
-                pre_t = [tokens[i - 2], tokens[i - 1]]
-            elif i == 1:
-                pre_t[1] = tokens[i - 1]
-            token = utterance.append(folia.Word, t, processor=processor_mystem)
-            if i < (len_tokens - 1):
-                t = ' '.join([t, tokens[i + 1]])
-            # lemma, pos, features = analyze_morphology(t)
-            lemma, pos, features = analyze_morphology(pre_t, t)
-            if lemma:
-                token.append(folia.LemmaAnnotation,
-                             cls=lemma,
-                             set=SET_LEMMA,
-                             processor=processor_mystem
-                             #  annotator='Mystem+'
-                             )
-            if pos:
-                an_pos = token.append(folia.PosAnnotation,
-                                      cls=pos,
-                                      set=SET_POS,
-                                      processor=processor_mystem
-                                      #   annotator='Mystem+'
-                                      )
-            if features:
-                # https://foliapy.readthedocs.io/en/latest/folia.html#features                
-                an_pos.append(folia.Description,
-                              value=re.sub(r'=', r',', features),
-                              processor=processor_mystem
-                              #   annotator='Mystem+'
-                              )
-                an_pos.append(folia.Comment,
-                              value=' '.join(['Mystem+ features:', features]),
-                              processor=processor_mystem
-                              #   annotator='Mystem+'
-                              )
-
-    doc_o.save(f_o)
+        for sink in sinks:
+            sink.add(utt)
+
+
+def save_outputs(sinks, index=None, binary=False):
+    """ write every sink to its path (atomically), then update the index and the binary corpus file of the FoLiA ones """
+    for sink in sinks:
+        write_atomically(sink.save, sink.path)
+        if isinstance(sink, FoliaSink):
+            saved(sink.path, index, binary)
+
+
+def saved(f_o, index=None, binary=False):
+    if index is not None:
+        index.update(f_o)
+    if binary:
+        from corpus_binary import folia2binary
+        folia2binary(f_o)
+
+
+def convert_batch(jobs, prefetch=2, backlog=2, incremental=False, keep_manual=False, index=None, binary=False,
+                  formats=(), **kwargs):
+    """
+    jobs: list of (input (ELAN) file, output (FoLiA) file) (full paths, with extensions) (str)
+    prefetch: number of ELAN files read ahead
+    backlog: number of FoLiA documents waiting to be saved
+    formats: other formats written next to each FoLiA file from the same analysis,
+             e.g. ('chat', 'conllu', 'tsv') (see sinks.make_sinks())
+    other arguments: see convert()
+    -> dict {input file: exception} of the failed conversions
+
+    Reading (ELAN files, and previous FoLiA files in incremental mode), analysis
+    and saving overlap (see pipeline.run_pipeline()); each output file is saved
+    to a temporary file and renamed into place.
+    """
+    from pipeline import run_pipeline
+
+    def read(f_i, f_o):
+        previous = read_previous(f_o, keep_manual) if incremental and os.path.exists(f_o) else None
+        return read_eaf(f_i), previous
+
+    def process(data, f_i, f_o):
+        sinks = [FoliaSink(f_o)] + make_sinks(formats, f_o)
+        build_outputs(data[0], f_o, sinks, previous=data[1], **kwargs)
+        return sinks
+
+    def write(sinks, path):
+        sinks[0].save(path)
+
+    def done(sinks, f_i, f_o):
+        for sink in sinks[1:]:
+            write_atomically(sink.save, sink.path)
+        saved(f_o, index, binary)
+
+    return run_pipeline(jobs, read, process, write, done, prefetch, backlog)
+
+
+# Offline re-disambiguation (ambiguity-preserving mode)
+
+def redisambiguate(f_i, f_o=None, policy='max_wt', memo=None):
+    """
+    f_i: input (FoLiA) file written with readings=True (full path, with extension) (str)
+    f_o: output (FoLiA) file (default: next to f_i, named after the policy,
+         e.g. data/FoLiA/X.folia.xml -> data/FoLiA/X.max_wt.folia.xml)
+    policy: name of the disambiguation policy (see morphology.POLICIES)
+    memo: dict shared across files (see morphology.disambiguate())
+    -> number of tokens whose annotation changed
+
+    The annotations are made again from the stored readings, chosen by the policy,
+    without calling Mystem; the chosen reading becomes the annotation and the
+    others stay alternatives. The order of the readings is kept, Mystem's choice in
+    context first (flagged in its comment), so that the 'mystem' policy still finds it.
+    Words annotated downstream (by hand or by another tool, see folia_tokens.is_manual())
+    keep their annotation, still marked as manual (as read_previous(keep_manual=True)).
+    """
+    from folia_tokens import read_tokens, utterance_words, mystem_features, word_rules
+
+    if not f_o:
+        f_o = sink_path(f_i, '.{}{}'.format(policy, FOLIA_EXTENSION))
+    if memo is None:
+        memo = {}
+    doc_o, speech, processor_mystem = new_document(os.path.basename(f_o).partition('.')[0], True)
+    processor_manual = None
+    changed = 0
+    for u in read_tokens(f_i):
+        words = utterance_words(u)
+        surfaces = [w.text for w in words]
+        tokens = []
+        for w, (k, analysis) in zip(words, disambiguate(surfaces, [w.readings for w in words],
+                                                        POLICIES[policy], memo)):
+            if w.manual:
+                tokens.append(Token(w.text, w.lemma, w.pos, mystem_features(w), w.readings, word_rules(w), w.chosen))
+                continue
+            token = Token(w.text, readings=w.readings, chosen=k or 0)
+            token.set_analysis(*analysis)
+            changed += (token.lemma, token.pos) != (w.lemma, w.pos) or \
+                re.sub(r'=', r',', token.features) != w.description
+            tokens.append(token)
+        dependents = [tuple(c.split(': ', 1)) for c in u.comments if ': ' in c]
+        utt = Utterance(u.id, u.speaker, foliatime2millisec(u.begintime), foliatime2millisec(u.endtime),
+                        ' '.join(surfaces), tokens, dependents)
+        utterance = append_utterance(speech, utt, processor_mystem)
+        if any(w.manual for w in words):
+            if processor_manual is None:
+                processor_manual = declare_manual(doc_o)
+            # the last words of the utterance, after the speaker label
+            for word, w in zip(list(utterance.words())[-len(words):], words):
+                if w.manual:
+                    for annotation in word.select((folia.LemmaAnnotation, folia.PosAnnotation), recursive=False):
+                        annotation.processor = processor_manual
+    write_atomically(doc_o.save, f_o)
+    return changed
+
+
+def declare_manual(doc_o):
+    """ -> folia.Processor of the annotations kept from downstream corrections (see redisambiguate()) """
+    processor_manual = folia.Processor(name='manual', type=folia.ProcessorType.MANUAL)
+    doc_o.declare(folia.LemmaAnnotation, set=SET_LEMMA, processor=processor_manual)
+    doc_o.declare(folia.PosAnnotation, set=SET_POS, processor=processor_manual)
+    return processor_manual
+
+
+# Watch mode
+
+def watch(dir_i='data/ELAN', dir_o='data/FoLiA', dir_chat=None, interval=0.2, debounce=0.3, **kwargs):
+    """
+    Reconvert the ELAN files of dir_i into dir_o whenever annotators save them.
+
+    dir_chat: also write CHAT files there (optional)
+    interval: polling interval (in seconds)
+    debounce: time (in seconds) a file must stay unchanged before it is converted,
+              so that a save in progress (or a burst of saves) triggers one conversion
+    kwargs: passed to convert()
+
+    Polling (os.stat) keeps this portable; each file keeps its own utterance-level
+    cache, so only utterances whose text changed are analyzed again.
+    """
+    import time
+
+    seen = {}     # file -> (mtime_ns, size) of the last conversion
+    pending = {}  # file -> ((mtime_ns, size), time first seen with that state)
+    caches = {}   # file -> utterance-level analysis cache
+    print('Watching', dir_i)
+    while True:
+        now = time.monotonic()
+        for f in os.listdir(dir_i):
+            if not f.endswith('.eaf'):
+                continue
+            f_i = os.path.join(dir_i, f)
+            try:
+                st = os.stat(f_i)
+            except FileNotFoundError:
+                continue
+            state = (st.st_mtime_ns, st.st_size)
+            if seen.get(f_i) == state:
+                continue
+            if f_i not in pending or pending[f_i][0] != state:
+                pending[f_i] = (state, now)
+                continue
+            if now - pending[f_i][1] < debounce:
+                continue
+            del pending[f_i]
+            f_o = os.path.join(dir_o, f.replace('.eaf', '.folia.xml'))
+            # the CHAT file from the same analysis, without parsing the FoLiA file again
+            sinks = [FoliaSink(f_o)]
+            if dir_chat:
+                sinks.append(ChatSink(os.path.join(dir_chat, f.replace('.eaf', '.cha'))))
+            try:
+                convert(f_i, f_o, cache=caches.setdefault(f_i, {}), sinks=sinks, **kwargs)
+            except Exception as e:  # e.g. a file saved half-way: retried on its next change
+                print('Error converting {}: {}'.format(f_i, e))
+            seen[f_i] = state
+        time.sleep(interval)
 
 
 if __name__ == "__main__":
@@ -182,13 +665,41 @@ if __name__ == "__main__":
     # f = sys.argv[1].strip()
     # convert(f)
 
-    # converting batch of files from data/ELAN folder to data/FoLiA folder:
+    # watching data/ELAN folder and reconverting files to data/FoLiA folder as they are saved:
+    # python elan2folia.py --watch [--chat]
+    if len(sys.argv) > 1 and sys.argv[1] == '--watch':
+        watch('data/ELAN', 'data/FoLiA', 'data/CHAT' if '--chat' in sys.argv else None)
+
+    # converting batch of files from data/ELAN folder to data/FoLiA folder
+    # (reading, analysis and saving pipelined, see convert_batch()):
+    # python elan2folia.py [--provenance] [--rules] [--formats=chat,conllu,tsv] [--budget=600] [--timeout=10]
+    # --provenance: the ids of the morphology rules applied to every token in its FoLiA comment
+    # --rules: hits, changed tokens and time of every morphology rule, written to data/rules.csv
+    # --formats: also write these formats next to the FoLiA files, from the same analysis (see sinks.py)
+    # --budget=SECONDS, --timeout=SECONDS: time budget of the Mystem calls of a file, and of a single call;
+    # the utterances Mystem fails on are logged to data/mystem_failures.jsonl (see morphology.GuardedMystem)
+    import morphology
+    if '--rules' in sys.argv:
+        morphology.start_rule_stats()
+    options = dict(a[2:].partition('=')[::2] for a in sys.argv if a.startswith('--') and '=' in a)
+    if 'timeout' in options:
+        morphology.mystem_timeout = float(options['timeout'])
+    morphology.failure_log = 'data/mystem_failures.jsonl'
+    jobs = []
     for f in os.listdir('data/ELAN/'):
         if f.endswith('.eaf'):
             f = 'data/ELAN/' + f.strip()
             fo = f.replace('.eaf', '.folia.xml')
             fo = fo.replace('data/ELAN', 'data/FoLiA')
-            convert(f, fo)
+            jobs.append((f, fo))
+    formats = [x for x in options.get('formats', '').split(',') if x]
+    budget = float(options['budget']) if 'budget' in options else None
+    convert_batch(jobs, provenance='--provenance' in sys.argv, formats=formats, budget=budget)
+    if morphology.failures:
+        print(morphology.failures, 'Mystem failures, see', morphology.failure_log)
+    if '--rules' in sys.argv:
+        morphology.write_rule_stats(morphology.stop_rule_stats(), 'data/rules.csv')
+        print('\n'.join(report_cache_stats()))
 
     # # print IDs of converted files:
     # n = []
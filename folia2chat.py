@@ -2,17 +2,19 @@ import re
 import xml.etree.ElementTree as ET
 import os
 import glob
+import io
+from collections import namedtuple
+from contextlib import nullcontext
+from functools import lru_cache
+from morphological_features import feats_ru2en
+from metadata import SPEAKER_CODES, load_registry
 
 # --- Configuration ---
-# Speaker code mapping from FoLiA speaker ID to CHAT code
-SPEAKER_CODES = {
-    "РЕБЕНОК": "CHI", "CHILD": "CHI",
-    "МАМА": "MOT", "MOTHER": "MOT",
-    "ПАПА": "FAT", "FATHER": "FAT",
-    "БАБУШКА": "GRA", "GRANDMOTHER": "GRA",
-    "ДЕДУШКА": "GRF", "GRANDFATHER": "GRF",
-    "UNKNOWN": "UNK",
-}
+# size (in characters) of the blocks written by ChatWriter
+BLOCK_SIZE = 1 << 16
+
+# Speaker code mapping from FoLiA speaker ID to CHAT code:
+# metadata.SPEAKER_CODES, unless the speaker is in the metadata registry (see metadata.py)
 
 # FoLiA POS tags to a simplified CHAT %mor POS representation
 POS_CONVERSION_MOR = {
@@ -102,104 +104,29 @@ MAIN_TIER_REGEX_CONVERSIONS = {
     r'^\s+': ''
 }
 
-FEATURE_MAP = {
-    # Conjunctions
-    "соч": "coord",
-    "подч": "sybrd",
-
-    # Adverbs
-    "квант": "quant",
-    "срав": "comp",
-    "дискр": "discr",
-    "pred": "pred",
-
-    # Pronoun person
-    "1-л": "1p",
-    "2-л": "2p",
-    "3-л": "3p",
-
-    # Animacy
-    "од": "anim",
-    "неод": "inan",
-
-    # Gender
-    "муж": "m",
-    "жен": "f",
-    "мж": "mf",
-    "сред": "n",
-    "проф": "prof",
-
-    # Frozen
-    "неиз": "nd",
-
-    # Case
-    "им": "nom",
-    "род": "gen",
-    "род2": "gen2",
-    "дат": "dat",
-    "вин": "acc",
-    "вин2": "acc2",
-    "твор": "ins",
-    "пр": "abl",
-    "местн": "loc",
-    "зват": "voc",
-
-    # Number
-    "ед": "sg",
-    "мн": "pl",
-
-    # Diminutive/Augmentative
-    "ул": "dim",
-    "па": "aug",
-
-    # Adjective form
-    "кр": "brev",
-    "полн": "plen",
-    "притяж": "poss",
-
-    # Degree
-    "прев": "supr",
-    "срав": "comp",
-
-    # Verb forms
-    "деепр": "ger",
-    "инф": "inf",
-    "прич": "partcp",
-    "изъяв": "indic",
-    "пов": "imper",
-
-    # Transitivity
-    "пе": "tran",
-    "нп": "intr",
-
-    # Tense
+# %mor feature suffixes: the canonical feature table of morphological_features
+# (keys as written in FoLiA <desc>, values as the class ids of the BiRCh set definitions),
+# except for the tense suffixes, which keep their established %mor spelling
+FEATURE_MAP = dict(feats_ru2en, **{
     "наст": "pres",
     "непрош": "inpres",
     "прош": "pret",
+})
 
-    # Aspect
-    "несов": "ipf",
-    "сов": "pf",
-
-    # Voice
-    "действ": "act",
-    "страд": "pass",
-
-    # Other features
-    "Вводн": "parenth",
-    "Аном": "anom",
-    "Гео": "geo",
-    "Имя": "persn",
-    "Обсц": "obsc",
-    "Отч": "patrn",
-    "pred": "praed",
-    "Предик": "praedic",
-    "Сокр": "abbr",
-    "Фам": "famn",
-    "Разг": "col",
-    "Впрл": "posa",
-    "внар": "padv"
-}
+
+@lru_cache(maxsize=None)
+def compile_mor(folia_pos_class, description):
+    """
+    Resolve a (POS class, description) pair to its %mor POS and feature suffix
+    (e.g. ('N', 'муж,неод,им,ед') -> ('n', '-m-inan-nom-sg')), once per run.
+    """
+    mor_pos = convert_folia_pos_to_mor(folia_pos_class)
+    features = []
+    for feat in description.split(','):
+        mapped = FEATURE_MAP.get(feat.strip())
+        if mapped:
+            features.append(mapped)
+    return mor_pos, "-" + "-".join(features) if features else ""
 
 
 def extract_features_from_pos(word_elem, namespace):
@@ -211,44 +138,33 @@ def extract_features_from_pos(word_elem, namespace):
     if desc_elem is None or not desc_elem.text:
         return []
 
-    features = []
-    for feat in desc_elem.text.split(','):
-        feat = feat.strip()
-        if not feat:
-            continue
-        mapped = FEATURE_MAP.get(feat)
-        if mapped:
-            features.append(mapped)
-    return features
-
-def determine_languages(filename: str) -> str:
-    """Determine @Languages value based on filename prefix."""
-    prefix = filename.split("_")[0]  # e.g., "T" from "T_4-2-24_0.folia.xml"
-    if prefix.startswith(("S", "K", "B", "N", "I")):
-        return "eng, rus"
-    elif prefix.startswith(("A", "L", "M", "Sh")):
-        return "deu, rus"
-    else:
-        return "rus"
+    _, feature_str = compile_mor(pos_elem.get('class', '').strip(), desc_elem.text)
+    return feature_str[1:].split('-') if feature_str else []
 
-def extract_child_age(filename: str) -> str:
-    """
-    Extract child age in CHAT format (Y;MM.DD) from filename.
-    """
-    try:
-        parts = filename.split("_")[1].split("-")  # ["4", "2", "24"]
-        years, months, days = parts
-        return f"{int(years)};{int(months):02d}.{int(days):02d}"
-    except Exception:
-        return "0;00.00"  # fallback
+# the file name conventions (metadata.determine_languages(), metadata.extract_child_age()) are the
+# fallbacks of the registry (metadata.Registry.languages(), metadata.Registry.age())
+
+def chat_date(d):  # d: datetime.date
+    """ -> date in CHAT format, e.g. 18-JUL-2016 """
+    return "{:02d}-{}-{}".format(d.day, "JAN FEB MAR APR MAY JUN JUL AUG SEP OCT NOV DEC".split()[d.month - 1], d.year)
 
-def extract_speakers_and_chat_codes(root, namespace):
+
+def extract_speakers_and_chat_codes(root, namespace, registry=None, filename=''):
     """Scan FoLiA tree to get unique speakers with CHAT codes."""
+    return speakers_and_chat_codes((utt_elem.get('speaker', 'UNKNOWN')
+                                    for utt_elem in root.findall('.//folia:utt', namespaces=namespace)),
+                                   registry, filename)
+
+
+def speakers_and_chat_codes(utterance_speakers, registry=None, filename=''):
+    """Unique speakers of the utterances (in order of appearance) with CHAT codes."""
     speakers = {}
-    for utt_elem in root.findall('.//folia:utt', namespaces=namespace):
-        speaker_raw = utt_elem.get('speaker', 'UNKNOWN')
+    for speaker_raw in utterance_speakers:
         if speaker_raw not in speakers:
-            chat_code = SPEAKER_CODES.get(speaker_raw.upper(), "UNK")
+            if registry is not None:
+                chat_code = registry.speaker_code(filename, speaker_raw)
+            else:
+                chat_code = SPEAKER_CODES.get(speaker_raw.upper(), "UNK")
             speakers[speaker_raw] = chat_code
     return speakers  # dict {FoLiA name: CHAT code}
 
@@ -306,6 +222,29 @@ def clean_special_tags(text: str) -> str:
     return text
 
 
+# dependent tiers carried over from ELAN as utterance-level comments '<label>: <value>'
+re_chat_dependent_tier = re.compile(r'[a-z]{3,4}')
+
+def get_dependent_tier_lines(utt_elem, namespace):
+    """Return CHAT dependent tier lines ('%xxx:\t...') for the utterance-level comments of utt_elem."""
+    return dependent_tier_lines(comment_elem.text for comment_elem in utt_elem.findall('./folia:comment', namespaces=namespace))
+
+
+def dependent_tier_lines(comments):
+    """Return CHAT dependent tier lines ('%xxx:\t...') for utterance-level comments ('<label>: <value>')."""
+    lines = []
+    for value in comments:
+        value = (value or "").strip()
+        if not value:
+            continue
+        label, sep, text = value.partition(': ')
+        if sep and re_chat_dependent_tier.fullmatch(label):
+            lines.append(f"%{label}:\t{text}")
+        else:
+            lines.append(f"%com:\t{value}")
+    return lines
+
+
 # --- Core Functions ---
 def get_folia_namespace(root_element):
     ns_match = re.match(r'\{(.+)\}', root_element.tag)
@@ -321,21 +260,267 @@ def apply_main_tier_regex_conversions(text_line):
         text_line = re.sub(pattern, replacement, text_line)
     return text_line
 
-def convert_folia_to_chat(folia_file_path, chat_output_path):
-    def is_nonlexical_token_for_mor(token_text: str) -> bool:
-        """Return True if token should not appear in %mor at all."""
-        if not token_text:
-            return True
-        # Any token that starts and ends with angle brackets OR is a known CHAT non-lexical marker
-        if re.match(r'^<.*?>$', token_text):
-            return True
-        if token_text in FOLIA_T_CONTENT_TO_CHAT_MARKER:
-            return True
-        return False
+# --- Utterance records and %mor assembly ---
+# speaker: FoLiA speaker of the utterance (str)
+# words: (text, POS class or None if the word has no POS, description) of its words (tuple)
+# dependents: CHAT dependent tier lines of the utterance (see get_dependent_tier_lines()) (tuple)
+ChatUtterance = namedtuple('ChatUtterance', 'speaker words dependents')
+
+# tags whose attributes are markers, not words: '<$REP - C>' (older FoLiA files split '<$REP-C>')
+MARKER_ATTRIBUTE_TAGS = {'REP'}
+
+re_tag_name = re.compile(r'<\s*\$*\s*([A-Za-z]+)')
+
+
+def is_nonlexical_token_for_mor(token_text: str) -> bool:
+    """Return True if token should not appear in %mor at all."""
+    if not token_text:
+        return True
+    # Any token that starts and ends with angle brackets OR is a known CHAT non-lexical marker
+    if re.match(r'^<.*?>$', token_text):
+        return True
+    if token_text in FOLIA_T_CONTENT_TO_CHAT_MARKER:
+        return True
+    return False
+
+
+def utterance_record(utt_elem, namespace):
+    """ -> ChatUtterance of a FoLiA <utt> element """
+    words = []
+    for word_elem in utt_elem.findall('.//folia:w', namespaces=namespace):
+        text_elem = word_elem.find('./folia:t', namespaces=namespace)
+        token_text_raw = text_elem.text.strip() if text_elem is not None and text_elem.text else ""
+        if not token_text_raw:
+            continue
+        pos_elem = word_elem.find('.//folia:pos', namespaces=namespace)
+        if pos_elem is None:
+            words.append((token_text_raw, None, ""))
+        else:
+            desc_elem = pos_elem.find('./folia:desc', namespaces=namespace)
+            description = desc_elem.text or "" if desc_elem is not None else ""
+            words.append((token_text_raw, pos_elem.get('class', '').strip(), description))
+    return ChatUtterance(utt_elem.get('speaker', 'UNKNOWN'), tuple(words),
+                         tuple(get_dependent_tier_lines(utt_elem, namespace)))
+
+
+def assemble_utterance(utt):  # utt: ChatUtterance
+    """
+    -> (main tier, %mor tier) of the utterance, None if it has no tokens
+
+    Tags with attributes are split into several tokens, e.g. '<$PR малако > молоко <$$PR>'
+    or '<$REP - C>'. The main tier keeps them for clean_special_tags(); on the %mor tier,
+    the opening token and the closing '>' are dropped and the attributes are analyzed as
+    words (the mispronounced form of PR), except those of MARKER_ATTRIBUTE_TAGS.
+    """
+    main_tier_tokens = []
+    mor_tier_tokens = []
+    fs_open = False
+    tag_open = None  # name of the tag whose attributes are being read
+
+    for n, (token_text_raw, pos_class, description) in enumerate(utt.words):
+        if n == 0:
+            if token_text_raw.upper() == utt.speaker.upper() or token_text_raw.upper() == utt.speaker.upper() + ":":
+                continue
+
+        token_text_raw_upper = token_text_raw.upper()
+        if "PAREN" in token_text_raw_upper or "ELAB" in token_text_raw_upper:
+            continue
+
+        # --- Special span control for FS and UNCLEAR markers ---
+        if token_text_raw in {"<$FS>", "<$$FS>", "<$UNCLEAR>", "<$$UNCLEAR>"}:
+            main_tier_tokens.append(token_text_raw)
+            if token_text_raw == "<$FS>": fs_open = True
+            elif token_text_raw == "<$$FS>": fs_open = False
+            continue  # skip adding to %mor
+
+        # Handle direct FoLiA <t> content to CHAT marker (non-lexical)
+        chat_marker_from_t_content = FOLIA_T_CONTENT_TO_CHAT_MARKER.get(token_text_raw)
+        if chat_marker_from_t_content is not None:
+            if chat_marker_from_t_content:
+                main_tier_tokens.append(chat_marker_from_t_content)
+            continue  # skip %mor
+
+        # MAIN tier always keeps lexical/punctuation
+        main_tier_tokens.append(token_text_raw)
+
+        # --- MOR tier construction ---
+        mor_text = token_text_raw
+        if tag_open is not None:
+            marker = tag_open in MARKER_ATTRIBUTE_TAGS
+            if mor_text.endswith('>'):  # end of the attributes, e.g. '>' or 'C>'
+                mor_text = mor_text[:-1].strip()
+                tag_open = None
+            if marker or not mor_text:
+                continue
+        elif mor_text.startswith('<') and not mor_text.endswith('>'):
+            tag_name = re_tag_name.match(mor_text)
+            tag_open = tag_name.group(1).upper() if tag_name else ''
+            continue
+        elif is_nonlexical_token_for_mor(mor_text):
+            continue  # skip any angled-bracket or non-lexical token
+
+        if fs_open:
+            mor_tier_tokens.append(mor_text)
+            continue
+        if re.fullmatch(r"[.?!,;:]", mor_text):
+            mor_tier_tokens.append(mor_text)
+            continue
+
+        if pos_class is not None:
+            mor_pos, feature_str = compile_mor(pos_class, description)
+
+            if mor_pos == "punct":
+                mor_tier_tokens.append(mor_text)
+            else:
+                mor_tier_tokens.append(f"{mor_pos}|{mor_text}{feature_str}")
+        else:
+            mor_tier_tokens.append(f"unk|{mor_text}")
+
+    if not (main_tier_tokens or mor_tier_tokens):
+        return None
+    main_line = apply_main_tier_regex_conversions(clean_special_tags(" ".join(main_tier_tokens))).strip()
+    return main_line, " ".join(mor_tier_tokens)
+
+
+def assemble_chunk(utts):  # utts: list of ChatUtterance
+    """ -> list of assemble_utterance() of utts (run on a worker process) """
+    return [assemble_utterance(utt) for utt in utts]
+
+
+def assemble_utterances(utts, processes=None, chunk_size=None):
+    """
+    utts: list of ChatUtterance
+    processes: number of worker processes (default/1: assemble in this process)
+    chunk_size: number of utterances per chunk (default: ~4 chunks per process)
+    -> iterable of assemble_utterance() of utts, in the same order
+    """
+    if not processes or processes < 2 or len(utts) < 2:
+        return map(assemble_utterance, utts)
+
+    from itertools import chain
+    from multiprocessing import Pool
+
+    if not chunk_size:
+        chunk_size = max(1, -(-len(utts) // (processes * 4)))
+    chunks = [utts[i:i + chunk_size] for i in range(0, len(utts), chunk_size)]
+    with Pool(processes) as pool:
+        # imap keeps the chunks in order
+        return list(chain.from_iterable(pool.imap(assemble_chunk, chunks)))
+
+
+class ChatWriter:
+    """
+    Buffered writer of a CHAT file: lines are collected and written to f in blocks
+    of about block_size characters, instead of one write() per line.
+
+    with ChatWriter(f) as writer:
+        writer.line("@Begin")
+        writer.utterance("CHI", main_line, mor_line)
+    """
+
+    def __init__(self, f, block_size=BLOCK_SIZE):  # f: text stream
+        self.f = f
+        self.block_size = block_size
+        self.buffer = []
+        self.size = 0
+
+    def line(self, text):
+        self.buffer.append(text)
+        self.size += len(text) + 1
+        if self.size >= self.block_size:
+            self.flush()
+
+    def utterance(self, chat_code, main_line, mor_line=None, dependent_lines=()):
+        """ main tier, %mor tier (if any), dependent tiers and the blank line after them """
+        self.line(f"*{chat_code}:\t{main_line}")
+        if mor_line is not None:
+            self.line(f"%mor:\t{mor_line}")
+        for dependent_line in dependent_lines:
+            self.line(dependent_line)
+        self.line("")
+
+    def flush(self):
+        if self.buffer:
+            self.buffer.append("")
+            self.f.write("\n".join(self.buffer))
+            self.buffer = []
+            self.size = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.flush()
+
+
+def write_chat(chat_file, file_name, utts, registry=None, processes=None, chunk_size=None):
+    """
+    chat_file: text stream to write to
+    file_name: name or path of the file converted (FoLiA or CHAT), for the @PID and the metadata
+    utts: list of ChatUtterance
+    other arguments: see convert_folia_to_chat()
+    """
+    with ChatWriter(chat_file) as writer:
+        writer.line("@UTF8")
+        doc_id_base = file_name.split('/')[-1].split('\\')[-1].split('.')[0]
+        writer.line(f"@PID: 11312/{doc_id_base}")
+        writer.line("@Begin")
+
+        filename_only = file_name.split("/")[-1].split("\\")[-1]
+        if registry is None:
+            registry = load_registry()
+        languages = registry.languages(filename_only)
+        child_age = registry.age(filename_only)
+
+        # registered participants, then the other speakers found in the file (unresolved in the
+        # registry unless registered for every child, see metadata.report())
+        speakers_dict = registry.speakers(filename_only) or {}
+        registered = {name.upper() for name in speakers_dict}
+        speakers_dict.update(speakers_and_chat_codes(
+            (utt.speaker for utt in utts if utt.speaker.upper() not in registered), registry, filename_only))
+        codes = {name.upper(): chat_code for name, chat_code in speakers_dict.items()}
+        participants_str = ", ".join([f"{chat} {name}" for name, chat in speakers_dict.items()])
 
+        writer.line(f"@Languages: {languages}")
+        writer.line(f"@Participants: {participants_str}")
+
+        births = []
+        for name, chat_code in speakers_dict.items():
+            participant = registry.participant(filename_only, name)
+            lang_code = participant.language if participant and participant.language else languages.split(",")[0].strip()
+            age_field = child_age if chat_code == "CHI" else ""
+            role = participant.role if participant else ""
+            writer.line(f"@ID: {lang_code}|{filename_only[0]}|{chat_code}|{age_field}||||{role}|{name}|||")  # format inspired by other CHILDES Slavic corpora
+            if participant and participant.birthdate:
+                births.append((chat_code, participant.birthdate))
+        for chat_code, birthdate in births:
+            writer.line(f"@Birth of {chat_code}:\t{chat_date(birthdate)}")
+        session_date = registry.session(filename_only).date
+        if session_date:
+            writer.line(f"@Date:\t{chat_date(session_date)}")
+        writer.line("")
+
+        for utt, tiers in zip(utts, assemble_utterances(utts, processes, chunk_size)):
+            chat_speaker_code = codes[utt.speaker.upper()]
+            if tiers is not None and tiers[0]:
+                writer.utterance(chat_speaker_code, tiers[0], tiers[1], utt.dependents)
+
+        writer.line("@End")
+
+
+def convert_folia_to_chat(folia_file_path, chat_output_path, root=None, registry=None, processes=None,
+                          chunk_size=None):
+    """
+    chat_output_path: CHAT file path, or a text stream to write to
+    root: root element of the already parsed FoLiA file (optional)
+    registry: metadata.Registry of the participants, languages and dates (default: metadata.load_registry())
+    processes, chunk_size: assemble the tiers of chunks of utterances on worker processes
+                           (see assemble_utterances())
+    """
     try:
-        tree = ET.parse(folia_file_path)
-        root = tree.getroot()
+        if root is None:
+            tree = ET.parse(folia_file_path)
+            root = tree.getroot()
     except FileNotFoundError:
         print(f"Error: FoLiA file not found at {folia_file_path}")
         return
@@ -344,115 +529,46 @@ def convert_folia_to_chat(folia_file_path, chat_output_path):
         return
 
     namespace = get_folia_namespace(root)
+    utts = [utterance_record(utt_elem, namespace) for utt_elem in root.findall('.//folia:utt', namespaces=namespace)]
+
+    if hasattr(chat_output_path, 'write'):
+        chat_output = nullcontext(chat_output_path)
+    else:
+        chat_output = open(chat_output_path, 'w', encoding='utf-8')
+    with chat_output as chat_file:
+        write_chat(chat_file, folia_file_path, utts, registry, processes, chunk_size)
+    if not hasattr(chat_output_path, 'write'):
+        print(f"Conversion complete. Output saved to {chat_output_path}")
 
-    with open(chat_output_path, 'w', encoding='utf-8') as chat_file:
-        chat_file.write("@UTF8\n")
-        doc_id_base = folia_file_path.split('/')[-1].split('\\')[-1].split('.')[0]
-        chat_file.write(f"@PID: 11312/{doc_id_base}\n")
-        chat_file.write("@Begin\n")
 
-        filename_only = folia_file_path.split("/")[-1].split("\\")[-1]
-        languages = determine_languages(filename_only)
-        child_age = extract_child_age(filename_only)
+def convert_batch(jobs, prefetch=2, backlog=2, processes=None):
+    """
+    jobs: list of (FoLiA file, CHAT file) (full paths, with extensions)
+    processes: number of worker processes assembling the tiers (see assemble_utterances())
+    -> dict {FoLiA file: exception} of the failed conversions
 
-        speakers_dict = extract_speakers_and_chat_codes(root, namespace)
-        participants_str = ", ".join([f"{chat} {name}" for name, chat in speakers_dict.items()])
+    Parsing of the next FoLiA files and writing of the previous CHAT files overlap
+    with the conversion (see pipeline.run_pipeline()); each CHAT file is written
+    to a temporary file and renamed into place.
+    """
+    from pipeline import run_pipeline
 
-        chat_file.write(f"@Languages: {languages}\n")
-        chat_file.write(f"@Participants: {participants_str}\n")
+    def read(folia_file, chat_file):
+        return ET.parse(folia_file).getroot()
 
-        for name, chat_code in speakers_dict.items():
-            lang_code = languages.split(",")[0].strip()
-            age_field = child_age if chat_code == "CHI" else ""
-            chat_file.write(f"@ID: {lang_code}|{filename_only[0]}|{chat_code}|{age_field}|||||{name}|||\n")  # format inspired by other CHILDES Slavic corpora
-        chat_file.write("\n")
-
-        for utt_elem in root.findall('.//folia:utt', namespaces=namespace):
-            speaker_id_raw = utt_elem.get('speaker', 'UNKNOWN')
-            chat_speaker_code = SPEAKER_CODES.get(speaker_id_raw.upper(), "UNK")
-
-            main_tier_tokens = []
-            mor_tier_tokens = []
-            is_first_token_in_utterance = True
-            fs_open = False
-            unclear_open = False
-
-            for word_elem in utt_elem.findall('.//folia:w', namespaces=namespace):
-                text_elem = word_elem.find('./folia:t', namespaces=namespace)
-                token_text_raw = text_elem.text.strip() if text_elem is not None and text_elem.text else ""
-                if not token_text_raw:
-                    continue
-
-                if is_first_token_in_utterance:
-                    is_first_token_in_utterance = False
-                    if token_text_raw.upper() == speaker_id_raw.upper() or token_text_raw.upper() == speaker_id_raw.upper() + ":":
-                        continue
-
-                token_text_raw_upper = token_text_raw.upper()
-                if "PAREN" in token_text_raw_upper or "ELAB" in token_text_raw_upper:
-                    continue
-
-                # --- Special span control for FS and UNCLEAR markers ---
-                if token_text_raw in {"<$FS>", "<$$FS>", "<$UNCLEAR>", "<$$UNCLEAR>"}:
-                    main_tier_tokens.append(token_text_raw)
-                    if token_text_raw == "<$FS>": fs_open = True
-                    elif token_text_raw == "<$$FS>": fs_open = False
-                    elif token_text_raw == "<$UNCLEAR>": unclear_open = True
-                    elif token_text_raw == "<$$UNCLEAR>": unclear_open = False
-                    continue  # skip adding to %mor
-
-                # Handle direct FoLiA <t> content to CHAT marker (non-lexical)
-                chat_marker_from_t_content = FOLIA_T_CONTENT_TO_CHAT_MARKER.get(token_text_raw)
-                if chat_marker_from_t_content is not None:
-                    if chat_marker_from_t_content:
-                        main_tier_tokens.append(chat_marker_from_t_content)
-                    continue  # skip %mor
-
-                # MAIN tier always keeps lexical/punctuation
-                main_tier_tokens.append(token_text_raw)
-
-                # --- MOR tier construction ---
-                if is_nonlexical_token_for_mor(token_text_raw):
-                    continue  # skip any angled-bracket or non-lexical token
-
-                if fs_open:
-                    mor_tier_tokens.append(token_text_raw)
-                    continue
-                if re.fullmatch(r"[.?!,;:]", token_text_raw):
-                    mor_tier_tokens.append(token_text_raw)
-                    continue
-
-                pos_elem = word_elem.find('.//folia:pos', namespaces=namespace)
-                if pos_elem is not None:
-                    folia_pos_class = pos_elem.get('class', '').strip()
-                    mor_pos = convert_folia_pos_to_mor(folia_pos_class)
-
-                    if mor_pos == "punct":
-                        mor_tier_tokens.append(token_text_raw)
-                    else:
-                        # Extract mapped features
-                        features = extract_features_from_pos(word_elem, namespace)
-                        feature_str = "-" + "-".join(features) if features else ""
-                        mor_tier_tokens.append(f"{mor_pos}|{token_text_raw}{feature_str}")
-                else:
-                    mor_tier_tokens.append(f"unk|{token_text_raw}")
-
-
-            if main_tier_tokens or mor_tier_tokens:
-                main_line = apply_main_tier_regex_conversions(clean_special_tags(" ".join(main_tier_tokens))).strip()
-                mor_line = clean_special_tags(" ".join(mor_tier_tokens)).strip()
-                if "unk|<$REP unk|- unk|C>" in mor_line or "unk|<$$REP unk|- unk|C>" in mor_line or "unk|<$PR unk|" in mor_line or "unk|>" in mor_line:  # clunky work-around
-                    mor_line = mor_line.replace("unk|<$REP unk|- unk|C>", "")
-                    mor_line = mor_line.replace("unk|<$$REP unk|- unk|C>", "")
-                    mor_line = mor_line.replace("unk|<$PR unk|", "")
-                    mor_line = mor_line.replace("unk|>", "")
-
-                if main_line:
-                    chat_file.write(f"*{chat_speaker_code}:\t{main_line}\n")
-                    chat_file.write(f"%mor:\t{mor_line}\n\n")
-
-        chat_file.write("@End\n")
-    print(f"Conversion complete. Output saved to {chat_output_path}")
+    def process(root, folia_file, chat_file):
+        chat = io.StringIO()
+        convert_folia_to_chat(folia_file, chat, root, processes=processes)
+        return chat.getvalue()
+
+    def write(text, path):
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(text)
+
+    def done(text, folia_file, chat_file):
+        print(f"--- Done. Output in {chat_file} ---")
+
+    return run_pipeline(jobs, read, process, write, done, prefetch, backlog)
 
 
 if __name__ == '__main__':
@@ -464,19 +580,16 @@ if __name__ == '__main__':
     if not folia_files:
         print("--- No FoLiA files found ---")
     else:
+        jobs = []
         for actual_folia_file in folia_files:
             folder = os.path.dirname(actual_folia_file)
             base_name = os.path.basename(actual_folia_file)
             # replace `.folia.xml` with `.cha`
             chat_name = base_name.replace(".folia.xml", ".cha")
             actual_chat_output = os.path.join(folder, chat_name)
+            jobs.append((actual_folia_file, actual_chat_output))
 
-            try:
-                with open(actual_folia_file, 'r', encoding='utf-8') as f_check:
-                    pass
-                print(f"--- Converting: {actual_folia_file} ---")
-                convert_folia_to_chat(actual_folia_file, actual_chat_output)
-                print(f"--- Done. Output in {actual_chat_output} ---")
-            except FileNotFoundError:
-                print(f"--- SKIPPING (not found): '{actual_folia_file}' ---")
+        # parsing, conversion and writing pipelined (see convert_batch())
+        for failed_file, error in convert_batch(jobs).items():
+            print(f"--- SKIPPED: '{failed_file}' ({error}) ---")
 
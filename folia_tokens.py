@@ -0,0 +1,257 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+BiRCh FoLiA Token Table Module
+alexluu@brandeis.edu
+
+Input: FoLiA file (.folia.xml) ||https://folia.readthedocs.io/en/latest/
+Output: token table of the file, i.e. list of utterances with their words as
+        (id, text, lemma, pos, description, features, comments) tuples
+
+The table is extracted in one streaming XML pass (no foliapy object tree) and
+cached per file, in memory by modification time and size, and optionally on
+disk by content hash.
+"""
+
+import hashlib
+import os
+import pickle
+import xml.etree.ElementTree as ET
+from collections import OrderedDict, namedtuple
+
+NS_FOLIA = '{http://ilk.uvt.nl/folia}'
+XML_ID = '{http://www.w3.org/XML/1998/namespace}id'
+
+TAG_UTT = NS_FOLIA + 'utt'
+TAG_WORDS = {NS_FOLIA + 'w', NS_FOLIA + 'hiddenw'}  # normal and hidden words
+TAG_T = NS_FOLIA + 't'
+TAG_LEMMA = NS_FOLIA + 'lemma'
+TAG_POS = NS_FOLIA + 'pos'
+TAG_DESC = NS_FOLIA + 'desc'
+TAG_FEAT = NS_FOLIA + 'feat'
+TAG_COMMENT = NS_FOLIA + 'comment'
+TAG_PROCESSOR = NS_FOLIA + 'processor'
+TAG_ALT = NS_FOLIA + 'alt'
+
+# name of the processor (and legacy annotator) of the automatic annotation made by elan2folia
+AUTOMATIC_ANNOTATOR = 'Mystem+'
+# comment of a <pos> keeping the Mystem reading it was made from: 'Mystem+ reading: <wt> <lex> <gr>';
+# 'Mystem+ reading in context: <wt> <lex> <gr>' for the reading Mystem chose in context, be it
+# the annotation or, after elan2folia.redisambiguate(), an alternative
+READING_PREFIX = AUTOMATIC_ANNOTATOR + ' reading: '
+CONTEXT_READING_PREFIX = AUTOMATIC_ANNOTATOR + ' reading in context: '
+# prefix of the comment of a <pos> keeping its Mystem+ feature string, and separator of the ids
+# of the morphology rules applied to the token, when their provenance is kept:
+# 'Mystem+ features: <features>; rules: <id>,<id>'
+FEATURES_PREFIX = AUTOMATIC_ANNOTATOR + ' features: '
+RULES_SEPARATOR = '; rules: '
+# comment of a <w> the Mystem call of its utterance failed on (morphology.GuardedMystem): the
+# annotation was made without Mystem, and the utterance is analyzed again by incremental runs
+UNANALYZED = AUTOMATIC_ANNOTATOR + ' unanalyzed'
+
+# description: str ('' if none); features: tuple of feature classes
+# comments: tuple of str (of the <pos>, then of the <w> itself, e.g. UNANALYZED)
+# manual: True if the lemma or POS annotation was not made by elan2folia (e.g. corrected by hand)
+# readings: stored Mystem readings (lex, wt, gr), the one Mystem chose in context first, then the
+#           others by decreasing weight (ambiguity-preserving mode, see morphology.analyze_readings())
+# chosen: index in readings of the reading of the annotation
+Word = namedtuple('Word', 'id text lemma pos description features comments manual readings chosen',
+                  defaults=((), 0))
+# begintime, endtime: hh:mm:ss.mmm (str, '' if none); words: tuple of Word
+# comments: tuple of utterance-level comments (e.g. dependent tiers, 'label: value')
+Utt = namedtuple('Utt', 'id speaker begintime endtime words comments', defaults=((),))
+
+
+def is_manual(annotation, processors):  # annotation: <lemma> or <pos> element
+    """
+    processors: dict {processor id: (name, type)} declared in the document
+    -> True if the annotation was made by hand or by another tool than elan2folia
+    """
+    if annotation.get('annotatortype') == 'manual':
+        return True
+    annotator = annotation.get('annotator')
+    if annotator is not None and annotator != AUTOMATIC_ANNOTATOR:
+        return True
+    processor = processors.get(annotation.get('processor'))
+    if processor is not None and (processor[1] == 'manual' or processor[0] != AUTOMATIC_ANNOTATOR):
+        return True
+    return False
+
+
+def parse_reading(comment):  # comment: 'Mystem+ reading[ in context]: <wt> <lex> <gr>' (str)
+    """ -> (lex, wt, gr), None if comment is not a reading """
+    for prefix in (READING_PREFIX, CONTEXT_READING_PREFIX):
+        if comment.startswith(prefix):
+            wt, lex, gr = (comment[len(prefix):].split(' ', 2) + ['', ''])[:3]
+            return (lex, float(wt), gr)
+    return None
+
+
+def read_readings(pos):  # pos: <pos> element
+    """ -> list of (reading (lex, wt, gr), True if Mystem chose it in context) """
+    comments = [c.text or '' for c in pos if c.tag == TAG_COMMENT]
+    return [(r, c.startswith(CONTEXT_READING_PREFIX)) for r, c in zip(map(parse_reading, comments), comments) if r]
+
+
+def order_readings(annotated, alternatives):
+    """
+    annotated, alternatives: readings of the annotation and of the alternatives, as read_readings()
+    -> (readings in Mystem's order (see Word), index of the annotated reading); files written
+       before the in-context flag have the reading chosen in context as annotation
+    """
+    readings = annotated + alternatives
+    context = next((k for k, (r, in_context) in enumerate(readings) if in_context), 0)
+    if not readings or context == 0:
+        return tuple(r for r, _ in readings), 0
+    # the others by decreasing weight (stable, as morphology.analyze_readings() sorts them)
+    others = sorted((r for k, (r, _) in enumerate(readings) if k != context), key=lambda r: -r[1])
+    ordered = (readings[context][0],) + tuple(others)
+    return ordered, ordered.index(annotated[0][0]) if annotated else 0
+
+
+def read_word(w, processors=None):  # w: <w> or <hiddenw> element
+    """ -> Word """
+    text = lemma = pos = description = str()
+    features = []
+    comments = []
+    readings = []
+    alternatives = []
+    manual = False
+    processors = processors or {}
+    for child in w:
+        tag = child.tag
+        if tag == TAG_T and not text and child.get('class', 'current') == 'current':
+            text = child.text or ''
+        elif tag == TAG_LEMMA and not lemma:
+            lemma = child.get('class', '')
+            manual = manual or is_manual(child, processors)
+        elif tag == TAG_POS and not pos:
+            pos = child.get('class', '')
+            manual = manual or is_manual(child, processors)
+            for c in child:
+                if c.tag == TAG_DESC:
+                    description += c.text or ''
+                elif c.tag == TAG_FEAT:
+                    features.append(c.get('class', ''))
+                elif c.tag == TAG_COMMENT:
+                    comments.append(c.text or '')
+            readings = read_readings(child)
+        elif tag == TAG_COMMENT:
+            comments.append(child.text or '')
+        elif tag == TAG_ALT:
+            for c in child:
+                if c.tag == TAG_POS:
+                    alternatives.extend(read_readings(c))
+    return Word(w.get(XML_ID), text, lemma, pos, description, tuple(features), tuple(comments), manual,
+                *order_readings(readings, alternatives))
+
+
+def mystem_features(w):  # w: Word
+    """
+    -> Mystem+ feature string of w (with '=', as in records.Token.features), kept in the
+       'Mystem+ features: ' comment unless the description was changed afterwards
+    """
+    for c in w.comments:
+        if c.startswith(FEATURES_PREFIX):
+            features = c[len(FEATURES_PREFIX):].partition(RULES_SEPARATOR)[0]
+            if features.replace('=', ',') == w.description:
+                return features
+    return w.description
+
+
+def is_unanalyzed(w):  # w: Word
+    """ -> True if the Mystem call of the utterance of w failed (see UNANALYZED) """
+    return UNANALYZED in w.comments
+
+
+def word_rules(w):  # w: Word
+    """ -> ids of the morphology rules applied to w, () if their provenance was not kept """
+    for c in w.comments:
+        if c.startswith(FEATURES_PREFIX) and RULES_SEPARATOR in c:
+            return tuple(c.partition(RULES_SEPARATOR)[2].split(','))
+    return ()
+
+
+def foliatime2millisec(t):  # t: hh:mm:ss.mmm (str)
+    """ -> milliseconds (int), None if t is empty """
+    if not t:
+        return None
+    hh, mm, ss = t.split(':')
+    return (int(hh) * 60 + int(mm)) * 60000 + round(float(ss) * 1000)
+
+
+def utterance_words(u):  # u: Utt
+    """ -> words of u without the leading speaker label (e.g. 'МАМА:') written by elan2folia """
+    words = u.words
+    if words and words[0].text == '{}:'.format(u.speaker.upper()):
+        return words[1:]
+    return words
+
+
+def iter_utterances(f_i):
+    """
+    f_i: input (FoLiA) file (full path, with extension) (str)
+    -> iterable of Utt, in document order, without building the whole tree
+    """
+    processors = {}
+    # open elements, so that every read utterance can be removed from its parent
+    stack = []
+    for event, elem in ET.iterparse(f_i, events=('start', 'end')):
+        if event == 'start':
+            stack.append(elem)
+            continue
+        stack.pop()
+        if elem.tag == TAG_PROCESSOR:
+            processors[elem.get(XML_ID)] = (elem.get('name'), elem.get('type', 'auto'))
+        elif elem.tag == TAG_UTT:
+            words = tuple(read_word(w, processors) for w in elem if w.tag in TAG_WORDS)
+            comments = tuple(c.text or '' for c in elem if c.tag == TAG_COMMENT)
+            yield Utt(elem.get(XML_ID), elem.get('speaker', ''),
+                      elem.get('begintime', ''), elem.get('endtime', ''), words, comments)
+            # clear() alone would leave an empty <utt> in the tree for every utterance
+            elem.clear()
+            if stack:
+                stack[-1].remove(elem)
+
+
+# path -> (mtime_ns, size, table), least recently used first;
+# a few files only, the tables of a corpus are kept on disk (see read_tokens(cache_dir))
+_cache = OrderedDict()
+CACHE_SIZE = 4
+# bump when Word, Utt or read_word() change, so that tables pickled by older code are not reused
+TOKENS_VERSION = 1
+
+
+def read_tokens(f_i, cache_dir=None):
+    """
+    f_i: input (FoLiA) file (full path, with extension) (str)
+    cache_dir: directory of on-disk (pickled) tables, keyed by content hash and TOKENS_VERSION (optional)
+    -> list of Utt
+    """
+    path = os.path.abspath(f_i)
+    st = os.stat(path)
+    cached = _cache.get(path)
+    if cached and cached[0] == st.st_mtime_ns and cached[1] == st.st_size:
+        _cache.move_to_end(path)
+        return cached[2]
+
+    table = None
+    if cache_dir:
+        with open(path, 'rb') as f:
+            digest = hashlib.sha1(f.read()).hexdigest()
+        f_cache = os.path.join(cache_dir, 'tokens{}_{}.pkl'.format(TOKENS_VERSION, digest))
+        if os.path.exists(f_cache):
+            with open(f_cache, 'rb') as f:
+                table = pickle.load(f)
+    if table is None:
+        table = list(iter_utterances(path))
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+            with open(f_cache, 'wb') as f:
+                pickle.dump(table, f, pickle.HIGHEST_PROTOCOL)
+
+    _cache[path] = (st.st_mtime_ns, st.st_size, table)
+    _cache.move_to_end(path)
+    while len(_cache) > CACHE_SIZE:
+        _cache.popitem(last=False)
+    return table
@@ -0,0 +1,188 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+BiRCh FoLiA Set Definitions Module
+alexluu@brandeis.edu
+
+Input: FoLiA set definition URLs (e.g. elan2folia.SET_POS) and FoLiA files (.folia.xml)
+Output: compiled class lookups of the set definitions; validation reports of the files
+
+The BiRCh set definitions are bundled in set_definitions/, so their URLs are
+resolved to the local files (no network access); each file is parsed once and
+the compiled lookup is cached for the run.
+
+References:
+https://folia.readthedocs.io/en/latest/set_definitions.html
+"""
+
+import os
+import re
+import xml.etree.ElementTree as ET
+from collections import namedtuple
+from contextlib import contextmanager
+from functools import lru_cache
+
+SET_DEFINITIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'set_definitions')
+SET_DEFINITIONS_URLS = (
+    "https://raw.githubusercontent.com/birch-group/elan2folia/master/set_definitions/",
+    "https://github.com/birch-group/elan2folia/blob/master/set_definitions/",
+    "https://github.com/birch-group/elan2folia/raw/master/set_definitions/",
+)
+
+NS_FOLIA = '{http://ilk.uvt.nl/folia}'
+XML_ID = '{http://www.w3.org/XML/1998/namespace}id'
+
+# classes: dict {class id: label}
+# subsets: dict {subset id: dict {class id: label}}
+# labels: set of all labels of subset classes (i.e. the features as written in <desc>, e.g. 'род2')
+CompiledSet = namedtuple('CompiledSet', 'id type classes subsets labels')
+
+
+def local_path(url):  # url: set definition URL (str)
+    """ -> path of the bundled set definition file, None if url is not a BiRCh set """
+    for prefix in SET_DEFINITIONS_URLS:
+        if url.startswith(prefix):
+            path = os.path.join(SET_DEFINITIONS_DIR, url[len(prefix):])
+            return path if os.path.exists(path) else None
+    if os.path.exists(url):
+        return url
+    return None
+
+
+@lru_cache(maxsize=None)
+def compile_set(url):  # url: set definition URL or path (str)
+    """ -> CompiledSet (parsed once per run) """
+    path = local_path(url)
+    if path is None:
+        raise ValueError('No local set definition for {}'.format(url))
+    root = ET.parse(path).getroot()
+    classes = {c.get(XML_ID): c.get('label', '') for c in root.findall(NS_FOLIA + 'class')}
+    subsets = {}
+    for s in root.findall(NS_FOLIA + 'subset'):
+        subsets[s.get(XML_ID)] = {c.get(XML_ID): c.get('label', '') for c in s.findall(NS_FOLIA + 'class')}
+    labels = {label for subset in subsets.values() for label in subset.values()}
+    return CompiledSet(root.get(XML_ID), root.get('type', 'closed'), classes, subsets, labels)
+
+
+# foliapy integration
+
+@lru_cache(maxsize=None)
+def folia_setdefinition(url):  # url: set definition URL (str)
+    """ -> folia.SetDefinition loaded from the bundled file (cached) """
+    from folia.foliaset import SetDefinition
+
+    return SetDefinition(local_path(url))
+
+
+def preload(doc):  # doc: folia.Document
+    """ make the document use the bundled set definitions for all the BiRCh sets it declares """
+    # doc.annotations: list of (annotation type, set) declarations
+    for _, s in doc.annotations:
+        if s and s not in doc.setdefinitions and local_path(s):
+            doc.setdefinitions[s] = folia_setdefinition(s)
+    return doc
+
+
+@contextmanager
+def offline_sets():
+    """
+    while active, foliapy takes the BiRCh set definitions from set_definitions/
+    and fails the other sets instead of downloading them
+    """
+    import folia.main as folia
+
+    def load(url, **kwargs):
+        if local_path(url) is None:
+            raise folia.DeepValidationError('No local set definition for {}'.format(url))
+        return folia_setdefinition(url)
+
+    # folia.Document.declare() loads the declared sets with folia.main.SetDefinition(url)
+    loader = folia.SetDefinition
+    folia.SetDefinition = load
+    try:
+        yield
+    finally:
+        folia.SetDefinition = loader
+
+
+def load_document(f_i, **kwargs):
+    """
+    f_i: input (FoLiA) file (full path, with extension) (str)
+    -> folia.Document whose BiRCh set definitions come from set_definitions/
+
+    With deepvalidation=True the sets are loaded while the document is parsed,
+    so the loader is replaced for the construction: the BiRCh sets are validated
+    against the bundled files, the other sets (e.g. foliapy's text set) are
+    treated as ad hoc sets rather than downloaded.
+    """
+    import folia.main as folia
+
+    kwargs.setdefault('loadsetdefinitions', False)
+    if kwargs.get('deepvalidation'):
+        kwargs.setdefault('allowadhocsets', True)
+    with offline_sets():
+        return preload(folia.Document(file=f_i, **kwargs))
+
+
+# Fast bulk validation
+
+re_feature = re.compile(r'[а-я0-9-]+')
+
+
+def validate_file(f_i):
+    """
+    f_i: input (FoLiA) file (full path, with extension) (str)
+    -> list of (word id, problem) for every <pos> class, <feat> and <desc> feature
+       that is not defined in the file's POS set
+
+    Single streaming pass: the POS set is taken from the <pos-annotation>
+    declaration (compiled once per set), then every <w> is checked and dropped.
+    """
+    problems = []
+    pos_set = None
+    for _, elem in ET.iterparse(f_i):
+        tag = elem.tag
+        if tag == NS_FOLIA + 'pos-annotation':
+            pos_set = compile_set(elem.get('set'))
+        elif tag == NS_FOLIA + 'w':
+            pos = elem.find(NS_FOLIA + 'pos')
+            if pos is not None and pos_set is not None:
+                wid = elem.get(XML_ID)
+                cls = pos.get('class')
+                if pos_set.type == 'closed' and cls not in pos_set.classes:
+                    problems.append((wid, 'POS class {}'.format(cls)))
+                for feat in pos.findall(NS_FOLIA + 'feat'):
+                    subset = pos_set.subsets.get(feat.get('subset'))
+                    if subset is None or feat.get('class') not in subset:
+                        problems.append((wid, 'feature {}={}'.format(feat.get('subset'), feat.get('class'))))
+                # sets without subsets leave the features free-form
+                for desc in pos.findall(NS_FOLIA + 'desc') if pos_set.subsets else []:
+                    for f in re_feature.findall(desc.text or ''):
+                        if f not in pos_set.labels:
+                            problems.append((wid, 'description feature {}'.format(f)))
+            elem.clear()
+    return problems
+
+
+def validate(fs_i):
+    """
+    fs_i: list of input (FoLiA) files (full path, with extension) (str)
+    -> dict {file: list of problems} for the files with problems
+    """
+    report = {}
+    for f in fs_i:
+        problems = validate_file(f)
+        if problems:
+            report[f] = problems
+    return report
+
+
+if __name__ == "__main__":
+    import sys
+    from collections import Counter
+
+    report = validate(sys.argv[1:])
+    for f, problems in report.items():
+        print(f, len(problems), 'problems')
+        for problem, n in Counter(p for _, p in problems).most_common():
+            print('   ', n, problem)
@@ -0,0 +1,259 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+BiRCh KWIC Module
+alexluu@brandeis.edu
+
+Input: token index (token_index.py) of FoLiA files
+Output: keyword-in-context (concordance) lines of the tokens matching a
+        lemma/POS/feature query, as CSV or CHAT-style lines
+
+The tokens of the whole corpus are kept as columns (arrays of string ids,
+feature masks and utterance numbers), in corpus order, with the offset of
+every utterance's first token, so a context window is a slice of the columns.
+Lemmas, POS tags and word forms have posting lists (token positions), so a
+query only visits its candidates. The store is built from the index once and
+cached next to it (rebuilt when the index changes).
+
+Usage:
+python kwic.py --lemma мама --window 5
+python kwic.py --pos V --feature пов --speaker Ребенок --chat
+"""
+
+import csv
+import os
+import pickle
+import sys
+from array import array
+from collections import namedtuple
+from records import feature_mask, mask2features
+from token_index import INDEX
+
+# left, right: tuples of word forms; keyword: word form; features: list of features
+Line = namedtuple('Line', 'file utterance speaker begin end left keyword right lemma pos features')
+
+
+class TokenStore:
+    """
+    strings:        string table (list of str); all text columns hold ids into it
+    text, lemma, pos: array of string ids, one per token
+    features:       array of feature masks, one per token
+    utt:            array of utterance numbers, one per token
+    utt_offsets:    array, tokens of utterance u are [utt_offsets[u], utt_offsets[u + 1])
+    utt_ids, utt_speakers, utt_files: array of string ids, one per utterance
+    utt_begins, utt_ends: array of times in milliseconds (-1 if none), one per utterance
+    file_offsets:   array, utterances of file k are [file_offsets[k], file_offsets[k + 1])
+    postings:       dict {'lemma'|'pos'|'text': dict {string id: array of token positions}}
+    """
+
+    def __init__(self):
+        self.strings = []
+        self.string_ids = {}
+        self.text, self.lemma, self.pos = array('i'), array('i'), array('i')
+        self.features = array('q')
+        self.utt = array('i')
+        self.utt_offsets = array('i', [0])
+        self.utt_ids, self.utt_speakers, self.utt_files = array('i'), array('i'), array('i')
+        self.utt_begins, self.utt_ends = array('q'), array('q')
+        self.file_offsets = array('i', [0])
+        self.postings = {'lemma': {}, 'pos': {}, 'text': {}}
+
+    def sid(self, s):
+        """ -> id of s in the string table (added if new) """
+        i = self.string_ids.get(s)
+        if i is None:
+            i = self.string_ids[s] = len(self.strings)
+            self.strings.append(s)
+        return i
+
+    def __len__(self):
+        return len(self.text)
+
+    @classmethod
+    def from_index(cls, f_index=INDEX):
+        """ -> TokenStore of all tokens of the token index, in corpus order """
+        import sqlite3
+
+        store = cls()
+        sid = store.sid
+        db = sqlite3.connect(f_index)
+        rows = db.execute('SELECT f.path, u.utt_id, u.speaker, u.begin, u.end, t.text, t.lemma, t.pos, t.features'
+                          ' FROM tokens t JOIN utterances u ON t.utterance = u.id JOIN files f ON u.file = f.id'
+                          ' ORDER BY f.path, u.begin, u.id, t.n')
+        last_file = last_utt = None
+        for path, utt_id, speaker, begin, end, text, lemma, pos, features in rows:
+            if (path, utt_id) != (last_file, last_utt):
+                if path != last_file and last_file is not None:
+                    store.file_offsets.append(len(store.utt_ids))
+                if last_utt is not None:
+                    store.utt_offsets.append(len(store.text))
+                last_file, last_utt = path, utt_id
+                store.utt_ids.append(sid(utt_id))
+                store.utt_speakers.append(sid(speaker))
+                store.utt_files.append(sid(path))
+                store.utt_begins.append(-1 if begin is None else begin)
+                store.utt_ends.append(-1 if end is None else end)
+            store.text.append(sid(text))
+            store.lemma.append(sid(lemma))
+            store.pos.append(sid(pos))
+            store.features.append(features)
+            store.utt.append(len(store.utt_ids) - 1)
+        db.close()
+        store.utt_offsets.append(len(store.text))
+        store.file_offsets.append(len(store.utt_ids))
+
+        for name in store.postings:
+            postings = store.postings[name]
+            for i, s in enumerate(getattr(store, name)):
+                p = postings.get(s)
+                if p is None:
+                    p = postings[s] = array('i')
+                p.append(i)
+        return store
+
+    @classmethod
+    def load(cls, f_index=INDEX):
+        """ -> TokenStore of the token index, from its cache if the index did not change since """
+        f_cache = f_index + '.kwic.pkl'
+        if os.path.exists(f_cache) and os.path.getmtime(f_cache) >= os.path.getmtime(f_index):
+            with open(f_cache, 'rb') as f:
+                return pickle.load(f)
+        store = cls.from_index(f_index)
+        with open(f_cache, 'wb') as f:
+            pickle.dump(store, f, pickle.HIGHEST_PROTOCOL)
+        return store
+
+    def find(self, lemma=None, pos=None, features=(), speaker=None, file=None, text=None):
+        """
+        lemma, pos, speaker, text: exact values (str)
+        features: features that must all be present (list of str)
+        file: FoLiA file, or its basename (str)
+        -> iterable of matching token positions, in corpus order
+        """
+        columns = []
+        for name, value in (('lemma', lemma), ('pos', pos), ('text', text)):
+            if value is not None:
+                i = self.string_ids.get(value)
+                if i is None:
+                    return iter(())
+                columns.append((name, i))
+        if columns:
+            # candidates: the shortest posting list
+            columns.sort(key=lambda c: len(self.postings[c[0]].get(c[1], ())))
+            name, i = columns.pop(0)
+            candidates = self.postings[name].get(i, ())
+        else:
+            candidates = range(len(self))
+        checks = [(getattr(self, name), i) for name, i in columns]
+        mask = feature_mask(','.join(features)) if features else 0
+        if features and len(features) != bin(mask).count('1'):
+            raise ValueError('Unknown features: {}'.format(features))
+        speaker_id = self.string_ids.get(speaker, -1) if speaker is not None else None
+        files = None
+        if file is not None:
+            files = {i for i, s in enumerate(self.strings)
+                     if s == os.path.abspath(file) or s.endswith(os.sep + os.path.basename(file))}
+
+        def matches(p):
+            for column, i in checks:
+                if column[p] != i:
+                    return False
+            if mask and self.features[p] & mask != mask:
+                return False
+            u = self.utt[p]
+            if speaker_id is not None and self.utt_speakers[u] != speaker_id:
+                return False
+            if files is not None and self.utt_files[u] not in files:
+                return False
+            return True
+
+        return (p for p in candidates if matches(p))
+
+    def bounds(self, p, within_utterance=True):
+        """ -> (first, last + 1) token positions that a window around p may span """
+        u = self.utt[p]
+        if within_utterance:
+            return self.utt_offsets[u], self.utt_offsets[u + 1]
+        from bisect import bisect_right
+
+        k = bisect_right(self.file_offsets, u) - 1
+        return self.utt_offsets[self.file_offsets[k]], self.utt_offsets[self.file_offsets[k + 1]]
+
+    def line(self, p, window=5, within_utterance=True):
+        """ -> Line of the token at position p with up to window tokens on each side """
+        s = self.strings
+        first, last = self.bounds(p, within_utterance)
+        u = self.utt[p]
+        return Line(s[self.utt_files[u]], s[self.utt_ids[u]], s[self.utt_speakers[u]],
+                    self.utt_begins[u], self.utt_ends[u],
+                    tuple(s[i] for i in self.text[max(first, p - window):p]),
+                    s[self.text[p]],
+                    tuple(s[i] for i in self.text[p + 1:min(last, p + 1 + window)]),
+                    s[self.lemma[p]], s[self.pos[p]], mask2features(self.features[p]))
+
+
+def kwic(store, window=5, within_utterance=True, limit=None, **query):
+    """
+    store: TokenStore
+    window: number of context tokens on each side
+    within_utterance: keep the context inside the keyword's utterance (else inside its file)
+    query: keyword arguments of TokenStore.find()
+    -> list of Line
+    """
+    lines = []
+    for p in store.find(**query):
+        if limit and len(lines) >= limit:
+            break
+        lines.append(store.line(p, window, within_utterance))
+    return lines
+
+
+def write_csv(lines, f_o=sys.stdout):  # f_o: file object
+    writer = csv.writer(f_o)
+    writer.writerow(['file', 'utterance', 'speaker', 'begin', 'end', 'left', 'keyword', 'right',
+                     'lemma', 'pos', 'features'])
+    for l in lines:
+        writer.writerow([os.path.basename(l.file), l.utterance, l.speaker, l.begin, l.end,
+                         ' '.join(l.left), l.keyword, ' '.join(l.right), l.lemma, l.pos, ','.join(l.features)])
+
+
+def chat_lines(lines):
+    """
+    -> CHAT-style lines, as output by CLAN KWAL: a header per line, then the
+       (windowed) utterance on a speaker tier with its media bullet
+    """
+    from metadata import load_registry
+
+    registry = load_registry()
+    for l in lines:
+        yield '*** File "{}": utterance {}: Keyword: {}'.format(os.path.basename(l.file), l.utterance, l.keyword)
+        context = ' '.join(l.left + (l.keyword,) + l.right)
+        bullet = ' \x15{}_{}\x15'.format(l.begin, l.end) if l.begin >= 0 else ''
+        yield '*{}:\t{}{}'.format(registry.speaker_code(l.file, l.speaker), context, bullet)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Keyword-in-context lines from the token index.")
+    parser.add_argument("--index", default=INDEX, help="index file (see token_index.py)")
+    parser.add_argument("--lemma")
+    parser.add_argument("--pos")
+    parser.add_argument("--feature", action="append", default=[], help="repeatable, e.g. --feature ул")
+    parser.add_argument("--speaker")
+    parser.add_argument("--file")
+    parser.add_argument("--text")
+    parser.add_argument("--window", type=int, default=5)
+    parser.add_argument("--across-utterances", action="store_true", help="let the context cross utterances")
+    parser.add_argument("--limit", type=int)
+    parser.add_argument("--chat", action="store_true", help="CHAT-style lines instead of CSV")
+    args = parser.parse_args()
+
+    lines = kwic(TokenStore.load(args.index), args.window, not args.across_utterances, args.limit,
+                 lemma=args.lemma, pos=args.pos, features=args.feature, speaker=args.speaker,
+                 file=args.file, text=args.text)
+    if args.chat:
+        for line in chat_lines(lines):
+            print(line)
+    else:
+        write_csv(lines)
@@ -0,0 +1,208 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+BiRCh Metadata Module
+alexluu@brandeis.edu
+
+Input: corpus metadata registry, either a directory with sessions.csv and
+       participants.csv, or a JSON file {"sessions": [...], "participants": [...]}
+       with the same columns:
+       sessions:     session (document id, e.g. I_2016_07_18_0), child, date (YYYY-MM-DD),
+                     languages (e.g. 'eng, rus')
+       participants: child, speaker (tier/FoLiA speaker, e.g. Мама), code (CHAT code),
+                     role (CHAT role, e.g. Target_Child), birthdate (YYYY-MM-DD), language;
+                     rows without child apply to every child
+Output: participants, CHAT speaker codes, languages, ages and dates of the
+        corpus files, for the headers of the converters
+
+The registry is loaded once per run and indexed by session and by (child,
+speaker), so resolving a file or a speaker is a dict lookup. Files or speakers
+missing from the registry fall back to the file name conventions
+(determine_languages(), extract_child_age(), SPEAKER_CODES) and are collected
+in Registry.unresolved (see report()).
+"""
+
+import csv
+import json
+import os
+from calendar import monthrange
+from collections import namedtuple
+from datetime import date
+from functools import lru_cache
+
+METADATA = 'metadata'
+
+# Speaker code mapping from FoLiA speaker ID to CHAT code (fallback of the registry)
+SPEAKER_CODES = {
+    "РЕБЕНОК": "CHI", "CHILD": "CHI",
+    "МАМА": "MOT", "MOTHER": "MOT",
+    "ПАПА": "FAT", "FATHER": "FAT",
+    "БАБУШКА": "GRA", "GRANDMOTHER": "GRA",
+    "ДЕДУШКА": "GRF", "GRANDFATHER": "GRF",
+    "UNKNOWN": "UNK",
+}
+
+Session = namedtuple('Session', 'session child date languages')
+Participant = namedtuple('Participant', 'child speaker code role birthdate language')
+
+
+def determine_languages(filename: str) -> str:
+    """Determine @Languages value based on filename prefix."""
+    prefix = filename.split("_")[0]  # e.g., "T" from "T_4-2-24_0.folia.xml"
+    if prefix.startswith(("S", "K", "B", "N", "I")):
+        return "eng, rus"
+    elif prefix.startswith(("A", "L", "M", "Sh")):
+        return "deu, rus"
+    else:
+        return "rus"
+
+
+def extract_child_age(filename: str) -> str:
+    """
+    Extract child age in CHAT format (Y;MM.DD) from filename.
+    """
+    try:
+        parts = filename.split("_")[1].split("-")  # ["4", "2", "24"]
+        years, months, days = parts
+        return f"{int(years)};{int(months):02d}.{int(days):02d}"
+    except Exception:
+        return "0;00.00"  # fallback
+
+
+def parse_date(s):  # s: YYYY-MM-DD (str)
+    """ -> datetime.date, None if s is empty """
+    return date.fromisoformat(s.strip()) if s and s.strip() else None
+
+
+def monthiversary(birthdate, months):  # birthdate: datetime.date; months: int
+    """ -> the date months after birthdate, its day clamped to the end of the month (31 Jan + 1: 28/29 Feb) """
+    year, month = divmod(birthdate.month - 1 + months, 12)
+    year += birthdate.year
+    return date(year, month + 1, min(birthdate.day, monthrange(year, month + 1)[1]))
+
+
+def chat_age(birthdate, on):  # birthdate, on: datetime.date
+    """ -> age in CHAT format (Y;MM.DD): whole months since birthdate, then the days since the last of them """
+    months = (on.year - birthdate.year) * 12 + on.month - birthdate.month
+    if monthiversary(birthdate, months) > on:
+        months -= 1
+    days = (on - monthiversary(birthdate, months)).days
+    return f"{months // 12};{months % 12:02d}.{days:02d}"
+
+
+def doc_id(path):  # path: file name or path (str)
+    """ -> document id, e.g. I_2016_07_18_0 for data/FoLiA/I_2016_07_18_0.folia.xml """
+    return os.path.basename(path).partition('.')[0]
+
+
+class Registry:
+
+    def __init__(self, sessions=(), participants=()):
+        self.sessions = {}      # session -> Session
+        self.participants = {}  # (child, SPEAKER) -> Participant ('' child: any child)
+        self.by_child = {}      # child -> list of Participant, in registry order
+        self.unresolved = {}    # document id -> set of unresolved speakers ('' for the session itself)
+        for row in sessions:
+            s = Session(row['session'].strip(), row.get('child', '').strip(),
+                        parse_date(row.get('date')), row.get('languages', '').strip())
+            self.sessions[s.session] = s
+        for row in participants:
+            p = Participant(row.get('child', '').strip(), row['speaker'].strip(), row.get('code', '').strip(),
+                            row.get('role', '').strip(), parse_date(row.get('birthdate')),
+                            row.get('language', '').strip())
+            self.participants[(p.child, p.speaker.upper())] = p
+            self.by_child.setdefault(p.child, []).append(p)
+
+    def session(self, doc):  # doc: document id or file name (str)
+        """ -> Session of the document (from the file name if it is not in the registry) """
+        doc = doc_id(doc)
+        s = self.sessions.get(doc)
+        if s is None:
+            self.unresolved.setdefault(doc, set()).add('')
+            s = Session(doc, doc.split('_')[0], None, '')
+        return s
+
+    def languages(self, doc):
+        return self.session(doc).languages or determine_languages(doc_id(doc))
+
+    def participant(self, doc, speaker):
+        """ -> Participant of the speaker in the document, None if not in the registry """
+        child = self.session(doc).child
+        p = self.participants.get((child, speaker.upper())) or self.participants.get(('', speaker.upper()))
+        if p is None:
+            self.unresolved.setdefault(doc_id(doc), set()).add(speaker)
+        return p
+
+    def speaker_code(self, doc, speaker):
+        """ -> CHAT code of the speaker in the document """
+        p = self.participant(doc, speaker)
+        if p is not None and p.code:
+            return p.code
+        return SPEAKER_CODES.get(speaker.upper(), "UNK")
+
+    def speakers(self, doc):
+        """
+        -> dict {speaker: CHAT code} of the participants registered for the child of the
+           document (None if there are none, i.e. the speakers have to be collected from the file)
+        """
+        s = self.session(doc)
+        if s.session not in self.sessions or s.child not in self.by_child:
+            return None
+        return {p.speaker: p.code or SPEAKER_CODES.get(p.speaker.upper(), "UNK") for p in self.by_child[s.child]}
+
+    def age(self, doc, speaker=None):
+        """ -> age of the speaker (default: the child) at the session, in CHAT format (Y;MM.DD) """
+        s = self.session(doc)
+        p = None
+        if speaker is not None:
+            p = self.participant(doc, speaker)
+        else:
+            p = next((p for p in self.by_child.get(s.child, ()) if p.code == 'CHI'), None)
+        if p is not None and p.birthdate and s.date:
+            return chat_age(p.birthdate, s.date)
+        return extract_child_age(os.path.basename(doc))
+
+
+def read_csv(f_i):
+    with open(f_i, encoding='utf-8', newline='') as f:
+        return list(csv.DictReader(f))
+
+
+@lru_cache(maxsize=None)
+def load_registry(path=METADATA):
+    """
+    path: registry directory (sessions.csv, participants.csv) or JSON file (str)
+    -> Registry (empty if there is no registry: every file falls back to its file name)
+    """
+    if os.path.isdir(path):
+        sessions = os.path.join(path, 'sessions.csv')
+        participants = os.path.join(path, 'participants.csv')
+        return Registry(read_csv(sessions) if os.path.exists(sessions) else (),
+                        read_csv(participants) if os.path.exists(participants) else ())
+    if os.path.isfile(path):
+        with open(path, encoding='utf-8') as f:
+            data = json.load(f)
+        return Registry(data.get('sessions', ()), data.get('participants', ()))
+    return Registry()
+
+
+def report(fs_i, path=METADATA):
+    """
+    fs_i: list of (FoLiA) files (full path, with extension) (str)
+    -> dict {document id: sorted unresolved speakers ('' for a session missing from the registry)}
+    """
+    from folia_tokens import iter_utterances
+
+    registry = load_registry.__wrapped__(path)  # not the cached one, so unresolved starts empty
+    for f in fs_i:
+        registry.session(f)
+        for speaker in {u.speaker for u in iter_utterances(f)}:
+            registry.participant(f, speaker)
+    return {doc: sorted(speakers) for doc, speakers in registry.unresolved.items()}
+
+
+if __name__ == "__main__":
+    import sys
+
+    for doc, speakers in sorted(report(sys.argv[1:]).items()):
+        print(doc, ', '.join(s or '(session not registered)' for s in speakers), sep='\t')
@@ -3,63 +3,113 @@
 """
 BiRCh Morphological Comparison Module
 alexluu@brandeis.edu
+
+Input: two or more versions (.folia.xml) of the same transcript, e.g. by different annotators
+Output: CSV of the utterances whose annotations differ across the versions
+
+The versions are streamed in lockstep (folia_tokens.iter_utterances()) and
+aligned by utterance id, with a lookahead of a bounded number of utterances
+per version, so an utterance added or removed in some versions does not shift
+the others; memory stays constant in the length of the transcripts. Rows are
+written as soon as an utterance is aligned.
+
+Usage:
+python morphological_comparison.py v1.folia.xml v2.folia.xml [...] [comparison.csv] [--layers=lemma,pos]
 """
+from collections import deque
 from morphological_features import feats_en2ru
+from folia_tokens import iter_utterances
 import csv
-import folia.main as folia
+
+# annotation layers that can be compared; features: description and feature classes
+LAYERS = ('lemma', 'pos', 'features', 'comments')
+# cell of a version without the utterance
+MISSING = '(missing)'
 
 # https://foliapy.readthedocs.io/en/latest/folia.html#features
 # https://folia.readthedocs.io/en/latest/pos_annotation.html#pos-annotation
-def get_annotation(w,flag=False): # w: word token in FoLiA format
-    try:
-        lemma = w.annotation(folia.LemmaAnnotation).cls
-    except folia.NoSuchAnnotation:
-        lemma = ''
+def get_annotation(w,flag=False,layers=LAYERS): # w: word token (folia_tokens.Word)
+    """ layers: compared layers (see LAYERS) """
+    lemma = w.lemma
+    pos_tag = w.pos
 
-    description = "Description: "
+    description = "Description: " + w.description
     features = "Features: "
     comments = "Comments:\n"    
-    try:
-        pos = w.annotation(folia.PosAnnotation)
-        pos_tag = pos.cls
-
-        for i in range(len(pos)):
-            if isinstance(pos[i], folia.Description):
-                description += str(pos.data[i]) # assumption: there is only one description per POS annotation
-            elif isinstance(pos[i], folia.Feature):
-                feat = pos.data[i].cls
-                if feat in feats_en2ru:
-                    feat = feats_en2ru[feat]
-                features += ''.join([feat, ', '])
-            elif isinstance(pos[i], folia.Comment):
-                comments += ''.join([str(pos.data[i]), '\n'])
-    except folia.NoSuchAnnotation:
-        pos_tag = ''
+    for feat in w.features:
+        if feat in feats_en2ru:
+            feat = feats_en2ru[feat]
+        features += ''.join([feat, ', '])
+    for comment in w.comments:
+        comments += ''.join([comment, '\n'])
     # print(description, features, comments)
 
+    annotation = list()
+    if 'lemma' in layers:
+        annotation.append(lemma)
+    if 'pos' in layers:
+        annotation.append(pos_tag)
+    dfc = [s for layer, s in (('features', description), ('features', features), ('comments', comments))
+           if layer in layers]
+    if dfc:
+        annotation.append('\n'.join(dfc))
+
     if flag:
-        # return w.text(), lemma, pos_tag, '\n'.join([description, features, comments]) 
-        return w.text(hidden=True), lemma, pos_tag, '\n'.join([description, features, comments]) 
-    return lemma, pos_tag, '\n'.join([description, features, comments])
+        return (w.text,) + tuple(annotation)
+    return tuple(annotation)
+
+
+def align(streams, lookahead=32):
+    """
+    streams: iterables of utterances (folia_tokens.Utt), one per version, in document order
+    lookahead: number of utterances read ahead in each version
+    -> iterable of lists of utterances with the same id (None for a version without it)
+
+    An utterance is aligned once no version holds its id deeper in its lookahead
+    (i.e. after utterances still to be aligned); an id beyond the lookahead of a
+    version is taken as missing there and aligned again when it comes.
+    """
+    streams = [iter(s) for s in streams]
+    buffers = [deque() for _ in streams]
+    ids = [set() for _ in streams]  # ids in each buffer
+
+    def fill(k):
+        while len(buffers[k]) <= lookahead:
+            u = next(streams[k], None)
+            if u is None:
+                return
+            buffers[k].append(u)
+            ids[k].add(u.id)
+
+    for k in range(len(streams)):
+        fill(k)
+    while any(buffers):
+        heads = [b[0].id for b in buffers if b]
+        # first head that is not waiting in another buffer, else (reordered versions) the first head
+        i = next((h for h in heads if not any(h in ids[k] and buffers[k][0].id != h for k in range(len(buffers)))),
+                 heads[0])
+        group = list()
+        for k, b in enumerate(buffers):
+            u = None
+            if i in ids[k]:
+                u = next(uu for uu in b if uu.id == i)
+                b.remove(u)
+                ids[k].discard(i)
+                fill(k)
+            group.append(u)
+        yield group
 
 
-def compare(fs_i, f_o='data/comparison.csv'):
+def compare(fs_i, f_o='data/comparison.csv', layers=LAYERS, lookahead=32):
     """
     fs_i: list of input (FoLiA) files (full path, with extension) (str)
     f_o: output (CSV) file (full path, with extension) (str)
+    layers: compared annotation layers (see LAYERS), e.g. ('lemma',)
+    lookahead: number of utterances read ahead in each file (see align())
     ...
     """
-
-    # https://pynlpl.readthedocs.io/en/latest/folia.html#reading-folia
-    docs_i = list()
-    speeches_i = list()    
     for f in fs_i:
         print(f)
-        docs_i.append(folia.Document(file=f))
-
-    for d in docs_i:
-        # list of lists of utterances
-        speeches_i.append([u for u in d[0]])
 
     with open(f_o, 'w', encoding='utf-8',newline='') as f:
         print(f_o)
@@ -68,43 +118,55 @@ def compare(fs_i, f_o='data/comparison.csv'):
             [],
             [],
         ]
-        for u in zip(*speeches_i):
-            if len(set(len(uu) for uu in u))==1: # all utterances in u have the same number of tokens
-                flag_diff = [True]*len(u[0]) # annotation contents are different for every tokens across the utterances in u
+        for u in align([iter_utterances(f_i) for f_i in fs_i], lookahead):
+            if all(u) and len(set(len(uu.words) for uu in u))==1: # all utterances in u have the same number of tokens
+                flag_diff = [True]*len(u[0].words) # annotation contents are different for every tokens across the utterances in u
                 
                 morphos_list = list()                
                 for i in range(len(u)):
                     morphos = [fs_i[i]]
-                    for w in u[i]:
-                        morphos.append('\n'.join(get_annotation(w)))
+                    for w in u[i].words:
+                        morphos.append('\n'.join(get_annotation(w, layers=layers)))
                     morphos_list.append(morphos)
-                for i in range(len(u[0])):
+                for i in range(len(u[0].words)):
                     if len(set(m[i+1] for m in morphos_list))==1:
                         flag_diff[i] = False
                         for j in range(len(morphos_list)):
                             morphos_list[j][i+1] = str()
                 if any(flag_diff):
                     writer.writerow([u[0].id, u[0].begintime, u[0].endtime])
-                    # words = [''] + [w.text() for w in u[0]]
-                    words = [''] + [w.text(hidden=True) for w in u[0]]
+                    words = [''] + [w.text for w in u[0].words]
                     writer.writerow(words)
                     writer.writerows(morphos_list)
                     writer.writerows(empty_lines)
 
-            else:
+            else: # missing in some versions, or tokenized differently
+                first = next(uu for uu in u if uu)
+                writer.writerow([first.id, first.begintime, first.endtime])
                 for i in range(len(u)):
+                    if u[i] is None:
+                        writer.writerows([[], [fs_i[i], MISSING]])
+                        writer.writerows(empty_lines)
+                        continue
                     words = ['']
                     morphos = [fs_i[i]]
-                    for w in u[i]:
-                        # words.append(w.text())
-                        words.append(w.text(hidden=True))
-                        morphos.append('\n'.join(get_annotation(w)))
+                    for w in u[i].words:
+                        words.append(w.text)
+                        morphos.append('\n'.join(get_annotation(w, layers=layers)))
                     writer.writerows([words,morphos])
                     writer.writerows(empty_lines)
 
 if __name__ == "__main__":
     import sys
 
+    # --layers=lemma,pos (default: all layers)
+    layers = LAYERS
+    for arg in [a for a in sys.argv if a.startswith('--layers=')]:
+        layers = tuple(l.strip() for l in arg.partition('=')[2].split(','))
+        sys.argv.remove(arg)
+    if not set(layers) <= set(LAYERS):
+        sys.exit('Layers should be among: ' + ', '.join(LAYERS))
+
     message_1 = 'All the input files should be in FoLiA format.'
     message_2 = "We need more than one input FoLiA file to compare."    
     
@@ -113,7 +175,7 @@ if __name__ == "__main__":
             f_o = sys.argv[-1].strip()
             if all(f.endswith('.folia.xml') for f in sys.argv[1:-1]):
                 fs_i = [f.strip() for f in sys.argv[1:-1]]
-                compare(fs_i, f_o)
+                compare(fs_i, f_o, layers)
             else:
                 print(message_1)
         else:
@@ -122,7 +184,7 @@ if __name__ == "__main__":
         if len(sys.argv)>=3:
             if all(f.endswith('.folia.xml') for f in sys.argv[1:]):
                 fs_i = [f.strip() for f in sys.argv[1:]]
-                compare(fs_i)
+                compare(fs_i, layers=layers)
             else:
                 print(message_1)
         else:
@@ -100,4 +100,35 @@ feats_en2ru = {
     # total: 63
 }
 
-# print(len(feats_en2ru))
\ No newline at end of file
+# print(len(feats_en2ru))
+
+# the same table, keyed by the features as written in FoLiA descriptions (Mystem+ output)
+feats_ru2en = {ru: en for en, ru in feats_en2ru.items()}
+
+
+def unmapped_features(dir_set_definitions='set_definitions'):
+    """
+    -> dict {set definition file: sorted list of its features (class labels) missing from feats_ru2en}
+    for every set definition file in dir_set_definitions (empty if every feature is mapped)
+    """
+    import os
+    from foliasets import compile_set
+
+    report = {}
+    for f in sorted(os.listdir(dir_set_definitions)):
+        if not f.endswith('.foliaset.xml'):
+            continue
+        try:
+            s = compile_set(os.path.join(dir_set_definitions, f))
+        except Exception as e:  # e.g. malformed XML
+            print('Skipping {}: {}'.format(f, e))
+            continue
+        missing = sorted(s.labels - feats_ru2en.keys())
+        if missing:
+            report[f] = missing
+    return report
+
+
+if __name__ == "__main__":
+    missing = unmapped_features()
+    print(missing if missing else 'All features of the set definitions are mapped.')
\ No newline at end of file
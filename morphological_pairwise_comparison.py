@@ -5,40 +5,28 @@ BiRCh Morphological Pairwise Comparison Module
 alexluu@brandeis.edu
 """
 from morphological_features import feats_en2ru
+from folia_tokens import read_tokens
 import csv
-import folia.main as folia
 
 # https://foliapy.readthedocs.io/en/latest/folia.html#features
 # https://folia.readthedocs.io/en/latest/pos_annotation.html#pos-annotation
 def get_annotation(w,flag=False):
     """
-    w: word token in FoLiA format 
+    w: word token (folia_tokens.Word)
     flag: if w's text is included in the output
     """
-    try:
-        lemma = w.annotation(folia.LemmaAnnotation).cls
-    except folia.NoSuchAnnotation:
-        lemma = ''
+    lemma = w.lemma
+    pos_tag = w.pos
 
-    description = str()
+    description = w.description
     features = str()
     comments = str()    
-    try:
-        pos = w.annotation(folia.PosAnnotation)
-        pos_tag = pos.cls
-
-        for i in range(len(pos)):
-            if isinstance(pos[i], folia.Description):
-                description += str(pos.data[i]) # assumption: there is only one description per POS annotation
-            elif isinstance(pos[i], folia.Feature):
-                feat = pos.data[i].cls
-                if feat in feats_en2ru:
-                    feat = feats_en2ru[feat]
-                features += ''.join([feat, ', '])
-            elif isinstance(pos[i], folia.Comment):
-                comments += ''.join([str(pos.data[i]), '\n'])
-    except folia.NoSuchAnnotation:
-        pos_tag = ''
+    for feat in w.features:
+        if feat in feats_en2ru:
+            feat = feats_en2ru[feat]
+        features += ''.join([feat, ', '])
+    for comment in w.comments:
+        comments += ''.join([comment, '\n'])
 
     if description:
         description = ' '.join(["Description:", description])
@@ -49,11 +37,8 @@ def get_annotation(w,flag=False):
     dfc = '\n'.join([s for s in [description, features, comments] if s]).strip()
 
     if flag:
-        # https://github.com/proycon/foliapy/blob/master/folia/main.py
-        # lines 1371 (see also 1175, 1513): "hidden (bool): Include hidden elements, defaults to ``False``" 
-        # return w.text(), lemma, pos_tag, dfc
-        # return w[0].text(), lemma, pos_tag, dfc
-        return w.text(hidden=True), lemma, pos_tag, dfc
+        # w can be either a normal word or a hidden word
+        return w.text, lemma, pos_tag, dfc
     return lemma, pos_tag, dfc
 
 
@@ -108,16 +93,17 @@ def compare(fs_i, f_o='data/comparison.csv'):
     ...
     """
 
-    # https://pynlpl.readthedocs.io/en/latest/folia.html#reading-folia
-    docs_i = list()
+    # list of lists of utterances (folia_tokens.Utt)
     speeches_i = list()    
+    # per document: dict {utterance or word id: utterance or word}
+    docs_i = list()
     for f in fs_i:
         print(f)
-        docs_i.append(folia.Document(file=f))
-
-    for d in docs_i:
-        # list of lists of utterances
-        speeches_i.append([u for u in d[0] if isinstance(u, folia.Utterance)])
+        speech = read_tokens(f)
+        speeches_i.append(speech)
+        elements = {u.id: u for u in speech}
+        elements.update((w.id, w) for u in speech for w in u.words)
+        docs_i.append(elements)
 
     ids_utterance = get_ids(*speeches_i)
 
@@ -133,7 +119,7 @@ def compare(fs_i, f_o='data/comparison.csv'):
                 u1 = docs_i[0][i]
                 u2 = docs_i[1][i]
                 morphos_list = list()
-                ids_token = get_ids(u1, u2)
+                ids_token = get_ids(u1.words, u2.words)
                 flag_diff = [True]*len(ids_token)
                 for j in range(2):
                     # 1st element of morphos is the file name
@@ -158,17 +144,15 @@ def compare(fs_i, f_o='data/comparison.csv'):
                     writer.writerows(empty_lines)
 
             else:
-                if i in docs_i[0]:
-                    u = docs_i[0][i]
-                else:
-                    u = docs_i[1][i]
+                j = 0 if i in docs_i[0] else 1
+                u = docs_i[j][i]
 
                 # w: either normal word or hidden word
-                ids_token_plus = [''] + [w.id for w in u]
+                ids_token_plus = [''] + [w.id for w in u.words]
                 # 1st element of morphos is the file name
-                morphos = [fs_i[i]]
+                morphos = [fs_i[j]]
                 # w: either normal word or hidden word
-                for w in u:
+                for w in u.words:
                     morphos.append('\n'.join(get_annotation(w, True)).strip())
                 writer.writerows([ids_token_plus,morphos])
                 writer.writerows(empty_lines)
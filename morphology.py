@@ -12,11 +12,194 @@ References:
 """
 from pickle import load
 from tokenization import *
-from pymystem3 import Mystem
+from bisect import bisect_right
+from time import perf_counter
+import json
+import os
+import queue
 import re
+import subprocess
+import sys
+import threading
+import time
+
+# Mystem with resource limits
+# time budget (in seconds) of a Mystem call (mystem_timeout, unless given to GuardedMystem),
+# and of the Mystem calls of the current file
+# (None: unlimited, see start_file()); failures are appended to failure_log (JSON lines)
+MYSTEM_TIMEOUT = 10.0
+mystem_timeout = MYSTEM_TIMEOUT
+current_file = ''
+file_deadline = None
+failure_log = None
+failures = 0
+
+
+class MystemFailure(Exception):
+    """ a Mystem call failed, or was not made because the time budget of the file is spent """
+
+
+def log_failure(kind, text, error='', seconds=0.0):
+    """
+    kind: 'timeout', 'error' (Mystem crashed or gave no JSON) or 'budget' (per-file budget spent)
+    text: Mystem input (str)
+    """
+    global failures
+    failures += 1
+    print('Mystem {} ({}): {}'.format(kind, current_file, error or text[:80]), file=sys.stderr)
+    if failure_log:
+        with open(failure_log, 'a', encoding='utf-8') as f:
+            f.write(json.dumps({'time': time.strftime('%Y-%m-%dT%H:%M:%S'), 'file': current_file, 'kind': kind,
+                                'seconds': round(seconds, 3), 'error': error, 'text': text},
+                               ensure_ascii=False) + '\n')
+
+
+def start_file(name, budget=None):
+    """
+    name: document id, for the failure log
+    budget: time budget (in seconds) of the Mystem calls of the file (None: unlimited);
+            once spent, the rest of the file is not analyzed by Mystem (see MystemFailure)
+    """
+    global current_file, file_deadline
+    current_file = name
+    file_deadline = time.time() + budget if budget else None
+
+
+class GuardedMystem:
+    """
+    mystem process (the options of pymystem3.Mystem) whose calls are bounded by timeout
+    and by the budget of the file: a call that runs out of time, or a mystem process that
+    crashes, is logged (log_failure()), the process is killed and restarted on the next
+    call, and analyze() raises MystemFailure, so that the utterance is analyzed as if
+    Mystem had no analysis instead of stalling the batch.
+
+    mystem is run with subprocess, pymystem3 only providing the binary (mystem_binary()):
+    a thread writes the input lines and another one reads the answers (a JSON line per
+    input line), so that a call waits with a timeout on every platform, and a long line
+    cannot fill both pipes.
+
+    References:
+    https://yandex.ru/dev/mystem/
+    https://docs.python.org/3/library/subprocess.html
+    https://docs.python.org/3/library/queue.html
+    """
+
+    def __init__(self, mystem_bin=None, grammar_info=True, disambiguation=True, entire_input=True, weight=True,
+                 timeout=None):
+        self.mystem_bin = mystem_bin
+        # https://github.com/nlpub/pymystem3/blob/master/pymystem3/mystem.py
+        self.args = ['--format', 'json']
+        if grammar_info:
+            self.args.append('-gi')
+        if disambiguation:
+            self.args.append('-d')
+        if entire_input:
+            self.args.append('-c')
+        if weight:
+            self.args.append('--weight')
+        self.timeout = timeout
+        self.proc = None
+
+    def start(self):
+        """ start the mystem process (done by the first call) """
+        if self.mystem_bin is None:
+            self.mystem_bin = mystem_binary()
+        self.proc = subprocess.Popen([self.mystem_bin] + self.args,
+                                     stdin=subprocess.PIPE, stdout=subprocess.PIPE, bufsize=0)
+        self.lines = queue.Queue()
+        self.answers = queue.Queue()
+        threading.Thread(target=write_lines, args=(self.proc.stdin, self.lines), daemon=True).start()
+        threading.Thread(target=read_answers, args=(self.proc.stdout, self.answers), daemon=True).start()
+
+    def restart(self):
+        """ kill the mystem process; the next call starts a new one """
+        if self.proc is not None:
+            self.lines.put(None)
+            self.proc.kill()
+            self.proc.wait()
+            self.proc = None
+
+    def analyze(self, text):
+        """ -> Mystem analysis of text (list of dicts), see pymystem3.Mystem.analyze() """
+        if file_deadline is not None and time.time() >= file_deadline:
+            log_failure('budget', text)
+            raise MystemFailure('time budget of {} spent'.format(current_file))
+        start = time.monotonic()
+        try:
+            result = []
+            for line in text.splitlines():
+                result.extend(self.call(line))
+            return result
+        except Exception as e:  # TimeoutError, mystem crash, bad output
+            self.restart()
+            log_failure('timeout' if isinstance(e, TimeoutError) else 'error', text,
+                        '{}: {}'.format(type(e).__name__, e), time.monotonic() - start)
+            raise MystemFailure(str(e)) from e
+
+    def call(self, line):  # line: text without newlines (str)
+        timeout = self.timeout or mystem_timeout
+        if file_deadline is not None:
+            timeout = min(timeout, file_deadline - time.time())
+        deadline = time.monotonic() + timeout
+        if self.proc is None:
+            self.start()
+        self.lines.put(line.encode('utf-8') + b'\n')
+        output = b''
+        while True:
+            try:
+                answer = self.answers.get(timeout=max(deadline - time.monotonic(), 0))
+            except queue.Empty:
+                raise TimeoutError('no answer after {:.1f} s'.format(timeout))
+            if answer is None:
+                raise RuntimeError('mystem closed its output (exited)')
+            output += answer
+            try:
+                return json.loads(output.decode('utf-8'))
+            except ValueError:  # incomplete output
+                continue
+
+
+def mystem_binary():
+    """ -> path of the mystem binary: $MYSTEM_BIN, else pymystem3's (downloaded on first use) """
+    from pymystem3 import MYSTEM_BIN, autoinstall
+
+    if os.environ.get('MYSTEM_BIN'):
+        return os.environ['MYSTEM_BIN']
+    autoinstall()
+    return MYSTEM_BIN
+
+
+def write_lines(stdin, lines):  # lines: queue.Queue of bytes, None to stop
+    """ (thread of GuardedMystem) write the input lines of mystem """
+    try:
+        for line in iter(lines.get, None):
+            stdin.write(line)
+            stdin.flush()
+    except OSError:  # mystem exited, or was killed
+        pass
+    finally:
+        try:
+            stdin.close()
+        except OSError:
+            pass
+
+
+def read_answers(stdout, answers):  # answers: queue.Queue of bytes, None once mystem exited
+    """ (thread of GuardedMystem) read the output lines of mystem """
+    with stdout:
+        for line in iter(stdout.readline, b''):
+            answers.put(line)
+    answers.put(None)
+
 
 # exclude non-word tokens (e.g.{'text':' '} or {'text':'\n'}) from mystem's result list
-m = Mystem(entire_input=False)
+m = GuardedMystem(entire_input=False)
+# all readings of every word, not disambiguated in context (ambiguity-preserving mode);
+# started on first use (see analyze_readings())
+m_readings = None
+# per-rule statistics of analyze_morphology(): dict {rule id: [hits, tokens changed, seconds]},
+# None when not collected (see start_rule_stats())
+rule_stats = None
 
 # info of dict_of_dims
 # key: first two letters of a dims word
@@ -64,12 +247,7 @@ def analyze_mystem_gr(gr_value):  # type(gr_value): str
     return (pos, features)
 
 
-lemmas_colloquial2standard = {  # lower cases
-    'щас': 'сейчас',
-    'че': 'что',
-    # 'чё': 'что',
-    'шо': 'что',
-}
+# lemmas_colloquial2standard: see tokenization.py
 
 re_a_01 = re.compile(r'\(([а-я,]+)\|([а-я,]+)\)')
 
@@ -112,42 +290,110 @@ def get_features_re_v_01(fs):
     return fs
 
 
-# def analyze_morphology(t): # t: contextualized token (str) (see demo())
-def analyze_morphology(pre_t,
-                       t):  # pre_t: list of previous tokens (list of str); t: contextualized token (str) (see demo())
+def normalize_token(token):  # type(token): str
+    """ -> token in lower case, with 'е' instead of 'ё' """
+    return token.lower().replace('ё', 'е')
+
+
+def analyze_mystem(tokens, mystem=None):  # tokens: list of token strings of an utterance
+    """
+    mystem: Mystem instance (default: m)
+    -> list of Mystem analyses (list of dicts, possibly empty), one per token
+
+    The whole utterance is analyzed by a single Mystem call, so every token is
+    disambiguated in its context. The Mystem input is built once per utterance:
+    colloquial forms are replaced with their standard forms, split words are
+    rejoined ('что@ @-нибудь' -> 'что-нибудь') and the '@' of the other second
+    halves is dropped ('ни@ @чего' -> 'ни чего'). Mystem's output is mapped back to the tokens by
+    character offsets (the first word starting within a token's span).
     """
+    analyses = [[] for _ in tokens]
+    if not any(is_token_mystem(t) for t in tokens):
+        return analyses
+    pieces = []
+    starts = []  # offset of each piece in the Mystem input
+    owners = []  # token index of each piece
+    offset = 0
+    len_tokens = len(tokens)
+    i = 0
+    while i < len_tokens:
+        t = tokens[i]
+        j = i + 1
+        if '@' in t and t[0] != '@':
+            if j < len_tokens and tokens[j].startswith('@-'):
+                # the second half ('@-нибудь', '@-то', ...) belongs to the rejoined word;
+                # other second halves ('ни@ @чего', 'кое-@ @что') keep their own analysis
+                t = ''.join([t[:-1], tokens[j][1:]])
+                j += 1
+            else:
+                t = t.replace('@', '')
+        elif t.startswith('@'):
+            t = t[1:]
+        else:
+            t = surface(t).standard
+        if t:
+            pieces.append(t)
+            starts.append(offset)
+            owners.append(i)
+            offset += len(t) + 1
+        i = j
+    text = ' '.join(pieces)
+
+    cursor = 0
+    analyzed = set()
+    for item in (mystem or m).analyze(text):
+        if 'analysis' not in item or not item.get('text'):
+            continue
+        start = text.find(item['text'], cursor)
+        if start < 0:
+            continue
+        cursor = start + len(item['text'])
+        k = bisect_right(starts, start) - 1
+        # only the first word starting within a token's span counts
+        if k >= 0 and start < starts[k] + len(pieces[k]) and owners[k] not in analyzed:
+            analyzed.add(owners[k])
+            analyses[owners[k]] = item['analysis']
+    return analyses
+
+
+def analyze_morphology(tokens, i, analyses=None, provenance=None, stats=True):
+    """
+    tokens: token strings of an utterance (list of str)
+    i: index of the token to analyze in tokens
+    analyses: Mystem analyses of tokens (see analyze_mystem()); computed if not given
+    provenance: list to which the ids of the rules applied to the token are appended (optional)
+    stats: count the rules in rule_stats when collected (see start_rule_stats());
+           False for the other readings of the token (see analyze_reading())
+
     -> (lemma, pos, morphological_features)
 
+    The previous and next tokens are read from tokens (a sliding window),
+    e.g. for 'потому , что'.
+
     Notes: t_bare or lemma are in lower case and do not contain 'ё'
     """
+    stats = stats and rule_stats is not None
+    if stats:
+        start = perf_counter()
     lemma = pos = features = str()
-    # if is_token_mystem(t):
-    # # handle upper/lower cases
-    # t = t.lower()
-    # t_bare = t.split()[0]
-    t_bare_original = t.split()[0]
-    # if is_token_mystem(t_bare):
-    if is_token_mystem(t_bare_original):
-        # handle upper/lower cases
-        # t_bare = t_bare.lower()
-        t_bare = t_bare_original.lower()
-        # replace 'ё' with 'е'
-        t_bare = t_bare.replace('ё', 'е')
-
-        # without Mystem analysis        
-        if t_bare in {'аа', 'оо', 'уу', 'ээ'}:
-            lemma = t_bare
-            pos = 'INTJ'
-        elif t_bare in {'ма'}:
-            lemma = 'мама'
-            pos = 'N'
-            features = 'ед,жен,зват,од'
-
-        # '@-(то|нибудь|либо|...)' or 'кое-@' or 'н(и|e)@'
-        elif t_bare.startswith('@-') or t_bare.endswith('-@') or t_bare == 'ни@' or t_bare == 'не@':
-            # lemma = t_bare.replace('@','').replace('-','')
-            lemma = t_bare.replace('@', '')
-            pos = 'PART'
+    # rule of the chain below and diminutive rule applied to the token (see RULES),
+    # and the analysis before the rules
+    rule = None
+    diminutive = False
+    mystem_analysis = (lemma, pos, features)
+    t_bare_original = tokens[i]
+    # previous tokens
+    pre_t = [tokens[i - 2] if i > 1 else None, tokens[i - 1] if i > 0 else None]
+    s = surface(t_bare_original)
+    if s.mystem:
+        if analyses is None:
+            analyses = analyze_mystem(tokens)
+        # handle upper/lower cases, replace 'ё' with 'е' (cached per surface form)
+        t_bare = s.normalized
+
+        # without Mystem analysis ('аа', 'ма', '@-нибудь', ..., see tokenization.direct_answer())
+        if s.answer is not None:
+            rule, lemma, pos, features = s.answer
 
         # with Mystem analysis        
         # >>> m.analyze('что@ @-нибудь')
@@ -155,17 +401,15 @@ def analyze_morphology(pre_t,
         # >>> m.analyze('что-нибудь')
         # [{'analysis': [{'lex': 'что-нибудь', 'wt': 1, 'gr': 'SPRO,ед,сред,неод=(вин|им)'}], 'text': 'что-нибудь'}]
         elif '@' in t_bare and t_bare[0] != '@':
+            rule = 'split_first_half'
             lemma = t_bare[:-1]
-            try:
-                t = t.replace('@ @', '')
-                pos_plus = m.analyze(t)[0]['analysis'][0]['gr'].strip()
+            analysis_mystem = analyses[i]
+            if analysis_mystem and 'gr' in analysis_mystem[0]:
+                pos_plus = analysis_mystem[0]['gr'].strip()
                 pos, features = analyze_mystem_gr(pos_plus)
-            except:
-                pass
         else:
-            if t_bare in lemmas_colloquial2standard:
-                t = t.replace(t_bare_original, lemmas_colloquial2standard[t_bare], 1)
-            analysis_mystem = m.analyze(t)[0]['analysis']
+            # colloquial forms are replaced with standard ones in analyze_mystem()
+            analysis_mystem = analyses[i]
             if analysis_mystem:
                 # mystem's lexeme (not containing 'ё') -> lemma annotation
                 if 'lex' in analysis_mystem[0]:
@@ -175,22 +419,28 @@ def analyze_morphology(pre_t,
                     pos, features = analyze_mystem_gr(pos_plus)
 
             # post-processing of Mystem analysis
+            mystem_analysis = (lemma, pos, features)
 
             # 'мс' (instead of 'муж|сред') for 'два|оба|полтора'
             if lemma in {'два', 'оба', 'полтора'}:
+                rule = 'мс_gender'
                 features = re.sub(r'муж|сред', r'мс', features)
             # 'соч' for 'а|и|но|или|либо|зато'
             elif lemma in {'а', 'и', 'но', 'или', 'либо', 'зато',
                            'итак'} and pos == 'CONJ':  # 2nd condition may be redundant
+                rule = 'соч'
                 features = ''.join([features, 'соч'])
             # https://birch.flowlu.com/_module/knowledgebase/view/article/487--inache-segmentation
             elif lemma in {'иначе'} and pos == 'CONJ':
+                rule = 'иначе_adv'
                 pos = 'ADV'
             # 'подч' for 'если|чтобы|хотя'
             elif lemma in {'если', 'чтобы', 'хотя', 'чтоб'} and pos == 'CONJ':  # 2nd condition may be redundant
+                rule = 'подч'
                 features = ''.join([features, 'подч'])
                 # if lemma=='что' and pos=='CONJ' and pre_t[-1]:
             elif lemma == 'что' and pos == 'CONJ':
+                rule = 'что_conj'
                 if pre_t[-1] and (pre_t[-1].lower() == 'потому' or \
                                   (pre_t[-1] == ',' and pre_t[-2] and pre_t[-2].lower() == 'потому')):
                     features = ''.join([features, 'подч'])
@@ -199,66 +449,85 @@ def analyze_morphology(pre_t,
                     features = 'им,ед,неод,сред'
             # https://docs.google.com/spreadsheets/d/1Oq3U-8YiucFqtMdNtqW6QOI1pq-zWRNfpx8JM994kd4/edit#gid=489388285
             elif lemma in {'просто', 'прямо'} and pos == 'PART':
+                rule = 'просто_прямо_adv'
                 pos = 'ADV'
             elif lemma in {'итак'} and pos == 'CONJ':
+                rule = 'итак_adv'
                 pos = 'ADV'
             # https://docs.google.com/document/d/1pLZdm3x-9Ob_Lo6WHPNVvHoOvUGuqqG8NdPi5ESqWfk/edit?disco=AAAAG9koUG4?
             elif lemma in {'вон', 'вот', 'во'} and pos == 'PART':
+                rule = 'вон_вот_во_advpro'
                 pos = 'ADVPRO'
             elif lemma in {'как'} and pos == 'CONJ':
+                rule = 'как_advpro'
                 pos = 'ADVPRO'
             # ('ADV', ('вводн',))
             elif lemma in {'по-моему'} and pos == 'ADV':
+                rule = 'по-моему_advpro'
                 pos = 'ADVPRO'
             elif lemma in {'да', 'нет', 'ага', 'ладно'} and pos == 'PART':
+                rule = 'да_нет_part_intj'
                 pos = 'INTJ'
             elif lemma in {'да'} and pos == 'CONJ':
+                rule = 'да_conj_intj'
                 pos = 'INTJ'
                 # 'мм' / 'мм-мм-мм' ('N', ('муж', 'неиз', 'неод'))
             # 'мда' ('N', ('муж', 'неиз', 'од'))
             # 'кач' ('N', ('ед', 'им', 'муж', 'од', 'фам'))
             # 'кач' needs some post-processing (~качать~ (идеофон))
             elif lemma in {'мм', 'кач', 'мда'} and pos == 'N':
+                rule = 'мм_кач_мда_intj'
                 pos = 'INTJ'
                 features = ''
             elif t_bare == 'у-у' and pos == 'PR':
+                rule = 'у-у_intj'
                 lemma = t_bare
                 pos = 'INTJ'
                 # ('N', ('имя', 'муж', 'неиз', 'од'))
             elif lemma in {'ауа'} and pos == 'N':
+                rule = 'ауа_nw'
                 pos = 'NW'
                 features = ''
             # ('N', ('неиз', 'сокр'))
             elif lemma in {'в', 'с'} and pos == 'N':
+                rule = 'в_с_pr'
                 pos = 'PR'
                 features = ''
 
             # the modification involves features
             elif lemma in {'интересно', 'отлично', 'правильно', 'верно', 'нужно'} and pos == 'ADV':
+                rule = 'кр_adj'
                 lemma = ''.join([t_bare[:-1], 'ый'])
                 pos = 'A'
                 features = 'ед,кр,прдк,сред'
             elif lemma in {'сколько'} and (pos == 'CONJ' or pos == 'ADV'):
+                rule = 'сколько_advpro'
                 pos = 'ADVPRO'
                 # features = 'квант'
             # ('N', ('неиз', 'сокр')) or ('PART', ())              
             elif lemma in {'а'} and (pos == 'N' or pos == 'PART'):
+                rule = 'а_conj'
                 pos = 'CONJ'
                 features = 'соч'
             elif t_bare in {'не-а'} and pos == 'PART':
+                rule = 'не-а_intj'
                 lemma = t_bare
                 pos = 'INTJ'
                 features = 'разг'
             elif lemma in {'пожалуйста'} and pos == 'PART':
+                rule = 'пожалуйста_n'
                 pos = 'N'
                 features = 'неиз,неод,сред'
             elif lemma in {'это'} and pos == 'PART':
+                rule = 'это_npro'
                 pos = 'NPRO'
                 features = 'неиз,неод,сред'
             elif t_bare in {'@что'} and pos == 'CONJ':
+                rule = '@что_npro'
                 pos = 'NPRO'
                 features = 'им,ед,неод,сред'
             elif t_bare in {'@чего'} and pos == 'ADVPRO':
+                rule = '@чего_npro'
                 lemma = 'что'
                 pos = 'NPRO'
                 features = 'род,ед,неод,сред'
@@ -268,21 +537,25 @@ def analyze_morphology(pre_t,
             # {'analysis': [{'lex': 'я', 'wt': 0.9999549915, 'gr': 'SPRO,ед,1-л=(вин|род)'}], 'text': 'меня'}, {'analysis': [{'lex': 'нет', 'wt': 0.464233437, 'gr': 'ADV,прдк='}], 'text': 'нет'}]
             # ('ADV', ('прдк',))
             elif lemma in {'нету', 'нет'} and pos == 'ADV':
+                rule = 'нет_предик'
                 pos = 'PART'
                 features = 'отрп,предик'
             # >>> m.analyze("нет, шоколадка.") 
             # [{'analysis': [{'lex': 'нет', 'wt': 0.5356555854, 'gr': 'PART='}], 'text': 'нет'}, {'analysis': [{'lex': 'шоколадка', 'wt': 1, 'gr': 'S,жен,неод=им,ед'}], 'text': 'шоколадка'}]
             # ('PART', ())
             elif lemma in {'нет'} and pos == 'PART':
+                rule = 'нет_intj'
                 pos = 'INTJ'
             # ('ADV', ('вводн',))
             elif t_bare == 'значит' and pos == 'ADV':
+                rule = 'значит_v'
                 lemma = 'значить'
                 pos = 'V'
                 # 'вводн'?
                 features = '3-л,вводн,ед,изъяв,непрош,несов'
             # ('ADV', ('вводн',))
             elif t_bare == 'кажется' and pos == 'ADV':
+                rule = 'кажется_v'
                 lemma = 'казаться'
                 pos = 'V'
                 # 'вводн'?
@@ -290,6 +563,7 @@ def analyze_morphology(pre_t,
 
             # https://docs.google.com/spreadsheets/d/1obsEkDX0ChzFkvjA9nURmqVpkSrg802U-kvtHnO6faA/edit#gid=1114179687
             elif pos in {'A', 'APRO'}:
+                rule = 'adj_features'
                 features = get_features_re_a_01(features)
                 # https://birch.flowlu.com/_module/knowledgebase/view/article/650--prdk
                 feats = re_features.findall(features)
@@ -302,26 +576,32 @@ def analyze_morphology(pre_t,
             # } and pos=='ADV':
             #     features = ','.join([features,'квант'])
             elif lemma in {'кофе'} and pos == 'N':
+                rule = 'кофе_n'
                 features = 'неод,неиз,мс'
             elif lemma in {
                 'воспитатель', 'врач', 'грязнуля', 'доктор', 'зайка', 'молодец',
                 'повар', 'полицейский', 'продавец', 'умница', 'учитель',
                 'умничек',
             } and pos == 'N' and 'муж' in features:
+                rule = 'мж_муж'
                 features = re.sub(r'муж', r'мж', features)
             elif lemma in {
                 'маська',
             } and pos == 'N' and 'жен' in features:
+                rule = 'мж_жен'
                 features = re.sub(r'жен', r'мж', features)
             elif pos == 'NPRO':
+                rule = 'npro_features'
                 if '(пр|вин|род)' in features:
                     features = re.sub(r'\(пр\|вин\|род\)', r'род', features)
                 if lemma in {'они'}:
                     features = ','.join([features, '3-л'])
             elif lemma in {'не'} and pos == 'PART':
+                rule = 'не_отрп'
                 features = 'отрп'
             # 'будем' needs both steps (e.g. "И будем может быть летом даже ночевать .")
             elif pos == 'V':
+                rule = 'verb_features'
                 features = get_features_re_v_01(features)
                 if lemma in {'быть'} and ('непрош' in features or 'пов' in features) and \
                         'несов' not in features:
@@ -345,30 +625,220 @@ def analyze_morphology(pre_t,
                 'пюрешка',
                 'масечка', 'маська',
             }:
+                diminutive = True
                 features = ','.join([features, 'ул'])
 
+    if rule is not None or diminutive:
+        fired = [r for r in (rule, 'ул' if diminutive else None) if r]
+        if provenance is not None:
+            provenance.extend(fired)
+        if stats:
+            count_rules(fired, (lemma, pos, features) != mystem_analysis, perf_counter() - start)
+    elif stats and s.mystem:
+        count_rules(('mystem',), False, perf_counter() - start)
     return (lemma, pos, features)
 
 
+# Rule instrumentation
+# ids of the rules of analyze_morphology(), in the order they are tried;
+# 'mystem': Mystem's analysis kept as is, 'ул': the diminutive rule (applied after the others),
+# 'unanalyzed': the Mystem call of the utterance failed (see GuardedMystem), the token is
+# analyzed as if Mystem had no analysis
+RULES = ('vowel_intj', 'ма_мама', 'split_particle', 'split_first_half',
+         'мс_gender', 'соч', 'иначе_adv', 'подч', 'что_conj', 'просто_прямо_adv', 'итак_adv',
+         'вон_вот_во_advpro', 'как_advpro', 'по-моему_advpro', 'да_нет_part_intj', 'да_conj_intj',
+         'мм_кач_мда_intj', 'у-у_intj', 'ауа_nw', 'в_с_pr', 'кр_adj', 'сколько_advpro', 'а_conj',
+         'не-а_intj', 'пожалуйста_n', 'это_npro', '@что_npro', '@чего_npro', 'нет_предик', 'нет_intj',
+         'значит_v', 'кажется_v', 'adj_features', 'кофе_n', 'мж_муж', 'мж_жен', 'npro_features',
+         'не_отрп', 'verb_features', 'mystem', 'ул', 'unanalyzed')
+
+
+def count_rules(fired, changed, seconds):
+    """
+    fired: ids of the rules applied to a token
+    changed: True if they changed the analysis of the token
+    seconds: time of the analysis of the token, counted for each of its rules
+    """
+    for rule in fired:
+        stats = rule_stats.get(rule)
+        if stats is None:
+            stats = rule_stats[rule] = [0, 0, 0.0]
+        stats[0] += 1
+        stats[1] += changed
+        stats[2] += seconds
+
+
+def start_rule_stats():
+    """ count the rules applied by analyze_morphology() from now on (in rule_stats) """
+    global rule_stats
+    rule_stats = {}
+
+
+def stop_rule_stats():
+    """ -> rule_stats collected since start_rule_stats(); stop counting """
+    global rule_stats
+    stats, rule_stats = rule_stats, None
+    return stats or {}
+
+
+def merge_rule_stats(total, stats):
+    """ add stats into total (both dicts {rule id: [hits, tokens changed, seconds]}) """
+    for rule, (hits, changed, seconds) in stats.items():
+        t = total.setdefault(rule, [0, 0, 0.0])
+        t[0] += hits
+        t[1] += changed
+        t[2] += seconds
+    return total
+
+
+def write_rule_stats(stats, f_o):
+    """
+    stats: dict {rule id: [hits, tokens changed, seconds]} (see start_rule_stats())
+    f_o: output (CSV) file (full path, with extension) (str)
+    One row per rule of RULES, the rules that never applied included.
+    """
+    import csv
+
+    with open(f_o, 'w', encoding='utf-8', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['rule', 'hits', 'changed', 'seconds', 'microseconds_per_hit'])
+        for rule in RULES + tuple(sorted(set(stats).difference(RULES))):
+            hits, changed, seconds = stats.get(rule, (0, 0, 0.0))
+            writer.writerow([rule, hits, changed, round(seconds, 6), round(seconds * 1e6 / hits, 2) if hits else ''])
+
+
+def analyze_tokens(tokens, readings=False, provenance=False):  # tokens: list of records.Token
+    """
+    Fill lemma, pos and features of every token in place,
+    with a single Mystem call for all the tokens (see analyze_mystem())
+    readings: also keep all Mystem readings of every token (see analyze_readings())
+    provenance: also keep the ids of the rules applied to every token (Token.rules)
+    If the Mystem call fails, the rules of the tokens Mystem would have analyzed end with
+    'unanalyzed', provenance or not, so that their utterance is not cached (see
+    elan2folia.analyze_conversation())
+    """
+    surfaces = [token.surface for token in tokens]
+    try:
+        analyses = analyze_mystem(surfaces)
+        unanalyzed = False
+    except MystemFailure:  # logged: the tokens are analyzed without Mystem
+        analyses = [[] for _ in surfaces]
+        unanalyzed = True
+    if unanalyzed and rule_stats is not None:
+        count_rules(('unanalyzed',) * sum(map(is_token_mystem, surfaces)), False, 0.0)
+    for i in range(len(surfaces)):
+        if provenance:
+            rules = []
+            tokens[i].set_analysis(*analyze_morphology(surfaces, i, analyses, rules))
+            tokens[i].rules = tuple(rules)
+        else:
+            tokens[i].set_analysis(*analyze_morphology(surfaces, i, analyses))
+        if unanalyzed and is_token_mystem(surfaces[i]):
+            tokens[i].rules = tuple(tokens[i].rules) + ('unanalyzed',)
+    if readings:
+        for token, r in zip(tokens, analyze_readings(surfaces, analyses)):
+            token.readings = r
+    return tokens
+
+
+# Ambiguity-preserving mode
+# A reading is a tuple (lex, wt, gr) of a Mystem analysis; the rules of analyze_morphology()
+# can be applied again to stored readings, with another choice of reading, without Mystem.
+
+def reading(analysis):  # analysis: dict of a Mystem analysis
+    """ -> (lex, wt, gr) """
+    return (analysis.get('lex', ''), float(analysis.get('wt', 0.0)), analysis.get('gr', '').strip())
+
+
+def analyze_readings(tokens, analyses=None):
+    """
+    tokens: token strings of an utterance (list of str)
+    analyses: Mystem analyses of tokens in context (see analyze_mystem()); computed if not given
+    -> list of readings per token (tuple of (lex, wt, gr)): the reading Mystem chose in
+       context first, then the other readings by decreasing weight
+    """
+    global m_readings
+    if m_readings is None:
+        m_readings = GuardedMystem(entire_input=False, disambiguation=False)
+    if analyses is None:
+        analyses = analyze_mystem(tokens)
+    try:
+        all_readings = analyze_mystem(tokens, m_readings)
+    except MystemFailure:  # logged: only the readings chosen in context
+        all_readings = [[] for _ in tokens]
+    result = []
+    for chosen, others in zip(analyses, all_readings):
+        readings = [reading(a) for a in chosen[:1]]
+        seen = {(r[0], r[2]) for r in readings}
+        for r in sorted((reading(a) for a in others), key=lambda r: -r[1]):
+            if (r[0], r[2]) not in seen:
+                seen.add((r[0], r[2]))
+                readings.append(r)
+        result.append(tuple(readings))
+    return result
+
+
+def analyze_reading(tokens, i, reading=None):
+    """
+    -> (lemma, pos, morphological_features) of tokens[i] if Mystem had given reading
+       (lex, wt, gr) (no reading: as if Mystem had no analysis)
+
+    The rules are not counted in rule_stats: the token was counted once, with the
+    reading of its annotation, when it was analyzed (see analyze_tokens()).
+    """
+    analyses = [[] for _ in tokens]  # analyze_morphology() reads analyses[i] only
+    if reading is not None:
+        analyses[i] = [{'lex': reading[0], 'wt': reading[1], 'gr': reading[2]}]
+    return analyze_morphology(tokens, i, analyses, stats=False)
+
+
+# disambiguation policies: readings (tuple of (lex, wt, gr)) -> index of the chosen reading
+def policy_mystem(readings):
+    """ the first stored reading: Mystem's choice in context (kept first by elan2folia.redisambiguate()) """
+    return 0
+
+
+def policy_max_wt(readings):
+    """ the reading of highest weight, regardless of context """
+    return max(range(len(readings)), key=lambda k: readings[k][1])
+
+
+POLICIES = {'mystem': policy_mystem, 'max_wt': policy_max_wt}
+
+
+def disambiguate(tokens, readings, policy=policy_max_wt, memo=None):
+    """
+    tokens: token strings of an utterance (list of str)
+    readings: stored readings of the tokens (see analyze_readings()), () if none
+    policy: function choosing a reading (see POLICIES)
+    memo: dict reused across utterances and files, so that the rules run once per distinct
+          (window, reading) (analyze_morphology() only looks two tokens back)
+    -> list of (index of the chosen reading or None, (lemma, pos, morphological_features))
+    """
+    if memo is None:
+        memo = {}
+    result = []
+    for i, token in enumerate(tokens):
+        k = policy(readings[i]) if readings[i] else None
+        chosen = readings[i][k] if k is not None else None
+        key = (tokens[i - 2] if i > 1 else None, tokens[i - 1] if i > 0 else None, token,
+               chosen and (chosen[0], chosen[2]))
+        analysis = memo.get(key)
+        if analysis is None:
+            analysis = memo[key] = analyze_reading(tokens, i, chosen)
+        result.append((k, analysis))
+    return result
+
+
 # contextualize: # e.g.: 'в' as 'PR' vs 'S,сокр'
-# t = tokens[i]
-# if i < (len(tokens) - 1): t = ' '.join([t,tokens[i+1]])
+# the whole utterance is the context (see analyze_mystem())
 def demo(utt):  # utt: utterance string
     """
     """
     tokens = get_tokens(utt)
     print(tokens)
-    len_tokens = len(tokens)
-    for i in range(len_tokens):
-        t = tokens[i]
-        print(t)
-        pre_t = [None, None]
-        if i > 1:
-            pre_t = [tokens[i - 2], tokens[i - 1]]
-        elif i == 1:
-            pre_t[1] = tokens[i - 1]
-        print(pre_t)
-        if i < (len_tokens - 1):
-            t = ' '.join([t, tokens[i + 1]])
-        print(t)
-        print(analyze_morphology(pre_t, t))
+    analyses = analyze_mystem(tokens)
+    for i in range(len(tokens)):
+        print(tokens[i])
+        print(analyses[i])
+        print(analyze_morphology(tokens, i, analyses))
@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+BiRCh Batch Pipeline Module
+alexluu@brandeis.edu
+
+Input: batch of (input file, output file) jobs and the stages of a converter
+Output: the output files, each written to a temporary file and renamed into place
+
+The stages run concurrently, connected by bounded queues:
+
+    prefetch thread  --(prefetch inputs)-->  this thread  --(backlog results)-->  writer thread
+    read(f_i, f_o)                           process(...)                          write(...)
+
+so reading the next files and writing the previous ones overlap with the
+analysis (which stays in the calling thread, with its Mystem process). A full
+queue blocks the stage feeding it (back-pressure), bounding memory.
+
+References:
+https://docs.python.org/3/library/queue.html
+"""
+
+import os
+import queue
+import threading
+
+_DONE = object()
+
+
+def write_atomically(write, f_o):
+    """
+    write: function writing the output to the path it is given
+    f_o: output file (full path, with extension) (str)
+
+    The output is written to a temporary file in the same directory, then renamed
+    to f_o, so f_o is either the previous or the complete new version, never partial.
+    """
+    tmp = '{}.{}.tmp'.format(f_o, os.getpid())
+    try:
+        write(tmp)
+        os.replace(tmp, f_o)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+
+
+def run_pipeline(jobs, read, process, write, done=None, prefetch=2, backlog=2):
+    """
+    jobs: list of (f_i, f_o) (full paths, with extensions) (str)
+    read: (f_i, f_o) -> data; run on the prefetch thread
+    process: (data, f_i, f_o) -> result; run on this thread
+    write: (result, path) -> None, writes result to path; run on the writer thread
+    done: (result, f_i, f_o) -> None, after f_o is in place; run on the writer thread (optional)
+    prefetch: number of inputs read ahead
+    backlog: number of results waiting to be written
+    -> dict {f_i: exception} of the failed jobs (the others are done)
+    """
+    inputs = queue.Queue(maxsize=prefetch)
+    results = queue.Queue(maxsize=backlog)
+    failed = {}
+
+    def prefetcher():
+        for f_i, f_o in jobs:
+            try:
+                inputs.put((f_i, f_o, read(f_i, f_o), None))
+            except Exception as e:
+                inputs.put((f_i, f_o, None, e))
+        inputs.put(_DONE)
+
+    def writer():
+        while True:
+            item = results.get()
+            if item is _DONE:
+                return
+            result, f_i, f_o = item
+            try:
+                write_atomically(lambda path: write(result, path), f_o)
+                if done is not None:
+                    done(result, f_i, f_o)
+            except Exception as e:
+                print('Error writing {}: {}'.format(f_o, e))
+                failed[f_i] = e
+
+    threads = [threading.Thread(target=prefetcher, daemon=True), threading.Thread(target=writer)]
+    for t in threads:
+        t.start()
+    try:
+        while True:
+            item = inputs.get()
+            if item is _DONE:
+                break
+            f_i, f_o, data, error = item
+            if error is not None:
+                print('Error reading {}: {}'.format(f_i, error))
+                failed[f_i] = error
+                continue
+            try:
+                result = process(data, f_i, f_o)
+            except Exception as e:
+                print('Error converting {}: {}'.format(f_i, e))
+                failed[f_i] = e
+                continue
+            results.put((result, f_i, f_o))
+    finally:
+        results.put(_DONE)
+        threads[1].join()
+    return failed
@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+BiRCh Records Module
+alexluu@brandeis.edu
+
+Internal data model of the conversion pipeline:
+EAF reader -> Utterance -> tokenization -> Token -> morphology -> FoLiA/CHAT writers
+
+Records use __slots__ (no per-instance __dict__). Lemma, POS and feature
+strings are interned, so equal values are shared by all tokens and act as
+ids (comparable by identity); features can also be read as a bit mask over
+the canonical feature list (feature_mask()).
+
+Memory (CPython 3.11, 64-bit, measured with measure_memory(), including the
+pointer in the containing list):
+    Token:     88 bytes per token plus its surface string
+               (a dict-based object with the same fields: ~360 bytes)
+    Utterance: 96 bytes plus its text and the list of tokens
+"""
+
+import re
+import sys
+from functools import lru_cache
+from morphological_features import feats_en2ru
+
+
+class Utterance:
+    """
+    id:         annotation ID in the ELAN file (str)
+    speaker:    tier ID (str)
+    begin, end: times in milliseconds (int)
+    text:       transcript value (str)
+    tokens:     list of Token (filled by tokenization)
+    dependents: list of (dependent tier label, value) attached to the utterance
+    """
+    __slots__ = ('id', 'speaker', 'begin', 'end', 'text', 'tokens', 'dependents')
+
+    def __init__(self, id, speaker, begin, end, text, tokens=None, dependents=None):
+        self.id = id
+        self.speaker = sys.intern(speaker)
+        self.begin = begin
+        self.end = end
+        self.text = text
+        self.tokens = tokens if tokens is not None else []
+        self.dependents = dependents if dependents is not None else []
+
+    def __repr__(self):
+        return 'Utterance({!r}, {!r}, {}, {}, {!r})'.format(self.id, self.speaker, self.begin, self.end, self.text)
+
+
+class Token:
+    """
+    surface:  token string as produced by tokenization (str)
+    lemma:    lemma ('' if none) (str)
+    pos:      POS tag ('' if none) (str)
+    features: Mystem+ feature string, e.g. 'муж,неод=(вин,ед|им,ед)' ('' if none) (str)
+    readings: all Mystem readings (lex, wt, gr), the one Mystem chose in context first, in the
+              ambiguity-preserving mode (see morphology.analyze_readings()) (tuple)
+    rules:    ids of the morphology rules applied to the token, when their provenance
+              is kept (see morphology.RULES); 'unanalyzed' if the Mystem call failed (tuple)
+    chosen:   index in readings of the reading analyzed (see elan2folia.redisambiguate()) (int)
+    """
+    __slots__ = ('surface', 'lemma', 'pos', 'features', 'readings', 'rules', 'chosen')
+
+    def __init__(self, surface, lemma='', pos='', features='', readings=(), rules=(), chosen=0):
+        self.surface = surface
+        self.lemma = lemma
+        self.pos = pos
+        self.features = features
+        self.readings = readings
+        self.rules = rules
+        self.chosen = chosen
+
+    def set_analysis(self, lemma, pos, features):
+        self.lemma = sys.intern(lemma)
+        self.pos = sys.intern(pos)
+        self.features = sys.intern(features)
+
+    @property
+    def feature_mask(self):
+        return feature_mask(self.features)
+
+    def __repr__(self):
+        return 'Token({!r}, {!r}, {!r}, {!r})'.format(self.surface, self.lemma, self.pos, self.features)
+
+
+# canonical feature list: bit i of a feature mask stands for FEATURES[i]
+FEATURES = tuple(dict.fromkeys(feats_en2ru.values()))
+FEATURE_BITS = {f: 1 << i for i, f in enumerate(FEATURES)}
+re_feature = re.compile(r'[а-я0-9-]+')
+
+
+@lru_cache(maxsize=None)
+def feature_mask(features):  # features: feature string (str)
+    """
+    -> int with the bits of all features occurring in the string
+
+    Ambiguous feature strings ('(вин,ед|им,ед)') set the bits of every reading.
+    """
+    mask = 0
+    for f in re_feature.findall(features):
+        mask |= FEATURE_BITS.get(f, 0)
+    return mask
+
+
+def mask2features(mask):  # mask: int
+    """ -> list of features of a feature mask, in canonical order """
+    return [f for f in FEATURES if mask & FEATURE_BITS[f]]
+
+
+def measure_memory(n=100000):
+    """ -> bytes allocated per Token and per Utterance (averaged over n records) """
+    import tracemalloc
+
+    tracemalloc.start()
+    base = tracemalloc.get_traced_memory()[0]
+    tokens = [Token(None) for _ in range(n)]
+    per_token = (tracemalloc.get_traced_memory()[0] - base) / n
+    base = tracemalloc.get_traced_memory()[0]
+    utterances = [Utterance(None, '', 0, 0, None, tokens, tokens) for _ in range(n)]
+    per_utterance = (tracemalloc.get_traced_memory()[0] - base) / n
+    tracemalloc.stop()
+    return per_token, per_utterance
+
+
+if __name__ == "__main__":
+    print('bytes per token: {:.0f}, per utterance: {:.0f}'.format(*measure_memory()))
@@ -0,0 +1,268 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+BiRCh Regression Module
+alexluu@brandeis.edu
+
+Input: pinned corpus of ELAN files (data/regression/ELAN), their golden FoLiA
+       files (data/regression/FoLiA) and a recording of the Mystem calls made
+       when converting them (data/regression/mystem.json.gz)
+Output: report of the annotations (lemma, POS, features) and tokenizations of
+        the current code that differ from the golden files, grouped by change
+
+The corpus is reconverted in this process with the Mystem calls served from
+the recording (no mystem binary needed), and compared with the golden files
+read as token tables (folia_tokens.py), without writing any FoLiA. Changed
+tokens are grouped by the morphology rules applied to them (morphology.RULES,
+kept in the golden files too) and by what changed, e.g.
+'vowel_intj -> mystem: INTJ -> N +ед ...', 'а_conj: PART -> CONJ +соч'.
+
+Usage:
+python regression.py record data/ELAN/I_2016_07_18_0.eaf ...
+    (with mystem) pin the files, record their Mystem calls and write the golden files;
+    the corpus is recorded with the real mystem binary only (the stub mystem of the
+    tests, tests/stub_mystem.py, is refused), e.g.
+    python regression.py record data/regression/ELAN/I_2016_07_18_0.eaf
+python regression.py bless
+    write the golden files from the current code, after checking the changes
+python regression.py check
+    exit status 1 if any annotation changed or a Mystem input was not recorded
+"""
+
+import gzip
+import json
+import os
+import re
+import shutil
+import time
+from collections import namedtuple
+from eaf import read_eaf
+from folia_tokens import iter_utterances, utterance_words, word_rules
+
+REGRESSION = 'data/regression'
+STUB_MYSTEM = 'tests/stub_mystem.py'
+
+# token: position of the token in the utterance (None for a change of the utterance or its tokens)
+# layer: 'utterance', 'tokens' (tokenization), or '<rules>: <signature()>' for an annotation change
+# old, new: golden and current values ('' if none)
+Change = namedtuple('Change', 'file utterance token surface layer old new')
+
+re_feature = re.compile(r'[^,=|()]+')
+
+
+class RecordedMystem:
+    """
+    Stand-in for morphology.m serving analyze() from a recording {text: result}.
+    live: Mystem instance analyzing (and recording) the texts missing from the recording;
+          without it, they are analyzed as unknown words and collected in missing
+    """
+
+    def __init__(self, recording, live=None):
+        self.recording = recording
+        self.live = live
+        self.missing = set()
+
+    def analyze(self, text):
+        result = self.recording.get(text)
+        if result is None:
+            if self.live is None:
+                self.missing.add(text)
+                return []
+            result = self.recording[text] = self.live.analyze(text)
+        return result
+
+
+def without_mystem():
+    """ let morphology be imported without a mystem binary (replaying never starts its Mystem) """
+    from pymystem3 import mystem
+
+    if not os.environ.get('MYSTEM_BIN') and not os.path.exists(mystem.MYSTEM_BIN):
+        os.environ['MYSTEM_BIN'] = mystem.MYSTEM_BIN
+
+
+def recorded(dir_r=REGRESSION):
+    """ -> whether the Mystem calls of the pinned corpus have been recorded """
+    return os.path.exists(os.path.join(dir_r, 'mystem.json.gz'))
+
+
+def load_recording(dir_r=REGRESSION):
+    with gzip.open(os.path.join(dir_r, 'mystem.json.gz'), 'rt', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def save_recording(recording, dir_r=REGRESSION):
+    with gzip.open(os.path.join(dir_r, 'mystem.json.gz'), 'wt', encoding='utf-8') as f:
+        json.dump(recording, f, ensure_ascii=False, sort_keys=True)
+
+
+def corpus(dir_r=REGRESSION):
+    """ -> list of (ELAN file, golden FoLiA file) of the pinned corpus """
+    dir_i = os.path.join(dir_r, 'ELAN')
+    return [(os.path.join(dir_i, f), os.path.join(dir_r, 'FoLiA', f.replace('.eaf', '.folia.xml')))
+            for f in sorted(os.listdir(dir_i)) if f.endswith('.eaf')]
+
+
+def analyze(f_i, mystem):
+    """
+    f_i: input (ELAN) file (full path, with extension) (str)
+    mystem: Mystem instance, or RecordedMystem, used in place of morphology.m
+    -> list of analyzed records.Utterance, as elan2folia.convert() analyzes them
+    """
+    import morphology
+    from elan2folia import get_aas, create_conversation, analyze_conversation
+
+    doc_i = read_eaf(f_i)
+    utts, deps = doc_i.select()
+    conversation = create_conversation(get_aas(doc_i, utts, doc_i.dependents(utts, deps)))
+    m, morphology.m = morphology.m, mystem
+    try:
+        return list(analyze_conversation(conversation, provenance=True))
+    finally:
+        morphology.m = m
+
+
+def write_golden(f_i, f_o, mystem):
+    """ convert f_i to f_o as elan2folia.convert() does, with mystem in place of morphology.m """
+    import morphology
+    from elan2folia import build_document
+    from pipeline import write_atomically
+
+    os.makedirs(os.path.dirname(f_o), exist_ok=True)
+    m, morphology.m = morphology.m, mystem
+    try:
+        doc_o = build_document(read_eaf(f_i), f_o, provenance=True)
+    finally:
+        morphology.m = m
+    write_atomically(doc_o.save, f_o)
+
+
+def record(fs_i, dir_r=REGRESSION):
+    """
+    fs_i: ELAN files to pin (full path, with extension) (str)
+    Copy fs_i into the pinned corpus, convert the whole corpus with Mystem, recording its
+    calls, and write the golden files.
+    """
+    import morphology
+
+    mystem_bin = morphology.mystem_binary()
+    if os.path.exists(STUB_MYSTEM) and os.path.samefile(mystem_bin, STUB_MYSTEM):
+        raise ValueError('The pinned corpus is recorded with the real mystem, not with {}'.format(mystem_bin))
+    os.makedirs(os.path.join(dir_r, 'ELAN'), exist_ok=True)
+    for f in fs_i:
+        pinned = os.path.join(dir_r, 'ELAN', os.path.basename(f))
+        if not (os.path.exists(pinned) and os.path.samefile(f, pinned)):
+            shutil.copy2(f, pinned)
+    mystem = RecordedMystem({}, morphology.m)
+    for f_i, f_o in corpus(dir_r):
+        write_golden(f_i, f_o, mystem)
+    save_recording(mystem.recording, dir_r)
+
+
+def bless(dir_r=REGRESSION):
+    """ write the golden files of the pinned corpus from the current code -> unrecorded Mystem inputs """
+    without_mystem()
+    mystem = RecordedMystem(load_recording(dir_r))
+    for f_i, f_o in corpus(dir_r):
+        write_golden(f_i, f_o, mystem)
+    return mystem.missing
+
+
+def feature_set(description):  # description: features as in the FoLiA <desc> (str)
+    return set(re_feature.findall(description))
+
+
+def signature(old, new):  # old: golden folia_tokens.Word; new: records.Token
+    """ -> what changed in the annotation of a token, e.g. 'PART -> INTJ', 'A +прдк', 'N lemma' """
+    parts = [old.pos if old.pos == new.pos else '{} -> {}'.format(old.pos or '-', new.pos or '-')]
+    old_features, new_features = feature_set(old.description), feature_set(re.sub(r'=', r',', new.features))
+    parts.extend('+' + f for f in sorted(new_features - old_features))
+    parts.extend('-' + f for f in sorted(old_features - new_features))
+    if old.lemma != new.lemma:
+        parts.append('lemma')
+    return ' '.join(parts)
+
+
+def rules(old, new):  # old: golden folia_tokens.Word; new: records.Token
+    """ -> ids of the rules applied to the token, e.g. 'а_conj', or 'vowel_intj -> mystem' if they changed """
+    old_rules, new_rules = ','.join(word_rules(old)) or 'mystem', ','.join(new.rules) or 'mystem'
+    return new_rules if old_rules == new_rules else '{} -> {}'.format(old_rules, new_rules)
+
+
+def diff(utts, f_golden):
+    """
+    utts: analyzed records.Utterance of a file
+    f_golden: golden (FoLiA) file of the same ELAN file (full path, with extension) (str)
+    -> list of Change
+    """
+    name = os.path.basename(f_golden)
+    golden = {u.id: utterance_words(u) for u in iter_utterances(f_golden)}
+    changes = []
+    for utt in utts:
+        words = golden.pop(utt.id, None)
+        surfaces = ' '.join(t.surface for t in utt.tokens)
+        if words is None:
+            changes.append(Change(name, utt.id, None, '', 'utterance', '', surfaces))
+            continue
+        if [w.text for w in words] != [t.surface for t in utt.tokens]:
+            changes.append(Change(name, utt.id, None, '', 'tokens', ' '.join(w.text for w in words), surfaces))
+            continue
+        for n, (w, t) in enumerate(zip(words, utt.tokens)):
+            description = re.sub(r'=', r',', t.features)
+            if (w.lemma, w.pos, w.description) != (t.lemma, t.pos, description):
+                changes.append(Change(name, utt.id, n, t.surface,
+                                      '{}: {}'.format(rules(w, t), signature(w, t)),
+                                      '{} {} {}'.format(w.lemma, w.pos, w.description).strip(),
+                                      '{} {} {}'.format(t.lemma, t.pos, description).strip()))
+    for utt_id, words in golden.items():
+        changes.append(Change(name, utt_id, None, '', 'utterance', ' '.join(w.text for w in words), ''))
+    return changes
+
+
+def check(dir_r=REGRESSION):
+    """ -> (list of Change, unrecorded Mystem inputs, number of tokens) of the pinned corpus """
+    without_mystem()
+    mystem = RecordedMystem(load_recording(dir_r))
+    changes = []
+    n_tokens = 0
+    for f_i, f_golden in corpus(dir_r):
+        utts = analyze(f_i, mystem)
+        n_tokens += sum(len(utt.tokens) for utt in utts)
+        changes.extend(diff(utts, f_golden))
+    return changes, mystem.missing, n_tokens
+
+
+def report(changes, examples=3):  # changes: list of Change
+    """ -> lines of the report, groups of changes by number of tokens """
+    groups = {}
+    for c in changes:
+        groups.setdefault(c.layer, []).append(c)
+    lines = []
+    for layer, cs in sorted(groups.items(), key=lambda g: (-len(g[1]), g[0])):
+        lines.append('{:6d}  {}'.format(len(cs), layer))
+        for c in cs[:examples]:
+            where = c.utterance if c.token is None else '{}#{} {}'.format(c.utterance, c.token, c.surface)
+            lines.append('        {} {}: {} -> {}'.format(c.file, where, c.old or '-', c.new or '-'))
+    return lines
+
+
+if __name__ == "__main__":
+    import sys
+
+    command = sys.argv[1] if len(sys.argv) > 1 else 'check'
+    if command != 'record' and not recorded():
+        sys.exit('No recorded corpus in {}: run python regression.py record <ELAN files> first'.format(REGRESSION))
+    if command == 'record':
+        record(sys.argv[2:])
+    elif command == 'bless':
+        missing = bless()
+        if missing:
+            print(len(missing), 'Mystem inputs not recorded (run record again)')
+    elif command == 'check':
+        start = time.perf_counter()
+        changes, missing, n_tokens = check()
+        print('\n'.join(report(changes)))
+        print('{} of {} tokens changed, {} Mystem inputs not recorded ({:.1f} s)'.format(
+            sum(c.token is not None for c in changes), n_tokens, len(missing), time.perf_counter() - start))
+        sys.exit(1 if changes or missing else 0)
+    else:
+        sys.exit(__doc__)
@@ -0,0 +1,243 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+BiRCh Output Sinks Module
+alexluu@brandeis.edu
+
+Input: stream of analyzed utterances of a document (records.Utterance), e.g.
+       from elan2folia.convert()
+Output: the document in other formats than FoLiA: CHAT (.cha), CoNLL-U
+        (.conllu) and a token table for spreadsheets (.tsv)
+
+A sink consumes the utterances as they are analyzed: begin() with the document
+id and its speakers, add() for every utterance in order, then save() writes the
+output to the path it is given (through pipeline.write_atomically()). All the
+sinks of a conversion share one analysis pass, so an extra format costs its own
+serialization only, not another analysis or a parse of the FoLiA output
+(elan2folia.FoliaSink writes the FoLiA file itself).
+
+Usage:
+python elan2folia.py --formats=chat,conllu,tsv
+
+References:
+https://talkbank.org/manuals/CHAT.html
+https://universaldependencies.org/format.html
+https://universaldependencies.org/ru/
+"""
+
+import csv
+import re
+from abc import ABC, abstractmethod
+
+# extensions of the outputs, replacing '.folia.xml' in the FoLiA output path
+FOLIA_EXTENSION = '.folia.xml'
+
+
+def sink_path(f_o, extension):  # f_o: output (FoLiA) file (str)
+    """ -> path of an output next to f_o, e.g. data/FoLiA/X.folia.xml -> data/FoLiA/X.cha """
+    if f_o.endswith(FOLIA_EXTENSION):
+        return f_o[:-len(FOLIA_EXTENSION)] + extension
+    return f_o + extension
+
+
+def description(t):  # t: records.Token
+    """ -> features of the token as written in the FoLiA <desc> ('муж,неод,вин,ед') """
+    return re.sub(r'=', r',', t.features)
+
+
+class Sink(ABC):
+    """
+    Output of a conversion, consuming the analyzed utterances of one document.
+    path: output file (full path, with extension) (str)
+    Subclasses implement add() and save().
+    """
+    extension = ''
+
+    def __init__(self, path):
+        self.path = path
+
+    def begin(self, doc_id, speakers):
+        """ doc_id: document id (str); speakers: speakers (tier IDs) of the document (list of str) """
+        self.doc_id = doc_id
+
+    @abstractmethod
+    def add(self, utt):  # utt: analyzed records.Utterance
+        pass
+
+    @abstractmethod
+    def save(self, path):  # path: file to write (a temporary file renamed to self.path)
+        pass
+
+
+class TextSink(Sink):
+    """ sink collecting the lines of a text output """
+
+    def begin(self, doc_id, speakers):
+        super().begin(doc_id, speakers)
+        self.lines = []
+
+    def save(self, path):
+        with open(path, 'w', encoding='utf-8', newline='') as f:
+            f.write('\n'.join(self.lines))
+            f.write('\n')
+
+
+class ChatSink(Sink):
+    """
+    CHAT file, the same as folia2chat.convert_folia_to_chat() makes of the FoLiA output
+    registry: metadata.Registry (default: metadata.load_registry())
+    processes: number of worker processes assembling the tiers (see folia2chat.assemble_utterances())
+    """
+    extension = '.cha'
+
+    def __init__(self, path, registry=None, processes=None):
+        super().__init__(path)
+        self.registry = registry
+        self.processes = processes
+
+    def begin(self, doc_id, speakers):
+        super().begin(doc_id, speakers)
+        self.utts = []
+
+    def add(self, utt):
+        from folia2chat import ChatUtterance, dependent_tier_lines
+
+        # as in the FoLiA output: the speaker label, then the tokens
+        words = [('{}:'.format(utt.speaker.upper()), None, '')]
+        for t in utt.tokens:
+            surface = t.surface.strip()
+            if surface:
+                words.append((surface, t.pos.strip(), description(t)) if t.pos else (surface, None, ''))
+        self.utts.append(ChatUtterance(utt.speaker, tuple(words),
+                                       tuple(dependent_tier_lines(': '.join(d) for d in utt.dependents))))
+
+    def save(self, path):
+        from folia2chat import write_chat
+
+        with open(path, 'w', encoding='utf-8') as f:
+            write_chat(f, self.path, self.utts, self.registry, self.processes)
+
+
+# Mystem+ POS -> UD UPOS (CONJ: by its feature, see conllu_upos())
+UPOS = {
+    'A': 'ADJ', 'ANUM': 'ADJ', 'APRO': 'DET',
+    'ADV': 'ADV', 'ADVPRO': 'ADV',
+    'CONJ': 'CCONJ',
+    'INTJ': 'INTJ',
+    'N': 'NOUN', 'NUM': 'NUM',
+    'PART': 'PART', 'PR': 'ADP',
+    'NPRO': 'PRON', 'SPRO': 'PRON',
+    'V': 'VERB',
+    'COM': 'X', 'NW': 'X', 'X': 'X',
+}
+
+# Mystem+ features -> UD features; the others are kept in MISC (Features=...)
+UD_FEATURES = {
+    'муж': ('Gender', 'Masc'), 'жен': ('Gender', 'Fem'), 'сред': ('Gender', 'Neut'),
+    'од': ('Animacy', 'Anim'), 'неод': ('Animacy', 'Inan'),
+    'ед': ('Number', 'Sing'), 'мн': ('Number', 'Plur'),
+    'им': ('Case', 'Nom'), 'род': ('Case', 'Gen'), 'род2': ('Case', 'Par'), 'дат': ('Case', 'Dat'),
+    'вин': ('Case', 'Acc'), 'твор': ('Case', 'Ins'), 'пр': ('Case', 'Loc'), 'местн': ('Case', 'Loc'),
+    'зват': ('Case', 'Voc'),
+    '1-л': ('Person', '1'), '2-л': ('Person', '2'), '3-л': ('Person', '3'),
+    'кр': ('Variant', 'Short'),
+    'срав': ('Degree', 'Cmp'), 'прев': ('Degree', 'Sup'),
+    'несов': ('Aspect', 'Imp'), 'сов': ('Aspect', 'Perf'),
+    'наст': ('Tense', 'Pres'), 'непрош': ('Tense', 'Pres'), 'прош': ('Tense', 'Past'),
+    'деепр': ('VerbForm', 'Conv'), 'инф': ('VerbForm', 'Inf'), 'прич': ('VerbForm', 'Part'),
+    'изъяв': ('Mood', 'Ind'), 'пов': ('Mood', 'Imp'),
+    'действ': ('Voice', 'Act'), 'страд': ('Voice', 'Pass'),
+}
+
+re_alternatives = re.compile(r'\([^)]*\)')
+
+
+def conllu_upos(t):  # t: records.Token
+    if not t.pos:
+        return 'PUNCT' if re.fullmatch(r'[.?!,;:]+', t.surface) else 'X'
+    pos = t.pos.split('-')[0].upper()
+    if pos == 'CONJ' and 'подч' in t.features:
+        return 'SCONJ'
+    return UPOS.get(pos, 'X')
+
+
+def conllu_feats(t):  # t: records.Token
+    """ -> (FEATS, MISC) of the token; ambiguous features (Mystem's alternatives) are left to MISC """
+    feats = {}
+    for f in re_alternatives.sub('', description(t)).split(','):
+        if f in UD_FEATURES:
+            name, value = UD_FEATURES[f]
+            feats[name] = value
+    # '|' separates the MISC items: Mystem's alternatives '(вин|им)' are written '(вин/им)'
+    misc = ['Features=' + description(t).replace('|', '/')] if t.features else []
+    if t.rules:
+        misc.append('Rules=' + ','.join(t.rules))
+    return ('|'.join('{}={}'.format(k, feats[k]) for k in sorted(feats, key=str.lower)) or '_',
+            '|'.join(misc) or '_')
+
+
+def conllu_field(value):  # value: str
+    """ CoNLL-U fields cannot contain tabs or newlines, nor be empty """
+    return re.sub(r'[\t\n\r]+', ' ', value) or '_'
+
+
+class ConlluSink(TextSink):
+    """
+    CoNLL-U file: one sentence per utterance, with its id, speaker and times as comments;
+    XPOS is the Mystem+ POS, and the Mystem+ features are in MISC (no syntax: HEAD, DEPREL '_')
+    """
+    extension = '.conllu'
+
+    def begin(self, doc_id, speakers):
+        super().begin(doc_id, speakers)
+        self.lines.append('# newdoc id = {}'.format(doc_id))
+
+    def add(self, utt):
+        lines = self.lines
+        lines.append('# sent_id = {}'.format(utt.id))
+        lines.append('# speaker = {}'.format(utt.speaker))
+        lines.append('# begin = {}'.format(utt.begin))
+        lines.append('# end = {}'.format(utt.end))
+        lines.append('# text = {}'.format(conllu_field(' '.join(t.surface for t in utt.tokens))))
+        for n, t in enumerate(utt.tokens, 1):
+            feats, misc = conllu_feats(t)
+            lines.append('\t'.join([str(n), conllu_field(t.surface), conllu_field(t.lemma), conllu_upos(t),
+                                    conllu_field(t.pos), feats, '_', '_', '_', misc]))
+        lines.append('')
+
+
+class TsvSink(Sink):
+    """ token table (tab-separated, one row per token) for spreadsheets """
+    extension = '.tsv'
+    COLUMNS = ('utterance', 'speaker', 'begin', 'end', 'n', 'surface', 'lemma', 'pos', 'features', 'rules')
+
+    def begin(self, doc_id, speakers):
+        super().begin(doc_id, speakers)
+        self.rows = []
+
+    def add(self, utt):
+        self.rows.extend((utt.id, utt.speaker, utt.begin, utt.end, n, t.surface, t.lemma, t.pos, description(t),
+                          ','.join(t.rules))
+                         for n, t in enumerate(utt.tokens, 1))
+
+    def save(self, path):
+        with open(path, 'w', encoding='utf-8', newline='') as f:
+            writer = csv.writer(f, delimiter='\t', lineterminator='\n')
+            writer.writerow(self.COLUMNS)
+            writer.writerows(self.rows)
+
+
+# sinks by format name, for elan2folia.convert_batch() and its command line ('folia': elan2folia.FoliaSink)
+SINKS = {'chat': ChatSink, 'conllu': ConlluSink, 'tsv': TsvSink}
+
+
+def make_sinks(formats, f_o):
+    """
+    formats: names of the formats (see SINKS), e.g. ('chat', 'tsv')
+    f_o: output (FoLiA) file (full path, with extension) (str)
+    -> list of Sink writing next to f_o
+    """
+    unknown = set(formats) - SINKS.keys()
+    if unknown:
+        raise ValueError('Unknown formats: {}'.format(', '.join(sorted(unknown))))
+    return [SINKS[name](sink_path(f_o, SINKS[name].extension)) for name in formats]
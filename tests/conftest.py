@@ -0,0 +1,62 @@
+"""
+BiRCh tests
+the modules are imported from the repository root, which is also the working directory
+(morphology.py loads dict_of_dims_lower.pkl from it)
+
+Usage:
+python -m pytest tests
+"""
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.chdir(ROOT)
+
+
+STUB = os.path.join(ROOT, 'tests', 'stub_mystem.py')
+SAMPLE = os.path.join('data', 'I_2016_07_18_0.eaf')
+
+
+def stub_mystems():
+    """ -> (m, m_readings) as in morphology, running the stub mystem (stub_mystem.py) """
+    import morphology
+
+    return (morphology.GuardedMystem(mystem_bin=STUB, entire_input=False),
+            morphology.GuardedMystem(mystem_bin=STUB, entire_input=False, disambiguation=False))
+
+
+@pytest.fixture
+def stub_mystem(monkeypatch):
+    """ morphology.m and morphology.m_readings run the stub mystem """
+    import morphology
+
+    m, m_readings = stub_mystems()
+    monkeypatch.setattr(morphology, 'm', m)
+    monkeypatch.setattr(morphology, 'm_readings', m_readings)
+    yield m
+    m.restart()
+    m_readings.restart()
+
+
+@pytest.fixture(scope='session')
+def sample_folia(tmp_path_factory):
+    """ FoLiA file of the sample ELAN file (SAMPLE), converted with the stub mystem and rule provenance """
+    pytest.importorskip('folia')
+    import morphology
+    from eaf import read_eaf
+    from elan2folia import build_document
+
+    f_o = str(tmp_path_factory.mktemp('folia') / 'I_2016_07_18_0.folia.xml')
+    mystems = stub_mystems()
+    saved = morphology.m, morphology.m_readings
+    morphology.m, morphology.m_readings = mystems
+    try:
+        build_document(read_eaf(SAMPLE), f_o, provenance=True).save(f_o)
+    finally:
+        morphology.m, morphology.m_readings = saved
+        for m in mystems:
+            m.restart()
+    return f_o
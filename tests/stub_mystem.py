@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Stub mystem: answers as mystem does with --format json (one JSON line per input line),
+from a small lexicon of frequent words; every other word is a feminine inanimate noun.
+Used in place of the mystem binary (MYSTEM_BIN) by the unit tests only (the pinned
+regression corpus is recorded with the real mystem, see regression.py); it hangs on
+'зависни' and exits on 'умри'.
+The options of mystem are ignored, except -d (without it, all readings are given).
+
+Usage:
+MYSTEM_BIN=tests/stub_mystem.py python elan2folia.py
+"""
+import json
+import re
+import sys
+import time
+
+# word -> readings (lex, wt, gr), Mystem's choice in context first
+LEXICON = {
+    'а': [('а', 0.9, 'CONJ='), ('а', 0.1, 'INTJ=')],
+    'и': [('и', 0.99, 'CONJ='), ('и', 0.01, 'PART=')],
+    'да': [('да', 0.8, 'PART='), ('да', 0.2, 'CONJ=')],
+    'не': [('не', 1.0, 'PART=')],
+    'ну': [('ну', 0.9, 'PART='), ('ну', 0.1, 'INTJ=')],
+    'же': [('же', 1.0, 'PART=')],
+    'вот': [('вот', 1.0, 'PART=')],
+    'нет': [('нет', 0.8, 'PART='), ('нет', 0.2, 'ADV=')],
+    'в': [('в', 0.99, 'PR='), ('в', 0.01, 'S,сокр=им,ед')],
+    'с': [('с', 0.99, 'PR='), ('с', 0.01, 'S,сокр=им,ед')],
+    'на': [('на', 1.0, 'PR=')],
+    'из': [('из', 1.0, 'PR=')],
+    'я': [('я', 1.0, 'SPRO,ед,1-л=им')],
+    'мне': [('я', 1.0, 'SPRO,ед,1-л=(дат|пр)')],
+    'ты': [('ты', 1.0, 'SPRO,ед,2-л=им')],
+    'тебе': [('ты', 1.0, 'SPRO,ед,2-л=(дат|пр)')],
+    'мы': [('мы', 1.0, 'SPRO,мн,1-л=им')],
+    'он': [('он', 1.0, 'SPRO,ед,3-л,муж=им')],
+    'она': [('она', 1.0, 'SPRO,ед,3-л,жен=им')],
+    'ей': [('она', 1.0, 'SPRO,ед,3-л,жен=дат')],
+    'ней': [('она', 1.0, 'SPRO,ед,3-л,жен=(дат|пр|твор)')],
+    'это': [('это', 0.6, 'SPRO,ед,сред,неод=(вин|им)'), ('этот', 0.4, 'APRO=(вин,ед,сред|им,ед,сред)')],
+    'что': [('что', 0.7, 'CONJ='), ('что', 0.3, 'SPRO,ед,сред,неод=(вин|им)')],
+    'все': [('все', 0.7, 'SPRO,мн=(вин,неод|им)'), ('весь', 0.3, 'APRO=(вин,мн,неод|им,мн)')],
+    'как': [('как', 0.9, 'ADVPRO='), ('как', 0.1, 'CONJ=')],
+    'так': [('так', 1.0, 'ADVPRO=')],
+    'где': [('где', 1.0, 'ADVPRO=')],
+    'почему': [('почему', 1.0, 'ADVPRO=')],
+    'потому': [('потому', 1.0, 'ADVPRO=')],
+    'такую': [('такой', 1.0, 'APRO=вин,ед,жен')],
+    'нужно': [('нужно', 0.8, 'ADV=вводн'), ('нужный', 0.2, 'A=ед,кр,сред')],
+    'по-английски': [('по-английски', 1.0, 'ADV=')],
+    'по-русски': [('по-русски', 1.0, 'ADV=')],
+    'будет': [('быть', 1.0, 'V,нп=непрош,ед,изъяв,3-л,несов')],
+    'говорить': [('говорить', 1.0, 'V,несов,пе=инф')],
+    'говорят': [('говорить', 1.0, 'V,несов,пе=непрош,мн,изъяв,3-л')],
+    'сказать': [('сказать', 1.0, 'V,сов,пе=инф')],
+    'смотри': [('смотреть', 1.0, 'V,несов,пе=ед,пов,2-л')],
+    'видишь': [('видеть', 1.0, 'V,несов,пе=непрош,ед,изъяв,2-л')],
+    'винтовой': [('винтовой', 1.0, 'A=(им,ед,полн,муж|вин,ед,полн,муж,неод|род,ед,полн,жен)')],
+    'самолет': [('самолет', 1.0, 'S,муж,неод=(вин,ед|им,ед)')],
+    'мама': [('мама', 1.0, 'S,жен,од=им,ед')],
+    'папа': [('папа', 1.0, 'S,муж,од=им,ед')],
+    'бостон': [('бостон', 1.0, 'S,гео,муж,неод=(вин,ед|им,ед)')],
+}
+DEFAULT = 'S,жен,неод=им,ед'
+
+re_word = re.compile(r'[^\W\d_]+(?:-[^\W\d_]+)*')
+
+
+def analysis(word, disambiguation):
+    readings = LEXICON.get(word.lower(), [(word.lower(), 1.0, DEFAULT)])
+    return [{'lex': lex, 'wt': wt, 'gr': gr} for lex, wt, gr in (readings[:1] if disambiguation else readings)]
+
+
+if __name__ == '__main__':
+    disambiguation = '-d' in sys.argv[1:]
+    for line in sys.stdin:
+        if 'зависни' in line:
+            time.sleep(3600)
+        if 'умри' in line:
+            sys.exit(3)
+        print(json.dumps([{'text': w, 'analysis': analysis(w, disambiguation)} for w in re_word.findall(line)],
+                         ensure_ascii=False), flush=True)
@@ -0,0 +1,173 @@
+"""
+eaf.read_eaf() against pympi.Eaf (skipped without pympi), on the sample file and fuzzed copies of it
+"""
+import random
+import xml.etree.ElementTree as ET
+
+import pytest
+
+from eaf import read_eaf, resolve_timeslots
+
+SAMPLE = 'data/I_2016_07_18_0.eaf'
+
+
+def compare_with_pympi(f_i):
+    """
+    f_i: input (ELAN) file (full path, with extension) (str)
+    -> list of mismatches between read_eaf() and pympi.Eaf (empty if none)
+
+    Annotations whose time slots are unaligned in the file are compared only
+    on tier and value (pympi leaves their times as None).
+    """
+    from pympi import Eaf
+
+    doc_pympi = Eaf(f_i)
+    doc = read_eaf(f_i)
+    mismatches = []
+    ours = {doc.ids[i]: i for i in range(len(doc))}
+    n_pympi = 0
+    for k in doc_pympi.tiers:
+        aas, ras = doc_pympi.tiers[k][0], doc_pympi.tiers[k][1]
+        n_pympi += len(aas) + len(ras)
+        for kk in aas:
+            i = ours.get(kk)
+            if i is None:
+                mismatches.append((kk, 'missing'))
+                continue
+            b = doc_pympi.timeslots[aas[kk][0]]
+            e = doc_pympi.timeslots[aas[kk][1]]
+            expected = (k, aas[kk][2] or '', b, e)
+            got = (doc.tier_ids[doc.tiers[i]], doc.values[i],
+                   doc.begins[i] if b is not None else None,
+                   doc.ends[i] if e is not None else None)
+            if expected != got or doc.refs[i] is not None:
+                mismatches.append((kk, expected, got))
+        for kk in ras:
+            i = ours.get(kk)
+            if i is None:
+                mismatches.append((kk, 'missing'))
+                continue
+            expected = (k, ras[kk][1] or '', ras[kk][0])
+            got = (doc.tier_ids[doc.tiers[i]], doc.values[i], doc.refs[i])
+            if expected != got:
+                mismatches.append((kk, expected, got))
+    if n_pympi != len(doc):
+        mismatches.append(('count', n_pympi, len(doc)))
+    return mismatches
+
+
+def fuzz_eaf(f_i, f_o, seed=0):
+    """
+    Write a randomly perturbed copy of f_i to f_o:
+    unaligned time slots, empty values, shuffled tiers and
+    reference tiers pointing at existing annotations.
+    """
+    rng = random.Random(seed)
+    tree = ET.parse(f_i)
+    root = tree.getroot()
+    for ts in root.iter('TIME_SLOT'):
+        if 'TIME_VALUE' in ts.attrib and rng.random() < 0.1:
+            del ts.attrib['TIME_VALUE']
+    for av in root.iter('ANNOTATION_VALUE'):
+        if rng.random() < 0.05:
+            av.text = None
+    tiers = root.findall('TIER')
+    first = list(root).index(tiers[0]) if tiers else 0
+    for t in tiers:
+        root.remove(t)
+    rng.shuffle(tiers)
+    n = 0
+    for t in list(tiers):
+        aas = t.findall('./ANNOTATION/ALIGNABLE_ANNOTATION')
+        if not aas or rng.random() < 0.5:
+            continue
+        n += 1
+        dep = ET.Element('TIER', {'LINGUISTIC_TYPE_REF': 'default-lt',
+                                  'PARENT_REF': t.get('TIER_ID'),
+                                  'TIER_ID': 'fuzz-{}'.format(n)})
+        for aa in rng.sample(aas, min(len(aas), 5)):
+            ann = ET.SubElement(dep, 'ANNOTATION')
+            ra = ET.SubElement(ann, 'REF_ANNOTATION',
+                               {'ANNOTATION_ID': 'fuzz-{}-{}'.format(n, aa.get('ANNOTATION_ID')),
+                                'ANNOTATION_REF': aa.get('ANNOTATION_ID')})
+            ET.SubElement(ra, 'ANNOTATION_VALUE').text = 'fuzz {}'.format(rng.random())
+        tiers.append(dep)
+    for i, t in enumerate(tiers):
+        root.insert(first + i, t)
+    tree.write(f_o, encoding='UTF-8', xml_declaration=True)
+
+
+def test_resolve_timeslots():
+    assert resolve_timeslots(['a', 'b', 'c', 'd', 'e'], [None, 100, None, 300, None]) == \
+        {'a': 100, 'b': 100, 'c': 200, 'd': 300, 'e': 300}
+    assert resolve_timeslots(['a'], [None]) == {'a': 0}
+
+
+def test_sample_agrees_with_pympi():
+    pytest.importorskip('pympi')
+    assert compare_with_pympi(SAMPLE) == []
+
+
+@pytest.mark.parametrize('seed', range(20))
+def test_fuzzed_agrees_with_pympi(seed, tmp_path):
+    pytest.importorskip('pympi')
+    f_fuzz = str(tmp_path / 'fuzz.eaf')
+    fuzz_eaf(SAMPLE, f_fuzz, seed)
+    assert compare_with_pympi(f_fuzz) == []
+
+
+TIERED = '''<?xml version="1.0" encoding="UTF-8"?>
+<ANNOTATION_DOCUMENT>
+  <TIME_ORDER>
+    <TIME_SLOT TIME_SLOT_ID="ts1" TIME_VALUE="0"/>
+    <TIME_SLOT TIME_SLOT_ID="ts6"/>
+    <TIME_SLOT TIME_SLOT_ID="ts2" TIME_VALUE="1000"/>
+    <TIME_SLOT TIME_SLOT_ID="ts4" TIME_VALUE="1200"/>
+    <TIME_SLOT TIME_SLOT_ID="ts5" TIME_VALUE="1800"/>
+    <TIME_SLOT TIME_SLOT_ID="ts3" TIME_VALUE="2000"/>
+  </TIME_ORDER>
+  <TIER LINGUISTIC_TYPE_REF="utt" TIER_ID="MOT">
+    <ANNOTATION><ALIGNABLE_ANNOTATION ANNOTATION_ID="a1" TIME_SLOT_REF1="ts1" TIME_SLOT_REF2="ts2">
+      <ANNOTATION_VALUE>first</ANNOTATION_VALUE></ALIGNABLE_ANNOTATION></ANNOTATION>
+    <ANNOTATION><ALIGNABLE_ANNOTATION ANNOTATION_ID="a2" TIME_SLOT_REF1="ts2" TIME_SLOT_REF2="ts3">
+      <ANNOTATION_VALUE>second</ANNOTATION_VALUE></ALIGNABLE_ANNOTATION></ANNOTATION>
+  </TIER>
+  <TIER LINGUISTIC_TYPE_REF="gloss" PARENT_REF="MOT" TIER_ID="gloss@MOT">
+    <ANNOTATION><REF_ANNOTATION ANNOTATION_ID="a3" ANNOTATION_REF="a2">
+      <ANNOTATION_VALUE>gloss</ANNOTATION_VALUE></REF_ANNOTATION></ANNOTATION>
+  </TIER>
+  <TIER LINGUISTIC_TYPE_REF="words" PARENT_REF="gloss@MOT" TIER_ID="words@MOT">
+    <ANNOTATION><REF_ANNOTATION ANNOTATION_ID="a4" ANNOTATION_REF="a3">
+      <ANNOTATION_VALUE>word</ANNOTATION_VALUE></REF_ANNOTATION></ANNOTATION>
+  </TIER>
+  <TIER LINGUISTIC_TYPE_REF="event" PARENT_REF="MOT" TIER_ID="event@MOT">
+    <ANNOTATION><ALIGNABLE_ANNOTATION ANNOTATION_ID="a5" TIME_SLOT_REF1="ts4" TIME_SLOT_REF2="ts5">
+      <ANNOTATION_VALUE>laughs</ANNOTATION_VALUE></ALIGNABLE_ANNOTATION></ANNOTATION>
+  </TIER>
+  <TIER LINGUISTIC_TYPE_REF="segment" PARENT_REF="MOT" TIER_ID="segment@MOT">
+    <ANNOTATION><ALIGNABLE_ANNOTATION ANNOTATION_ID="a6" TIME_SLOT_REF1="ts1" TIME_SLOT_REF2="ts6">
+      <ANNOTATION_VALUE>fir</ANNOTATION_VALUE></ALIGNABLE_ANNOTATION></ANNOTATION>
+    <ANNOTATION><ALIGNABLE_ANNOTATION ANNOTATION_ID="a7" TIME_SLOT_REF1="ts6" TIME_SLOT_REF2="ts2">
+      <ANNOTATION_VALUE>st</ANNOTATION_VALUE></ALIGNABLE_ANNOTATION></ANNOTATION>
+  </TIER>
+  <LINGUISTIC_TYPE LINGUISTIC_TYPE_ID="utt" TIME_ALIGNABLE="true"/>
+  <LINGUISTIC_TYPE CONSTRAINTS="Symbolic_Association" LINGUISTIC_TYPE_ID="gloss" TIME_ALIGNABLE="false"/>
+  <LINGUISTIC_TYPE CONSTRAINTS="Symbolic_Subdivision" LINGUISTIC_TYPE_ID="words" TIME_ALIGNABLE="false"/>
+  <LINGUISTIC_TYPE CONSTRAINTS="Included_In" LINGUISTIC_TYPE_ID="event" TIME_ALIGNABLE="true"/>
+  <LINGUISTIC_TYPE CONSTRAINTS="Time_Subdivision" LINGUISTIC_TYPE_ID="segment" TIME_ALIGNABLE="true"/>
+</ANNOTATION_DOCUMENT>
+'''
+
+
+def test_tier_kinds(tmp_path):
+    f = tmp_path / 'tiered.eaf'
+    f.write_text(TIERED, encoding='utf-8')
+    doc = read_eaf(str(f))
+    assert [doc.tier_kind(t) for t in range(len(doc.tier_ids))] == \
+        ['independent', 'Symbolic_Association', 'Symbolic_Subdivision', 'Included_In', 'Time_Subdivision']
+    utts, deps = doc.select()
+    assert utts == {0} and deps == {1, 2, 3, 4}
+    assert doc.dependents(utts, deps) == {
+        'a1': [('segment@MOT', 'fir'), ('segment@MOT', 'st')],
+        'a2': [('gloss@MOT', 'gloss'), ('words@MOT', 'word'), ('event@MOT', 'laughs')],
+    }
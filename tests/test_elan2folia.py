@@ -0,0 +1,59 @@
+"""
+elan2folia conversions of the sample file, with the stub mystem
+"""
+import pytest
+
+pytest.importorskip('folia')
+import elan2folia
+
+SAMPLE = 'data/I_2016_07_18_0.eaf'
+
+
+def count(f, text):
+    with open(f, encoding='utf-8') as fi:
+        return fi.read().count(text)
+
+
+def test_incremental_keeps_provenance(stub_mystem, tmp_path):
+    f_o = str(tmp_path / 'I_2016_07_18_0.folia.xml')
+    elan2folia.convert(SAMPLE, f_o, provenance=True)
+    n_rules = count(f_o, '; rules: ')
+    assert n_rules
+    elan2folia.convert(SAMPLE, f_o, provenance=True, incremental=True)
+    assert count(f_o, '; rules: ') == n_rules
+    elan2folia.convert(SAMPLE, f_o, incremental=True)
+    assert count(f_o, '; rules: ') == 0
+
+
+def test_incremental_drops_readings(stub_mystem, tmp_path):
+    f_o = str(tmp_path / 'I_2016_07_18_0.folia.xml')
+    elan2folia.convert(SAMPLE, f_o, readings=True)
+    assert count(f_o, '<alt ')
+    elan2folia.convert(SAMPLE, f_o, incremental=True)
+    assert count(f_o, '<alt ') == 0
+
+
+def test_redisambiguate_keeps_manual_provenance(stub_mystem, tmp_path):
+    f_o = str(tmp_path / 'I_2016_07_18_0.folia.xml')
+    elan2folia.convert(SAMPLE, f_o, readings=True, provenance=True)
+    with open(f_o, encoding='utf-8') as f:
+        xml = f.read()
+    # the first word, corrected by hand
+    comment = xml[xml.index('<pos class='):].split('<comment>', 1)[1].split('</comment>', 1)[0]
+    assert '; rules: ' in comment
+    with open(f_o, 'w', encoding='utf-8') as f:
+        f.write(xml.replace('<pos class=', '<pos annotatortype="manual" class=', 1))
+    f_r = str(tmp_path / 'redisambiguated.folia.xml')
+    elan2folia.redisambiguate(f_o, f_r)
+    assert count(f_r, comment) == 1
+
+
+def test_rule_stats_count_annotations_only(stub_mystem, tmp_path):
+    import morphology
+
+    stats = []
+    for readings in (False, True):
+        morphology.start_rule_stats()
+        elan2folia.convert(SAMPLE, str(tmp_path / '{}.folia.xml'.format(readings)), readings=readings)
+        stats.append({rule: s[:2] for rule, s in morphology.stop_rule_stats().items()})
+    assert stats[0] and stats[0] == stats[1]
@@ -0,0 +1,36 @@
+"""
+folia2chat headers from the metadata registry, on the sample FoLiA file (see conftest.sample_folia)
+"""
+import io
+import re
+
+from folia2chat import convert_folia_to_chat
+from metadata import Registry
+
+def chat(f_i, registry):
+    f = io.StringIO()
+    convert_folia_to_chat(f_i, f, registry=registry)
+    return f.getvalue()
+
+
+def test_partial_registry(sample_folia):
+    registry = Registry([{'session': 'I_2016_07_18_0', 'child': 'I', 'date': '2016-07-18', 'languages': 'eng, rus'}],
+                        [{'child': 'I', 'speaker': 'Ребенок', 'code': 'CHI', 'role': 'Target_Child',
+                          'birthdate': '2012-01-31'}])
+    text = chat(sample_folia, registry)
+    participants = re.search(r'^@Participants: (.*)$', text, re.M).group(1).split(', ')
+    ids = set(re.findall(r'^@ID: [^|]*\|[^|]*\|([^|]*)\|', text, re.M))
+    body = set(re.findall(r'^\*([A-Z]+):', text, re.M))
+    assert participants[0] == 'CHI Ребенок'
+    assert 'MOT Мама' in participants
+    assert body <= ids
+    assert {p.split()[0] for p in participants} == ids
+    # the speakers missing from the registry are reported (see metadata.report())
+    assert 'Мама' in registry.unresolved['I_2016_07_18_0']
+    assert 'Ребенок' not in registry.unresolved['I_2016_07_18_0']
+
+
+def test_no_registry(sample_folia):
+    text = chat(sample_folia, Registry())
+    body = set(re.findall(r'^\*([A-Z]+):', text, re.M))
+    assert body <= set(re.findall(r'^@ID: [^|]*\|[^|]*\|([^|]*)\|', text, re.M))
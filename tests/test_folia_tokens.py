@@ -0,0 +1,42 @@
+"""
+folia_tokens reading of the sample FoLiA file (see conftest.sample_folia)
+"""
+import os
+import shutil
+import xml.etree.ElementTree as ET
+
+import folia_tokens
+from folia_tokens import TAG_UTT, iter_utterances, read_tokens
+
+
+def test_iter_utterances_drops_read_utterances(sample_folia, monkeypatch):
+    roots = []
+    iterparse = ET.iterparse
+
+    def recording_iterparse(source, events=None):
+        for event, elem in iterparse(source, events=('start', 'end')):
+            if not roots:
+                roots.append(elem)
+            if event in (events or ('end',)):
+                yield event, elem
+
+    monkeypatch.setattr(folia_tokens.ET, 'iterparse', recording_iterparse)
+    # the read utterances (cleared, so without attributes) do not stay in the tree
+    read = [sum(e.tag == TAG_UTT and not e.attrib for e in roots[0].iter()) for _ in iter_utterances(sample_folia)]
+    assert len(read) > 1 and max(read) == 0
+    assert not any(e.tag == TAG_UTT for e in roots[0].iter())
+
+
+def test_read_tokens_cache_is_bounded(sample_folia, tmp_path, monkeypatch):
+    monkeypatch.setattr(folia_tokens, '_cache', folia_tokens.OrderedDict())
+    fs = [str(tmp_path / '{}.folia.xml'.format(n)) for n in range(folia_tokens.CACHE_SIZE + 1)]
+    for f in fs:
+        shutil.copy(sample_folia, f)
+    first = read_tokens(fs[0])
+    for f in fs[1:-1]:
+        read_tokens(f)
+    assert read_tokens(fs[0]) is first  # hit, now the most recently used
+    read_tokens(fs[-1])
+    assert len(folia_tokens._cache) == folia_tokens.CACHE_SIZE
+    assert os.path.abspath(fs[0]) in folia_tokens._cache
+    assert os.path.abspath(fs[1]) not in folia_tokens._cache
@@ -0,0 +1,69 @@
+"""
+foliasets resolves the BiRCh set definitions to set_definitions/ and never goes to the network
+"""
+import os
+import socket
+
+import pytest
+
+import foliasets
+from foliasets import SET_DEFINITIONS_DIR, SET_DEFINITIONS_URLS, compile_set, local_path, validate
+
+POS_SET = SET_DEFINITIONS_URLS[0] + 'birch_pos_temp_20200228.foliaset.xml'
+
+
+@pytest.fixture(autouse=True)
+def no_network(monkeypatch):
+    def connect(*args, **kwargs):
+        raise AssertionError('network access')
+
+    monkeypatch.setattr(socket.socket, 'connect', connect)
+    monkeypatch.setattr(socket, 'create_connection', connect)
+
+
+@pytest.mark.parametrize('prefix', SET_DEFINITIONS_URLS)
+def test_local_path(prefix):
+    assert local_path(prefix + 'birch_pos_03.foliaset.xml') == os.path.join(SET_DEFINITIONS_DIR, 'birch_pos_03.foliaset.xml')
+
+
+def test_local_path_unknown():
+    assert local_path(SET_DEFINITIONS_URLS[0] + 'missing.foliaset.xml') is None
+    assert local_path('https://raw.githubusercontent.com/proycon/folia/master/setdefinitions/text.foliaset.ttl') is None
+
+
+def test_compile_set():
+    s = compile_set(POS_SET)
+    assert s.type == 'closed'
+    assert 'NPRO' in s.classes and 'XYZ' not in s.classes
+    s = compile_set(SET_DEFINITIONS_URLS[1] + 'birch_pos_03.foliaset.xml')
+    assert s.subsets['лицо_NPRO_V']['1p'] == '1-л'
+    assert '1-л' in s.labels
+    assert compile_set(POS_SET) is compile_set(POS_SET)
+
+
+def test_validate(tmp_path, sample_folia):
+    with open(sample_folia, encoding='utf-8') as f:
+        xml = f.read()
+    bad = tmp_path / 'bad.folia.xml'
+    bad.write_text(xml.replace('<pos class="CONJ">', '<pos class="XYZ">', 1), encoding='utf-8')
+    report = validate([sample_folia, str(bad)])
+    assert list(report) == [str(bad)]
+    assert report[str(bad)] == [('a2.w.2', 'POS class XYZ')]
+
+
+def test_load_document_deepvalidation(sample_folia):
+    pytest.importorskip('folia')
+    doc = foliasets.load_document(sample_folia, deepvalidation=True)
+    assert POS_SET in doc.setdefinitions
+    # foliapy's own text set is not bundled: ad hoc rather than downloaded
+    assert doc.failedsetdefinitions == ['https://raw.githubusercontent.com/proycon/folia/master/setdefinitions/text.foliaset.ttl']
+
+
+def test_load_document_deepvalidation_error(tmp_path, sample_folia):
+    folia = pytest.importorskip('folia.main')
+    with open(sample_folia, encoding='utf-8') as f:
+        xml = f.read()
+    bad = tmp_path / 'bad.folia.xml'
+    bad.write_text(xml.replace('<pos class="CONJ">', '<pos class="XYZ">', 1), encoding='utf-8')
+    with pytest.raises(folia.ParseError, match='Not a valid class: XYZ'):
+        foliasets.load_document(str(bad), deepvalidation=True)
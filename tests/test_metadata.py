@@ -0,0 +1,28 @@
+"""
+metadata.chat_age()
+"""
+from datetime import date
+
+import pytest
+
+from metadata import chat_age
+
+
+@pytest.mark.parametrize('birthdate, on, age', [
+    (date(2012, 3, 15), date(2016, 7, 18), '4;04.03'),
+    (date(2012, 3, 15), date(2012, 3, 15), '0;00.00'),
+    (date(2012, 3, 15), date(2013, 3, 14), '0;11.27'),
+    # month ends: the day of birth is clamped to the end of shorter months
+    (date(2020, 1, 31), date(2020, 3, 1), '0;01.01'),
+    (date(2020, 1, 31), date(2020, 2, 29), '0;01.00'),
+    (date(2021, 1, 31), date(2021, 2, 28), '0;01.00'),
+    (date(2020, 3, 31), date(2020, 5, 1), '0;01.01'),
+    (date(2019, 12, 31), date(2020, 1, 30), '0;00.30'),
+    # leap-year births
+    (date(2020, 2, 29), date(2021, 2, 28), '1;00.00'),
+    (date(2020, 2, 29), date(2021, 3, 1), '1;00.01'),
+    (date(2020, 2, 29), date(2024, 2, 29), '4;00.00'),
+    (date(2020, 2, 29), date(2020, 3, 28), '0;00.28'),
+])
+def test_chat_age(birthdate, on, age):
+    assert chat_age(birthdate, on) == age
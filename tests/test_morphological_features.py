@@ -0,0 +1,22 @@
+"""
+morphological_features.feats_ru2en covers the features of every set definition (set_definitions/)
+"""
+import os
+
+import pytest
+
+from foliasets import compile_set
+from morphological_features import feats_ru2en
+
+SET_DEFINITIONS = 'set_definitions'
+SETS = sorted(f for f in os.listdir(SET_DEFINITIONS) if f.endswith('.foliaset.xml'))
+
+
+def test_sets_found():
+    assert SETS
+
+
+@pytest.mark.parametrize('f', SETS)
+def test_features_mapped(f):
+    s = compile_set(os.path.join(SET_DEFINITIONS, f))  # fails on an unreadable set definition
+    assert sorted(s.labels - feats_ru2en.keys()) == []
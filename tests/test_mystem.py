@@ -0,0 +1,83 @@
+"""
+morphology.GuardedMystem, with the stub mystem (stub_mystem.py)
+"""
+import json
+import os
+import time
+
+import pytest
+
+import morphology
+from morphology import GuardedMystem, MystemFailure
+
+# hangs on 'зависни', exits on 'умри'
+STUB = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'stub_mystem.py')
+
+
+@pytest.fixture
+def mystem(tmp_path, monkeypatch):
+    monkeypatch.setattr(morphology, 'failure_log', str(tmp_path / 'failures.jsonl'))
+    monkeypatch.setattr(morphology, 'file_deadline', None)
+    m = GuardedMystem(mystem_bin=STUB, entire_input=False, timeout=2)
+    yield m
+    m.restart()
+
+
+def failures(tmp_path):
+    with open(tmp_path / 'failures.jsonl', encoding='utf-8') as f:
+        return [json.loads(line) for line in f]
+
+
+pytestmark = pytest.mark.skipif(os.name != 'posix', reason='the stub mystem is run through its #! line')
+
+
+def test_arguments():
+    assert GuardedMystem().args == ['--format', 'json', '-gi', '-d', '-c', '--weight']
+    assert GuardedMystem(entire_input=False, disambiguation=False).args == ['--format', 'json', '-gi', '--weight']
+
+
+def test_analyze(mystem):
+    result = mystem.analyze('мама мыла\nраму')
+    assert [a['text'] for a in result] == ['мама', 'мыла', 'раму']
+    assert result[0]['analysis'] == [{'lex': 'мама', 'wt': 1.0, 'gr': 'S,жен,од=им,ед'}]
+
+
+def test_long_line(mystem):
+    assert mystem.analyze('я' * 300000)[0]['text'] == 'я' * 300000
+
+
+def test_timeout_restarts(mystem, tmp_path):
+    start = time.monotonic()
+    with pytest.raises(MystemFailure):
+        mystem.analyze('зависни')
+    assert time.monotonic() - start < 10
+    assert mystem.proc is None
+    assert [a['text'] for a in mystem.analyze('раму')] == ['раму']
+    assert [f['kind'] for f in failures(tmp_path)] == ['timeout']
+
+
+def test_crash_restarts(mystem, tmp_path, capsys):
+    with pytest.raises(MystemFailure):
+        mystem.analyze('умри')
+    assert [a['text'] for a in mystem.analyze('раму')] == ['раму']
+    assert [f['kind'] for f in failures(tmp_path)] == ['error']
+    # logged on stderr, apart from the progress messages
+    captured = capsys.readouterr()
+    assert captured.out == '' and captured.err.startswith('Mystem error')
+
+
+def test_budget(mystem, tmp_path, monkeypatch):
+    monkeypatch.setattr(morphology, 'file_deadline', time.time() - 1)
+    with pytest.raises(MystemFailure):
+        mystem.analyze('раму')
+    assert mystem.proc is None  # not started
+    assert [f['kind'] for f in failures(tmp_path)] == ['budget']
+
+
+def test_unanalyzed_tokens(mystem, monkeypatch):
+    from records import Token
+
+    monkeypatch.setattr(morphology, 'm', mystem)
+    tokens = morphology.analyze_tokens([Token('зависни'), Token('.')])
+    assert tokens[0].rules == ('unanalyzed',)
+    assert tokens[1].rules == ()
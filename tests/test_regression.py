@@ -0,0 +1,23 @@
+"""
+the pinned regression corpus (data/regression, see regression.py),
+skipped until its Mystem calls are recorded with the real mystem
+"""
+import pytest
+
+pytest.importorskip('folia')
+pytest.importorskip('pymystem3')
+import regression
+
+
+@pytest.mark.skipif(not regression.recorded(), reason='pinned corpus not recorded (python regression.py record, with mystem)')
+def test_pinned_corpus():
+    changes, missing, n_tokens = regression.check()
+    assert n_tokens
+    assert not missing
+    assert not changes, '\n'.join(regression.report(changes))
+
+
+def test_record_refuses_stub(monkeypatch, tmp_path):
+    monkeypatch.setenv('MYSTEM_BIN', regression.STUB_MYSTEM)
+    with pytest.raises(ValueError):
+        regression.record([], str(tmp_path))
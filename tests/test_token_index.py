@@ -0,0 +1,34 @@
+"""
+token_index.TokenIndex, over copies of the sample FoLiA file (see conftest.sample_folia)
+"""
+import os
+import shutil
+
+import pytest
+
+from token_index import TokenIndex
+
+@pytest.fixture
+def index(tmp_path, sample_folia):
+    fs = [str(tmp_path / name) for name in ('a_b.folia.xml', 'axb.folia.xml', 'a%.folia.xml')]
+    for f in fs:
+        shutil.copy(sample_folia, f)
+    with TokenIndex(str(tmp_path / 'index.sqlite')) as index:
+        assert index.update_all(fs) == 3
+        yield index
+
+
+def test_file_basename_is_literal(index):
+    n = len(index.query(pos='N', file='a_b.folia.xml'))
+    assert n
+    assert len(index.query(pos='N')) == 3 * n
+    assert {os.path.basename(h.file) for h in index.query(pos='N', file='a_b.folia.xml')} == {'a_b.folia.xml'}
+    assert len(index.query(pos='N', file='a%.folia.xml')) == n
+    assert index.query(pos='N', file='_.folia.xml') == []
+
+
+def test_features(index):
+    hits = index.query(features=['жен', 'им'])
+    assert hits and all('жен' in h.description and 'им' in h.description for h in hits)
+    with pytest.raises(ValueError, match='Unknown features: xyz'):
+        index.query(features=['жен', 'xyz'])
@@ -0,0 +1,224 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+BiRCh Token Index Module
+alexluu@brandeis.edu
+
+Input: FoLiA files (.folia.xml), e.g. the output of elan2folia
+Output: on-disk (SQLite) index of their tokens by lemma, POS, features,
+        speaker, file and time; matching tokens with their utterance context
+
+Each token row keeps its lemma, POS and a bit mask of its features
+(records.feature_mask(), so an ambiguous description matches every reading);
+each utterance row keeps its speaker, times (in milliseconds) and text.
+Files are reindexed only when their modification time or size changed.
+
+Usage:
+python token_index.py update data/FoLiA/*.folia.xml
+python token_index.py query --pos N --feature ул --speaker Ребенок
+
+References:
+https://docs.python.org/3/library/sqlite3.html
+"""
+
+import os
+import re
+import sqlite3
+from collections import namedtuple
+from folia_tokens import iter_utterances, utterance_words, foliatime2millisec
+from records import feature_mask
+
+INDEX = 'data/index.sqlite'
+
+# special characters of a LIKE pattern, escaped with '!'
+re_like = re.compile(r'[!%_]')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    id INTEGER PRIMARY KEY,
+    path TEXT UNIQUE NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    size INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS utterances (
+    id INTEGER PRIMARY KEY,
+    file INTEGER NOT NULL,
+    utt_id TEXT,
+    speaker TEXT,
+    begin INTEGER,
+    end INTEGER,
+    text TEXT
+);
+CREATE TABLE IF NOT EXISTS tokens (
+    utterance INTEGER NOT NULL,
+    n INTEGER NOT NULL,
+    word_id TEXT,
+    text TEXT,
+    lemma TEXT,
+    pos TEXT,
+    description TEXT,
+    features INTEGER NOT NULL,
+    PRIMARY KEY (utterance, n)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS utterances_file ON utterances (file);
+CREATE INDEX IF NOT EXISTS utterances_speaker ON utterances (speaker);
+CREATE INDEX IF NOT EXISTS tokens_lemma ON tokens (lemma);
+CREATE INDEX IF NOT EXISTS tokens_pos ON tokens (pos);
+"""
+
+# begin, end: times in milliseconds (int, None if none)
+# n: position of the token in the utterance (from 0, speaker label excluded)
+# context: utterance text (tokens joined by spaces)
+Hit = namedtuple('Hit', 'file utterance speaker begin end n word_id text lemma pos description context')
+
+
+class TokenIndex:
+    """
+    index = TokenIndex('data/index.sqlite')
+    index.update_all(glob.glob('data/FoLiA/*.folia.xml'))
+    index.query(lemma='мама', speaker='Ребенок')
+    """
+
+    def __init__(self, f_index=INDEX):
+        d = os.path.dirname(f_index)
+        if d:
+            os.makedirs(d, exist_ok=True)
+        # used from one thread at a time, e.g. the writer thread of elan2folia.convert_batch()
+        self.db = sqlite3.connect(f_index, check_same_thread=False)
+        self.db.executescript(SCHEMA)
+
+    def close(self):
+        self.db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _remove(self, file_id):
+        self.db.execute('DELETE FROM tokens WHERE utterance IN (SELECT id FROM utterances WHERE file = ?)',
+                        (file_id,))
+        self.db.execute('DELETE FROM utterances WHERE file = ?', (file_id,))
+        self.db.execute('DELETE FROM files WHERE id = ?', (file_id,))
+
+    def remove(self, f_i):
+        """ drop f_i (a FoLiA file) from the index """
+        with self.db:
+            row = self.db.execute('SELECT id FROM files WHERE path = ?', (os.path.abspath(f_i),)).fetchone()
+            if row:
+                self._remove(row[0])
+
+    def update(self, f_i):
+        """
+        f_i: input (FoLiA) file (full path, with extension) (str)
+        -> True if the file was (re)indexed, False if its index was up to date
+        """
+        path = os.path.abspath(f_i)
+        st = os.stat(path)
+        row = self.db.execute('SELECT id, mtime_ns, size FROM files WHERE path = ?', (path,)).fetchone()
+        if row and row[1] == st.st_mtime_ns and row[2] == st.st_size:
+            return False
+        with self.db:  # one transaction per file
+            if row:
+                self._remove(row[0])
+            file_id = self.db.execute('INSERT INTO files (path, mtime_ns, size) VALUES (?, ?, ?)',
+                                      (path, st.st_mtime_ns, st.st_size)).lastrowid
+            for u in iter_utterances(path):
+                words = utterance_words(u)
+                utt = self.db.execute(
+                    'INSERT INTO utterances (file, utt_id, speaker, begin, end, text) VALUES (?, ?, ?, ?, ?, ?)',
+                    (file_id, u.id, u.speaker, foliatime2millisec(u.begintime), foliatime2millisec(u.endtime),
+                     ' '.join(w.text for w in words))).lastrowid
+                self.db.executemany(
+                    'INSERT INTO tokens VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                    [(utt, n, w.id, w.text, w.lemma, w.pos, w.description, feature_mask(w.description))
+                     for n, w in enumerate(words)])
+        return True
+
+    def update_all(self, fs_i, prune=False):
+        """
+        fs_i: list of input (FoLiA) files (full path, with extension) (str)
+        prune: also drop the indexed files that no longer exist
+        -> number of (re)indexed files
+        """
+        n = sum(self.update(f) for f in fs_i)
+        if prune:
+            for (path,) in self.db.execute('SELECT path FROM files').fetchall():
+                if not os.path.exists(path):
+                    self.remove(path)
+        return n
+
+    def query(self, lemma=None, pos=None, features=(), speaker=None, file=None, text=None, limit=None):
+        """
+        lemma, pos, speaker, text: exact values (str)
+        features: features that must all be present, e.g. ('ул',) or ('пов',) (list of str)
+        file: FoLiA file, or its basename (str)
+        -> list of Hit, ordered by file, time and position
+        ValueError if a feature is unknown (see records.FEATURES)
+        """
+        where = []
+        args = []
+        for column, value in (('t.lemma', lemma), ('t.pos', pos), ('u.speaker', speaker), ('t.text', text)):
+            if value is not None:
+                where.append(column + ' = ?')
+                args.append(value)
+        if features:
+            unknown = [f for f in features if bin(feature_mask(f)).count('1') != 1]
+            if unknown:
+                raise ValueError('Unknown features: {}'.format(', '.join(unknown)))
+            mask = feature_mask(','.join(features))
+            where.append('t.features & ? = ?')
+            args.extend((mask, mask))
+        if file is not None:
+            # '%' and '_' of the basename are literal
+            where.append("(f.path = ? OR f.path LIKE ? ESCAPE '!')")
+            args.extend((os.path.abspath(file), '%' + os.sep + re_like.sub(r'!\g<0>', os.path.basename(file))))
+        sql = ('SELECT f.path, u.utt_id, u.speaker, u.begin, u.end, t.n, t.word_id, t.text, t.lemma, t.pos,'
+               ' t.description, u.text'
+               ' FROM tokens t JOIN utterances u ON t.utterance = u.id JOIN files f ON u.file = f.id')
+        if where:
+            sql += ' WHERE ' + ' AND '.join(where)
+        sql += ' ORDER BY f.path, u.begin, u.id, t.n'
+        if limit:
+            sql += ' LIMIT {:d}'.format(limit)
+        return [Hit(*row) for row in self.db.execute(sql, args)]
+
+
+def index_converted(f_index=INDEX, dir_i='data/FoLiA'):
+    """ (re)index the FoLiA files of dir_i -> number of (re)indexed files """
+    with TokenIndex(f_index) as index:
+        return index.update_all([os.path.join(dir_i, f) for f in sorted(os.listdir(dir_i))
+                                 if f.endswith('.folia.xml')], prune=True)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Index FoLiA tokens and query the index.")
+    parser.add_argument("--index", default=INDEX, help="index file")
+    commands = parser.add_subparsers(dest="command", required=True)
+    p_update = commands.add_parser("update", help="(re)index changed FoLiA files")
+    p_update.add_argument("files", nargs="+")
+    p_update.add_argument("--prune", action="store_true", help="drop indexed files that no longer exist")
+    p_query = commands.add_parser("query", help="print matching tokens (tab-separated)")
+    p_query.add_argument("--lemma")
+    p_query.add_argument("--pos")
+    p_query.add_argument("--feature", action="append", default=[], help="repeatable, e.g. --feature ул")
+    p_query.add_argument("--speaker")
+    p_query.add_argument("--file")
+    p_query.add_argument("--text")
+    p_query.add_argument("--limit", type=int)
+    args = parser.parse_args()
+
+    with TokenIndex(args.index) as index:
+        if args.command == "update":
+            print(index.update_all(args.files, args.prune), 'files (re)indexed')
+        else:
+            try:
+                hits = index.query(args.lemma, args.pos, args.feature, args.speaker, args.file, args.text, args.limit)
+            except ValueError as e:  # unknown features
+                parser.error(str(e))
+            for h in hits:
+                print(os.path.basename(h.file), h.utterance, h.begin, h.end, h.speaker,
+                      h.text, h.lemma, h.pos, h.description, h.context, sep='\t')
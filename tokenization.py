@@ -12,6 +12,12 @@ References:
 """
 
 import re
+import sys
+from collections import namedtuple
+from functools import lru_cache
+
+# bound of the caches of surface forms (chunk tokenization, token classes)
+CACHE_SIZE = 1 << 16
 
 # re_comments = re.compile(r'\{ *[Cc][^\}]*\}')
 # def normalize_comments(t): # t: ELAN transcript text of a segment
@@ -72,9 +78,17 @@ def get_token_offsets(t): # t: ELAN transcript text of a segment
     # return sorted(set(w.start() for w in get_tokens_ru(t)).\
     #                   union(set(w.end() for w in get_tokens_ru(t))).\
     #                   union({0,len(t)}))
-    return sorted(set(w.start() for w in get_tokens_for_sure(t)).\
-                      union(set(w.end() for w in get_tokens_for_sure(t))).\
-                      union({0,len(t)}))
+    # the matches do not overlap and come in order, so the offsets are appended sorted
+    offsets = [0]
+    for w in get_tokens_for_sure(t):
+        start, end = w.span()
+        if start != offsets[-1]:
+            offsets.append(start)
+        if end != offsets[-1]:
+            offsets.append(end)
+    if len(t) != offsets[-1]:
+        offsets.append(len(t))
+    return offsets
 
 # https://birch.flowlu.com/_module/knowledgebase/view/article/279--word-splitting
 # r'^...$' + re.match = r'...' + re.fullmatch
@@ -86,8 +100,17 @@ re_split_1 = re.compile(r'([ёЁа-яА-Я]+)-(то|нибудь|либо|так
 # re_split_2 = re.compile(r'([Кк]о[ей])-([а-яА-Я]+)')
 re_split_2 = re.compile(r'([Кк]о[ей])-([ёЁа-яА-Я]+)')
 # https://en.wiktionary.org/wiki/%D0%BD%D0%B8%D0%BA%D1%82%D0%BE
-re_split_3 = re.compile(r'([Нн]и)(где|куда|когда|как|сколько|откуда|кто|кого|кому|кем|что|чего|чему|чем|какой|какое|какая|какие|какого|каких|какому|каким|какую|какою|какими|каком|чей|чье|чьё|чья|чьи|чьего|чьей|чьих|чьему|чьим|чью|чьею|чьими|чьем|чьём)')
-re_split_4 = re.compile(r'([Нн]е)(где|куда|когда|откуда|кого|чего|зачем)')
+NI_WORDS = ('где', 'куда', 'когда', 'как', 'сколько', 'откуда', 'кто', 'кого', 'кому', 'кем', 'что', 'чего',
+            'чему', 'чем', 'какой', 'какое', 'какая', 'какие', 'какого', 'каких', 'какому', 'каким', 'какую',
+            'какою', 'какими', 'каком', 'чей', 'чье', 'чьё', 'чья', 'чьи', 'чьего', 'чьей', 'чьих', 'чьему',
+            'чьим', 'чью', 'чьею', 'чьими', 'чьем', 'чьём')
+NE_WORDS = ('где', 'куда', 'когда', 'откуда', 'кого', 'чего', 'зачем')
+re_split_3 = re.compile(r'([Нн]и)({})'.format('|'.join(NI_WORDS)))
+re_split_4 = re.compile(r'([Нн]е)({})'.format('|'.join(NE_WORDS)))
+# all the forms matched by re_split_3 and re_split_4, with their splits
+splits_ni_ne = {prefix + w: [prefix + '@', '@' + w]
+                for prefixes, words in ((('Ни', 'ни'), NI_WORDS), (('Не', 'не'), NE_WORDS))
+                for prefix in prefixes for w in words}
 def split_word(token):
     """
     '...-то'     -> '...@' & '@-то'
@@ -98,6 +121,12 @@ def split_word(token):
     'ни...'     -> 'ни@' & '@...'
     'не...'     -> 'не@' & '@...'
     """
+    # 'ни...'/'не...' (re_split_3, re_split_4) have no '-', so the lookup can come first
+    split = splits_ni_ne.get(token)
+    if split:
+        return list(split)
+    if '-' not in token:
+        return [token]
     # match object
     mo = re_split_1.fullmatch(token)
     if mo:
@@ -106,48 +135,51 @@ def split_word(token):
         mo = re_split_2.fullmatch(token)
         if mo:
             return [''.join([mo.group(1), '-@']), ''.join(['@', mo.group(2)])]
-        else:
-            mo = re_split_3.fullmatch(token)
-            if mo:
-                return [''.join([mo.group(1), '@']), ''.join(['@', mo.group(2)])]
-            else:
-                mo = re_split_4.fullmatch(token)
-                if mo:
-                    return [''.join([mo.group(1), '@']), ''.join(['@', mo.group(2)])]
     return [token]
 
 
+@lru_cache(maxsize=CACHE_SIZE)
+def get_chunk_tokens(chunk): # chunk: text between two token offsets (see get_token_offsets())
+    """ -> tuple of the token strings of chunk (memoized: chunks are mostly recurring words) """
+    temp = chunk.strip().split()
+
+    # word splitting 
+    # (future consideration: more sophisticated handling of letter case)        
+    if len(temp)==1:
+        temp = split_word(temp[0])
+
+    # 20221218: handle the cases such as token "A>" in "<$PR A> Да <$$PR> ." (B_2012_08_16_0), in which one-letter Russian word undesirably attached to symbol ">"        
+    if len(temp)>0 and temp[-1].endswith('>'):
+        token = temp[-1] # the last token in temp    
+        if len(token)==2 and token[0].lower() in set('абвгдеёжзийклмнопрстуфхцчшщъыьэюя'):
+            temp = temp[:-1] + [token[0], '>']
+
+    # handle XML-based visibility of tokens in the form of tags
+    # e.g. '<REP> ... <$$REP>' -> '<$REP> ... <$$REP>'
+    for i in range(len(temp)):
+        t = temp[i]
+        if len(t)>1 and t[0]=='<' and t[1]!='$':
+            temp[i] = ''.join(['<$', t[1:]])
+    return tuple(temp)
+
+
+re_break = re.compile(r'<[Bb][Rr][Ee][Aa][Kk]>')
 def get_tokens(t):
     """ -> list of token strings in t """
     tokens = []
     # replace (long) '–' with (short) '-' in utterance text
     t = t.replace('–','-')
     # replace '<BREAK>' with '{BREAK}' in utterance text
-    t = re.sub(r'<[Bb][Rr][Ee][Aa][Kk]>',r'{BREAK}',t)
-    t = tokenize_curly_brackets(t)
-    t = tokenize_rd(t)
+    # (the substitutions only run on texts that can contain their patterns)
+    if '<' in t:
+        t = re_break.sub(r'{BREAK}',t)
+    if '{' in t:
+        t = tokenize_curly_brackets(t)
+    if '<RD' in t:
+        t = tokenize_rd(t)
     offsets = get_token_offsets(t)
-    for i in range(len(offsets)-1):
-        temp = t[offsets[i]:offsets[i+1]].strip().split()
-
-        # word splitting 
-        # (future consideration: more sophisticated handling of letter case)        
-        if len(temp)==1:
-            temp = split_word(temp[0])
-
-        # 20221218: handle the cases such as token "A>" in "<$PR A> Да <$$PR> ." (B_2012_08_16_0), in which one-letter Russian word undesirably attached to symbol ">"        
-        if len(temp)>0 and temp[-1].endswith('>'):
-            token = temp[-1] # the last token in temp    
-            if len(token)==2 and token[0].lower() in set('абвгдеёжзийклмнопрстуфхцчшщъыьэюя'):
-                temp = temp[:-1] + [token[0], '>']
-
-        tokens.extend(temp)
-    # handle XML-based visibility of tokens in the form of tags
-    # e.g. '<REP> ... <$$REP>' -> '<$REP> ... <$$REP>'
-    for i in range(len(tokens)):
-        t = tokens[i]
-        if len(t)>1 and t[0]=='<' and t[1]!='$':
-            tokens[i] = ''.join(['<$', t[1:]])
+    for start, end in zip(offsets, offsets[1:]):
+        tokens.extend(get_chunk_tokens(t[start:end]))
     return tokens
 
 
@@ -159,7 +191,127 @@ def get_tokens(t):
 letters_russian = set('абвгдеёжзийклмнопрстуфхцчшщъыьэюя-@')
 def is_token_mystem(token): # type(token): str
     """ consider those tokens consisting of only Cyrillic letters, '-' and '@' """
-    if token.endswith('-'):
+    return surface(token).mystem
+
+
+# Surface forms
+# Everything about a token that depends only on its surface form is computed once per
+# distinct form by surface() and kept in a bounded LRU cache, shared by the tokenizer
+# and morphology.analyze_morphology()/analyze_mystem(), so frequent words are not
+# normalized and classified again at every occurrence.
+# normalized: lower case, with 'е' instead of 'ё' (morphology's t_bare)
+# kind: 'word', 'split_first' ('что@'), 'split_second' ('@-нибудь'), 'tag' ('<REP>'),
+#       'comment' ('{laughs}'), 'punctuation' or 'other'
+# mystem: analyzed by Mystem (see is_token_mystem())
+# standard: form of the token in the Mystem input (colloquial forms replaced, see analyze_mystem())
+# answer: (rule, lemma, pos, features) of the tokens annotated without Mystem analysis
+#         (see direct_answer()), None for the others
+Surface = namedtuple('Surface', 'normalized kind mystem standard answer')
+
+lemmas_colloquial2standard = {  # lower cases
+    'щас': 'сейчас',
+    'че': 'что',
+    # 'чё': 'что',
+    'шо': 'что',
+}
+
+punctuation = set('.,;:!?+–-…')
+
+
+def direct_answer(t_bare):  # t_bare: normalized token (str)
+    """ -> (rule, lemma, pos, features) if the token is annotated without Mystem analysis, else None """
+    if t_bare in {'аа', 'оо', 'уу', 'ээ'}:
+        return ('vowel_intj', t_bare, 'INTJ', '')
+    if t_bare == 'ма':
+        return ('ма_мама', 'мама', 'N', 'ед,жен,зват,од')
+    # '@-(то|нибудь|либо|...)' or 'кое-@' or 'н(и|e)@'
+    if t_bare.startswith('@-') or t_bare.endswith('-@') or t_bare == 'ни@' or t_bare == 'не@':
+        # lemma = t_bare.replace('@','').replace('-','')
+        return ('split_particle', t_bare.replace('@', ''), 'PART', '')
+    return None
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def surface(token):  # token: str
+    """ -> Surface of the token """
+    normalized = sys.intern(token.lower().replace('ё', 'е'))
     # if token.endswith('-') or token.endswith('–'):
-        return False   
-    return all(l in letters_russian for l in token.lower())
\ No newline at end of file
+    mystem = not token.endswith('-') and letters_russian.issuperset(token.lower())
+    if mystem:
+        if '@' in token and token[0] != '@':
+            kind = 'split_first'
+        elif token.startswith('@'):
+            kind = 'split_second'
+        else:
+            kind = 'word'
+    elif token.startswith('<') or token.endswith('>'):
+        kind = 'tag'
+    elif token.startswith('{'):
+        kind = 'comment'
+    elif punctuation.issuperset(token):
+        kind = 'punctuation'
+    else:
+        kind = 'other'
+    return Surface(normalized, kind, mystem, lemmas_colloquial2standard.get(normalized, token),
+                   direct_answer(normalized) if mystem else None)
+
+
+def cache_stats():
+    """ -> dict {cache: functools CacheInfo (hits, misses, maxsize, currsize)} of the tokenization caches """
+    return {'chunks': get_chunk_tokens.cache_info(), 'surfaces': surface.cache_info()}
+
+
+def report_cache_stats():
+    """ -> lines with the hit rate and size of each cache """
+    lines = []
+    for name, info in cache_stats().items():
+        calls = info.hits + info.misses
+        lines.append('{}: {} calls, {:.1%} hits, {} of {} entries'.format(
+            name, calls, info.hits / calls if calls else 0, info.currsize, info.maxsize))
+    return lines
+
+def benchmark(n_tokens=10**6, seed=0):
+    """
+    -> (tokens, seconds of get_tokens(), seconds of is_token_mystem()) on a synthetic stream of
+       about n_tokens tokens: utterances of 1 to 12 words drawn from a Zipf-distributed
+       vocabulary of frequent words, split forms, tags, punctuation and rare made-up words
+    """
+    import random
+    import time
+    from itertools import accumulate
+
+    rnd = random.Random(seed)
+    letters = 'абвгдеёжзийклмнопрстуфхцчшщъыьэюя'
+    vocabulary = ['мама', 'да', 'это', 'не', 'а', 'вот', 'и', 'что', 'ты', 'я', 'смотри', 'нет', 'мы',
+                  'какой', 'Ну', 'тут', 'машинка', 'Давай', 'ещё', 'там', 'он', 'будем', 'собачка',
+                  'кто-то', 'что-нибудь', 'кое-где', 'кой-как', 'Давай-ка', 'никто', 'Нигде', 'некого',
+                  '<REP>', '<$$REP>', '<BREAK>', '{laughs}', '{C папа пришел}', '<$PR', 'A>', 'xxx',
+                  '.', ',', '?', '!', ':', '+', '–']
+    vocabulary += [''.join(rnd.choice(letters) for _ in range(rnd.randint(2, 12))) for _ in range(20000)]
+    rnd.shuffle(vocabulary)
+    cum_weights = list(accumulate(1 / (r + 1) for r in range(len(vocabulary))))
+    texts = []
+    n = 0
+    while n < n_tokens:
+        words = rnd.choices(vocabulary, cum_weights=cum_weights, k=rnd.randint(1, 12))
+        texts.append(' '.join(words))
+        n += len(words)
+
+    get_chunk_tokens.cache_clear()
+    surface.cache_clear()
+    start = time.perf_counter()
+    tokens = [get_tokens(t) for t in texts]
+    seconds_tokens = time.perf_counter() - start
+    start = time.perf_counter()
+    for ts in tokens:
+        for t in ts:
+            is_token_mystem(t)
+    seconds_classes = time.perf_counter() - start
+    return sum(len(ts) for ts in tokens), seconds_tokens, seconds_classes
+
+
+if __name__ == "__main__":
+    n, seconds_tokens, seconds_classes = benchmark()
+    print('{} tokens: get_tokens() {:.2f} s ({:.2f} us/token), is_token_mystem() {:.2f} s ({:.2f} us/token)'.format(
+        n, seconds_tokens, seconds_tokens * 1e6 / n, seconds_classes, seconds_classes * 1e6 / n))
+    print('\n'.join(report_cache_stats()))